@@ -0,0 +1 @@
+from . import timings  # noqa: F401  Imported first, to time Python's startup
@@ -0,0 +1,105 @@
+"""
+Adaptive concurrency: the number of requests in flight is raised while requests succeed at a steady latency, and
+cut when the API rate limits a request or the latency spikes (additive increase, multiplicative decrease, like
+TCP's congestion control). This finds the API's capacity without setting the concurrency by hand.
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+from .constants import AIMD_DECREASE, AIMD_LATENCY_FACTOR, AIMD_LATENCY_SAMPLES, AIMD_MIN_LATENCY_SAMPLES, \
+    AIMD_HISTORY_SIZE, AIMD_SMOOTHING
+
+
+class AIMDController:
+    """
+    The window starts at `initial` and doubles with every window of successful requests (slow start), until
+    the first decrease. After that, it grows by one per window of successful requests. A rate limited request,
+    or a smoothed latency above `latency_factor` times the lowest recent latency, multiplies the window by
+    `decrease`. Decreases are at most once per smoothed latency, since the requests in flight at that moment
+    were sent with the old window and say nothing about the new one.
+
+    Thread-safe, since requests finish on the threads that made them. Every change of the window is kept in
+    `history`.
+    """
+
+    def __init__(self,
+                 maximum: int,
+                 initial: int = 1,
+                 minimum: int = 1,
+                 decrease: float = AIMD_DECREASE,
+                 latency_factor: float = AIMD_LATENCY_FACTOR,
+                 clock: Callable[[], float] = time.monotonic):
+        self._maximum = maximum
+        self._minimum = min(minimum, maximum)
+        self._decrease = decrease
+        self._latency_factor = latency_factor
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._window = float(max(min(initial, maximum), self._minimum))
+        self._slow_start = True
+        self._latencies: Deque[float] = deque(maxlen=AIMD_LATENCY_SAMPLES)
+        self._smoothed: Optional[float] = None
+        self._started = clock()
+        self._last_decrease: Optional[float] = None
+        self._counts = {"requests": 0, "rate_limited": 0, "latency_spikes": 0, "decreases": 0}
+        self.history: Deque[Dict[str, object]] = deque(maxlen=AIMD_HISTORY_SIZE)
+
+    @property
+    def window(self) -> int:
+        """The number of requests that may be in flight now"""
+        return int(self._window)
+
+    def record(self, latency: Optional[float] = None, rate_limited: bool = False) -> None:
+        """Record a finished request: its latency if it succeeded, or whether it was rate limited"""
+        with self._lock:
+            self._counts["requests"] += 1
+            if rate_limited:
+                self._counts["rate_limited"] += 1
+                self._cut(reason="rate limited")
+                return
+            if latency is None:
+                return  # Failed for another reason, which says nothing about the load
+
+            self._smoothed = latency if self._smoothed is None else \
+                self._smoothed + AIMD_SMOOTHING * (latency - self._smoothed)
+            self._latencies.append(latency)
+            if len(self._latencies) >= AIMD_MIN_LATENCY_SAMPLES and \
+                    self._smoothed > self._latency_factor * min(self._latencies):
+                if self._cut(reason="latency"):
+                    self._counts["latency_spikes"] += 1
+                return
+
+            # One more request per request in slow start, and per window of requests after it
+            self._change(window=self._window + (1 if self._slow_start else 1 / self._window), reason="increase")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "window": self.window,
+                "minimum": self._minimum,
+                "maximum": self._maximum,
+                **self._counts,
+                "history": list(self.history)
+            }
+
+    def _cut(self, reason: str) -> bool:
+        """Multiply the window by `decrease`, unless it was just cut. Returns whether it was cut"""
+        now = self._clock()
+        if self._last_decrease is not None and self._smoothed is not None and now - self._last_decrease < self._smoothed:
+            return False
+        self._last_decrease = now
+        self._slow_start = False
+        self._counts["decreases"] += 1
+        self._change(window=self._window * self._decrease, reason=reason)
+        return True
+
+    def _change(self, window: float, reason: str) -> None:
+        before = self.window
+        self._window = max(min(window, self._maximum), self._minimum)
+        if self.window != before:
+            self.history.append({"seconds": round(self._clock() - self._started, 3), "window": self.window,
+                                 "reason": reason})
+
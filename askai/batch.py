@@ -0,0 +1,224 @@
+import json
+import time
+from dataclasses import dataclass, fields, replace
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .aimd import AIMDController
+from .client import Client
+from .constants import AUTO_MODEL
+from .journal import Journal
+from .keypool import KeyPool
+from .ratelimit import RateLimiter
+from .retry import CircuitBreaker, CircuitOpenError
+from .routing import Choice, RoutingHistory, is_good, route
+from .utils import ConfigHelper
+
+CONFIG_FIELDS = {field.name for field in fields(ConfigHelper)}
+
+
+@dataclass
+class BatchPrompt:
+    index: int
+    prompt: str
+    config: ConfigHelper
+    choice: Optional[Choice] = None  # How the model was chosen, with `--model auto`
+
+
+def number_lines(lines: Iterable[str]) -> Iterator[Tuple[int, int, str]]:
+    """The index and line number of every line that isn't empty, and the line without its newline"""
+    index = 0
+    for line_number, line in enumerate(lines, start=1):
+        line = line.rstrip("\n")
+        if not line.strip():
+            continue
+        yield index, line_number, line
+        index += 1
+
+
+def parse_record(line: str, line_number: int, jsonl: bool = False) -> Tuple[str, dict]:
+    """
+    The prompt of a line, and its config overrides.
+
+    In JSONL mode, every line is an object with a `prompt` and optionally any of the config fields,
+    e.g. {"prompt": "Is this spam? ...", "max_tokens": 1}.
+    """
+    if not jsonl:
+        return line, {}
+
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Line {line_number} is not valid JSON: {e}")
+    if not isinstance(record, dict) or not isinstance(record.get("prompt"), str):
+        raise ValueError(f"Line {line_number} has no 'prompt'")
+    unknown_fields = set(record) - CONFIG_FIELDS - {"prompt"}
+    if unknown_fields:
+        raise ValueError(f"Line {line_number} has unknown fields: {', '.join(sorted(unknown_fields))}")
+
+    prompt = record.pop("prompt")
+    return prompt, record
+
+
+def read_records(lines: Iterable[str], jsonl: bool = False) -> Iterator[Tuple[str, dict]]:
+    """Read one prompt per line, with its config overrides, see `parse_record`. Empty lines are skipped"""
+    for _, line_number, line in number_lines(lines):
+        yield parse_record(line=line, line_number=line_number, jsonl=jsonl)
+
+
+def read_prompts(lines: Iterable[str],
+                 config: ConfigHelper,
+                 jsonl: bool = False,
+                 journal: Optional[Journal] = None) -> Iterator[BatchPrompt]:
+    """
+    Read one prompt per line, see `parse_record`. Empty lines are skipped and the prompts are numbered from 0 in
+    the order read. With a `journal`, the lines it has as answered are left out, but keep their number.
+    """
+    numbered = journal.unanswered(lines) if journal is not None else number_lines(lines)
+    for index, line_number, line in numbered:
+        prompt, overrides = parse_record(line=line, line_number=line_number, jsonl=jsonl)
+        yield BatchPrompt(index=index, prompt=prompt, config=config.with_overrides(**overrides) if overrides else config)
+
+
+def route_prompts(prompts: Iterable[BatchPrompt], history: RoutingHistory) -> Iterator[BatchPrompt]:
+    """Choose the model of every prompt whose model is `auto`"""
+    for prompt in prompts:
+        if prompt.config.model == AUTO_MODEL:
+            config, choice = route(config=prompt.config, prompt=prompt.prompt, history=history)
+            prompt = replace(prompt, config=config, choice=choice)
+        yield prompt
+
+
+class Packer:
+    """Collects prompts with the same config into groups that can be sent in a single request"""
+
+    def __init__(self, max_prompts: int, clock: Callable[[], float] = time.monotonic):
+        self._max_prompts = max_prompts
+        self._clock = clock
+        self._groups: Dict[tuple, List[BatchPrompt]] = {}
+        self._started: Dict[tuple, float] = {}  # Group key -> when the group's first prompt was added
+
+    def add(self, prompt: BatchPrompt) -> Optional[List[BatchPrompt]]:
+        """Add a prompt and return its group if the group is full"""
+        group_key = tuple(sorted(prompt.config.completion_kwargs().items()))
+        if group_key not in self._groups:
+            self._groups[group_key] = []
+            self._started[group_key] = self._clock()
+        group = self._groups[group_key]
+        group.append(prompt)
+        if len(group) >= self._max_prompts:
+            del self._started[group_key]
+            return self._groups.pop(group_key)
+        return None
+
+    def expired(self, max_wait: float) -> List[List[BatchPrompt]]:
+        """Return the groups that are not yet full, but whose first prompt was added at least `max_wait` seconds ago"""
+        now = self._clock()
+        expired_keys = [key for key, started in self._started.items() if now - started >= max_wait]
+        for key in expired_keys:
+            del self._started[key]
+        return [self._groups.pop(key) for key in expired_keys]
+
+    def flush(self) -> List[List[BatchPrompt]]:
+        """Return all groups that are not yet full"""
+        groups = list(self._groups.values())
+        self._groups.clear()
+        self._started.clear()
+        return groups
+
+
+def pack(prompts: Iterable[BatchPrompt], max_prompts: int) -> Iterator[List[BatchPrompt]]:
+    """
+    Group prompts with the same config into groups of at most `max_prompts`, that can be sent in a single request.
+    A group is yielded as soon as it is full, and the remaining groups when all prompts have been read.
+    """
+    packer = Packer(max_prompts=max_prompts)
+    for prompt in prompts:
+        group = packer.add(prompt)
+        if group is not None:
+            yield group
+    yield from packer.flush()
+
+
+def complete(group: List[BatchPrompt],
+             circuit_breaker: Optional[CircuitBreaker] = None,
+             rate_limiter: Optional[RateLimiter] = None,
+             key_pool: Optional[KeyPool] = None,
+             controller: Optional[AIMDController] = None,
+             routing_history: Optional[RoutingHistory] = None) -> List[dict]:
+    """
+    Answer all prompts in the group with a single request and split the answers back to their prompt.
+    If the request fails after all retries, every prompt in the group gets an `error` instead of answers.
+    With a `routing_history`, the time and quality of the answers to prompts whose model was chosen by
+    `route_prompts` are recorded, as `ask` does.
+
+    A prompt that is too long for the model fails on its own. A prompt so long that `max_tokens` had to be lowered
+    for its answer to fit is sent in a separate request, with the prompts that need the same limit, so it doesn't
+    cut short the answers to the other prompts.
+    """
+    from openai.error import OpenAIError
+    from .tokenizer import PromptTooLongError, fit
+
+    config = group[0].config
+    results = []
+    by_max_tokens: Dict[int, List[BatchPrompt]] = {}
+    for p in group:
+        try:
+            _, max_tokens = fit(prompt=p.prompt, model=config.model, max_tokens=config.max_tokens)
+        except PromptTooLongError as e:
+            results.append({"index": p.index, "prompt": p.prompt, "error": str(e)})
+            continue
+        by_max_tokens.setdefault(max_tokens, []).append(p)
+
+    for max_tokens, fitted in by_max_tokens.items():
+        client = Client(config=replace(config, max_tokens=max_tokens), circuit_breaker=circuit_breaker,
+                        rate_limiter=rate_limiter, key_pool=key_pool, controller=controller)
+        started = time.perf_counter()
+        try:
+            response = client.create(prompt=[p.prompt for p in fitted])
+        except (OpenAIError, CircuitOpenError) as e:
+            if routing_history is not None and isinstance(e, OpenAIError):
+                routing_history.record_all(answers=[(p.choice, None, False) for p in fitted if p.choice is not None])
+            results += [{"index": p.index, "prompt": p.prompt, "error": str(e)} for p in fitted]
+            continue
+        answered = split_choices(group=fitted, response=response)
+        if routing_history is not None:
+            seconds = time.perf_counter() - started
+            routing_history.record_all(answers=[
+                (p.choice, seconds, is_good(result["answers"])) for p, result in zip(fitted, answered) if p.choice is not None
+            ])
+        results += answered
+    return results
+
+
+def split_choices(group: List[BatchPrompt], response: dict) -> List[dict]:
+    # With n answers per prompt, the answers to prompt i have choice index i*n, ..., i*n + n - 1
+    num_answers = group[0].config.num_answers
+    answers: List[List[str]] = [["" for _ in range(num_answers)] for _ in group]
+    for choice in response["choices"]:
+        prompt_idx, answer_idx = divmod(choice["index"], num_answers)
+        answers[prompt_idx][answer_idx] = choice["text"].lstrip("\n")
+
+    return [
+        {"index": prompt.index, "prompt": prompt.prompt, "answers": prompt_answers}
+        for prompt, prompt_answers in zip(group, answers)
+    ]
+
+
+class ReorderBuffer:
+    """Holds results that finished before the results of earlier prompts"""
+
+    def __init__(self):
+        self._pending: Dict[int, dict] = {}
+        self._next_index = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, result: dict) -> List[dict]:
+        """Add a result and return all results that are now in order"""
+        self._pending[result["index"]] = result
+        ready = []
+        while self._next_index in self._pending:
+            ready.append(self._pending.pop(self._next_index))
+            self._next_index += 1
+        return ready
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from . import simhash
+from .constants import CACHE_PATH, CACHE_MAX_BYTES, CACHE_TTL_SECONDS, SIMILARITY_THRESHOLD
+from .utils import ConfigHelper
+
+_BAND_COLUMNS = [f"band{idx}" for idx in range(simhash.BANDS)]
+
+
+class ResponseCache:
+    """
+    On-disk cache of completion responses.
+
+    Entries are zlib-compressed JSON rows in a SQLite database, so a lookup only touches the index and
+    the row itself. When the total size exceeds `max_bytes`, the least recently used entries are evicted.
+    Entries expire after `ttl_seconds`, except deterministic ones (temperature == 0) which never expire.
+
+    Entries stored with their prompt also get a SimHash fingerprint, so that `get_similar` can find answers
+    to prompts that are worded almost the same, using an index per band of the fingerprint.
+    """
+
+    def __init__(self,
+                 cache_path: Path = CACHE_PATH,
+                 max_bytes: int = CACHE_MAX_BYTES,
+                 ttl_seconds: float = CACHE_TTL_SECONDS):
+        self._cache_path = cache_path
+        self._max_bytes = max_bytes
+        self._ttl_seconds = ttl_seconds
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @staticmethod
+    def key(prompt: str, config: ConfigHelper, client_options: Optional[dict] = None) -> str:
+        """
+        Canonical hash of the prompt and every field that affects the answer, including `client_options` that
+        change the answer on the client side, e.g. stop conditions
+        """
+        request = {"prompt": prompt, **config.completion_kwargs()}
+        if client_options:
+            request["client"] = client_options
+        return hashlib.sha256(json.dumps(request, sort_keys=True, separators=(",", ":")).encode("utf8")).hexdigest()
+
+    @staticmethod
+    def config_key(config: ConfigHelper) -> str:
+        """Canonical hash of every field that affects the answer, except the prompt"""
+        request = config.completion_kwargs()
+        return hashlib.sha256(json.dumps(request, sort_keys=True, separators=(",", ":")).encode("utf8")).hexdigest()
+
+    @staticmethod
+    def is_deterministic(config: ConfigHelper) -> bool:
+        return config.temperature == 0
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            connection = self._connect()
+            row = connection.execute("SELECT response, expires FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            now = time.time()
+            response, expires = row
+            with connection:
+                if expires is not None and expires < now:
+                    connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    return None
+                connection.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            return json.loads(zlib.decompress(response))
+        except (sqlite3.Error, zlib.error, ValueError):
+            return None
+
+    def get_similar(self,
+                    prompt: str,
+                    config: ConfigHelper,
+                    threshold: float = SIMILARITY_THRESHOLD) -> Optional[dict]:
+        """
+        The cached response to the most similar prompt with the same config, if at least `threshold` of the
+        fingerprints' bits are equal. Every prompt above 1 - (2 * BANDS - 1) / 64 (0.92) is found, lower ones only
+        if they happen to be close in a band.
+        """
+        fingerprint = simhash.simhash(prompt)
+        max_distance = simhash.max_distance(threshold=threshold)
+        config_key = self.config_key(config=config)
+        probes = simhash.probes(fingerprint)
+        try:
+            connection = self._connect()
+            # Every band's index also holds the fingerprint, so only the index is read
+            candidates = connection.execute(
+                " UNION ALL ".join(f"SELECT rowid, simhash FROM fingerprints WHERE config = ? AND {column} IN "
+                                   f"({', '.join('?' * len(values))})"
+                                   for column, values in zip(_BAND_COLUMNS, probes)),
+                [param for values in probes for param in (config_key, *values)]
+            ).fetchall()
+            distances = {}
+            for rowid, value in candidates:
+                distance = simhash.distance(fingerprint, value)
+                if distance <= max_distance:
+                    distances[rowid] = distance
+
+            for rowid in sorted(distances, key=distances.get):
+                key, = connection.execute("SELECT key FROM fingerprints WHERE rowid = ?", (rowid,)).fetchone()
+                response = self.get(key)
+                if response is not None:
+                    return response
+        except sqlite3.Error:
+            pass
+        return None
+
+    def set(self,
+            key: str,
+            response: dict,
+            deterministic: bool = False,
+            prompt: Optional[str] = None,
+            config: Optional[ConfigHelper] = None) -> None:
+        """Store the response. With the `prompt` and `config`, it can also be found by `get_similar`"""
+        compressed = zlib.compress(json.dumps(response, separators=(",", ":")).encode("utf8"))
+        now = time.time()
+        expires = None if deterministic else now + self._ttl_seconds
+        try:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO entries (key, response, size, accessed, expires) VALUES (?, ?, ?, ?, ?)",
+                    (key, compressed, len(compressed), now, expires)
+                )
+                if prompt is not None and config is not None:
+                    fingerprint = simhash.simhash(prompt)
+                    connection.execute(
+                        f"INSERT OR REPLACE INTO fingerprints (key, config, simhash, {', '.join(_BAND_COLUMNS)}) "
+                        f"VALUES (?, ?, ?, {', '.join('?' * simhash.BANDS)})",
+                        (key, self.config_key(config=config), simhash.to_signed(fingerprint), *simhash.bands(fingerprint))
+                    )
+                self._evict(connection=connection, now=now)
+        except sqlite3.Error:
+            pass  # A broken cache should never stop an answer from being shown
+
+    def record_stream(self,
+                      key: str,
+                      response: Iterable[dict],
+                      deterministic: bool = False,
+                      prompt: Optional[str] = None,
+                      config: Optional[ConfigHelper] = None) -> Iterator[dict]:
+        """Pass a streamed response through and store it once the stream is completely consumed"""
+        choices = {}
+        for chunk in response:
+            for choice in chunk["choices"]:
+                stored = choices.setdefault(choice["index"], {"index": choice["index"], "text": "", "finish_reason": None})
+                stored["text"] += choice["text"]
+                stored["finish_reason"] = choice.get("finish_reason") or stored["finish_reason"]
+            yield chunk
+
+        self.set(
+            key=key,
+            response={"choices": [choices[idx] for idx in sorted(choices)]},
+            deterministic=deterministic,
+            prompt=prompt,
+            config=config
+        )
+
+    def _evict(self, connection: sqlite3.Connection, now: float) -> None:
+        connection.execute("DELETE FROM entries WHERE expires IS NOT NULL AND expires < ?", (now,))
+        connection.execute(
+            "DELETE FROM entries WHERE key IN ("
+            "  SELECT key FROM ("
+            "    SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS total FROM entries"
+            "  ) WHERE total > ?"
+            ")",
+            (self._max_bytes,)
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._cache_path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self._cache_path, timeout=5.0)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "  key TEXT PRIMARY KEY,"
+                "  response BLOB NOT NULL,"
+                "  size INTEGER NOT NULL,"
+                "  accessed REAL NOT NULL,"
+                "  expires REAL"
+                ")"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(fingerprints)")]
+            if columns and columns[3:] != _BAND_COLUMNS:
+                # Fingerprints banded another way can't be looked up, so only the answers are kept
+                connection.execute("DROP TABLE fingerprints")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                "  key TEXT PRIMARY KEY,"
+                "  config TEXT NOT NULL,"
+                "  simhash INTEGER NOT NULL,"
+                f"  {', '.join(f'{column} INTEGER NOT NULL' for column in _BAND_COLUMNS)}"
+                ")"
+            )
+            for column in _BAND_COLUMNS:
+                connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS fingerprints_{column} ON fingerprints (config, {column}, simhash)"
+                )
+            # Evicted and expired entries take their fingerprints with them
+            connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_deleted AFTER DELETE ON entries BEGIN"
+                "  DELETE FROM fingerprints WHERE key = old.key;"
+                " END"
+            )
+            self._connection = connection
+        return self._connection
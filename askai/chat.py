@@ -0,0 +1,75 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque
+
+from .constants import CHAT_PREAMBLE
+from .tokenizer import context_tokens, get_tokenizer
+
+USER = "User:"
+ASSISTANT = "Assistant:"
+
+# Ends the answer before the model starts writing the user's next question itself
+STOP = ["\n" + USER]
+
+
+def count_tokens(text: str) -> int:
+    return get_tokenizer().count(text)
+
+
+def prompt_budget(model: str, max_tokens: int) -> int:
+    """Tokens left for the prompt when `max_tokens` are reserved for the answer"""
+    return context_tokens(model=model) - max_tokens
+
+
+@dataclass
+class Turn:
+    text: str  # The question and answer, formatted as part of the prompt
+    tokens: int
+
+
+class Conversation:
+    """
+    The history of a chat, sent as the prompt of every request.
+
+    The prompt is kept within `budget` tokens by dropping the oldest turns. The token count is kept up to date
+    as turns are added and dropped, so building the next prompt doesn't count the whole history again.
+    """
+
+    def __init__(self, budget: int):
+        self._budget = budget
+        self._turns: Deque[Turn] = deque()
+        self._tokens = count_tokens(CHAT_PREAMBLE)  # Of the preamble and all turns
+        self.prompt_tokens = 0  # Of the last prompt
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def prompt(self, question: str) -> str:
+        """
+        The prompt for the next question, with as much history as fits the budget. Raises ValueError if
+        the question alone doesn't fit.
+        """
+        question_turn = self._format_question(question=question)
+        question_tokens = count_tokens(question_turn)
+        if count_tokens(CHAT_PREAMBLE) + question_tokens > self._budget:
+            raise ValueError("The question is too long")
+
+        while self._tokens + question_tokens > self._budget:
+            self._tokens -= self._turns.popleft().tokens
+        self.prompt_tokens = self._tokens + question_tokens
+        return CHAT_PREAMBLE + "".join(turn.text for turn in self._turns) + question_turn
+
+    def add(self, question: str, answer: str) -> None:
+        text = f"{self._format_question(question=question)} {answer.strip()}\n"
+        turn = Turn(text=text, tokens=count_tokens(text))
+        self._turns.append(turn)
+        self._tokens += turn.tokens
+
+    def clear(self) -> None:
+        self._tokens -= sum(turn.tokens for turn in self._turns)
+        self._turns.clear()
+
+    @staticmethod
+    def _format_question(question: str) -> str:
+        return f"\n{USER} {question.strip()}\n{ASSISTANT}"
+
@@ -0,0 +1,88 @@
+import time
+from functools import partial
+from typing import List, Optional, Union
+
+from .aimd import AIMDController
+from .hedge import Hedger
+from .keypool import KeyPool
+from .ratelimit import RateLimiter, estimate_tokens
+from .retry import CircuitBreaker, Retrier
+from .utils import ConfigHelper
+
+
+class Client:
+    """
+    Makes completion requests with a config, waiting for the client-side rate limits and retrying failures.
+    With a `hedger`, slow requests are sent again, each with its own retries. With a `key_pool`, every request
+    is sent with a key from the pool, and a request that was rejected or rate limited because of its key is
+    sent again right away with another key. Every attempt's latency, or whether it was rate limited, is
+    reported to the `controller` of an adaptive concurrency.
+    """
+
+    def __init__(self,
+                 config: ConfigHelper,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 hedger: Optional[Hedger] = None,
+                 key_pool: Optional[KeyPool] = None,
+                 controller: Optional[AIMDController] = None):
+        self._config = config
+        self._controller = controller
+        self._hedger = hedger
+        self._key_pool = key_pool
+        self._retrier = Retrier(
+            max_retries=config.max_retries,
+            timeout=config.retry_timeout,
+            circuit_breaker=circuit_breaker
+        )
+        self._rate_limiter = rate_limiter if rate_limiter else RateLimiter(
+            requests_per_minute=config.requests_per_minute,
+            tokens_per_minute=config.tokens_per_minute
+        )
+
+    def create(self, prompt: Union[str, List[str]], stream: bool = False, stop: Optional[List[str]] = None):
+        call = partial(self._retrier.call, self._create, prompt=prompt, stream=stream, stop=stop)
+        if self._hedger is not None:
+            return self._hedger.call(call)
+        return call()
+
+    def _create(self, prompt: Union[str, List[str]], stream: bool, stop: Optional[List[str]]):
+        tokens = estimate_tokens(prompt=prompt, max_tokens=self._config.max_tokens, num_answers=self._config.num_answers)
+        self._rate_limiter.acquire(tokens=tokens)
+        kwargs = self._config.completion_kwargs()
+        if stop:
+            kwargs["stop"] = stop
+        if self._key_pool is None:
+            return self._send(prompt=prompt, stream=stream, **kwargs)
+
+        from openai.error import OpenAIError
+
+        for attempt in range(len(self._key_pool)):
+            key = self._key_pool.acquire(tokens=tokens)
+            try:
+                return self._send(prompt=prompt, stream=stream, api_key=key.key, organization=key.organization, **kwargs)
+            except OpenAIError as e:
+                switch = self._key_pool.report(key=key, error=e)
+                if not switch or attempt == len(self._key_pool) - 1 or not self._key_pool.available():
+                    raise
+
+    def _send(self, **kwargs):
+        """Make a single request, and report how it went to the controller"""
+        import openai
+
+        if self._controller is None:
+            return openai.Completion.create(**kwargs)
+
+        from openai.error import RateLimitError
+
+        started = time.monotonic()
+        try:
+            response = openai.Completion.create(**kwargs)
+        except RateLimitError:
+            self._controller.record(rate_limited=True)
+            raise
+        except Exception:
+            self._controller.record()
+            raise
+        self._controller.record(latency=time.monotonic() - started)
+        return response
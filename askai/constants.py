@@ -3,7 +3,16 @@ from pathlib import Path
 
 ASKAI_PATH = Path.home() / ".askai"
 API_KEY_PATH = ASKAI_PATH / "key"
+KEYS_PATH = ASKAI_PATH / "keys.json"
+KEY_HEALTH_PATH = ASKAI_PATH / "key_health.json"
 CONFIG_PATH = ASKAI_PATH / "config.yml"
+CACHE_PATH = ASKAI_PATH / "cache.db"
+RATE_LIMIT_PATH = ASKAI_PATH / "rate_limit"
+SOCKET_PATH = ASKAI_PATH / "askai.sock"
+INFLIGHT_PATH = ASKAI_PATH / "inflight"
+LATENCY_PATH = ASKAI_PATH / "latency.json"
+ROUTING_PATH = ASKAI_PATH / "routing.json"
+JOBS_PATH = ASKAI_PATH / "jobs.db"
 
 DEFAULT_MODEL = "text-davinci-003"
 DEFAULT_NUM_ANSWERS = 1
@@ -12,6 +21,10 @@ DEFAULT_TEMPERATURE = 0.4
 DEFAULT_TOP_P = 1.0
 DEFAULT_FREQUENCY_PENALTY = 0.0
 DEFAULT_PRESENCE_PENALTY = 0.0
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_RETRY_TIMEOUT = 60.0
+DEFAULT_REQUESTS_PER_MINUTE = 0  # No limit
+DEFAULT_TOKENS_PER_MINUTE = 0  # No limit
 
 OPENAI_NUM_ANSWERS_MIN = 1
 OPENAI_MAX_TOKENS_MIN = 1
@@ -24,4 +37,103 @@ OPENAI_FREQUENCY_PENALTY_MAX = 2.0
 OPENAI_PRESENCE_PENALTY_MIN = -2.0
 OPENAI_PRESENCE_PENALTY_MAX = 2.0
 
+MAX_RETRIES_MIN = 0
+RETRY_TIMEOUT_MIN = 0.0
+REQUESTS_PER_MINUTE_MIN = 0
+TOKENS_PER_MINUTE_MIN = 0
+
 MAX_INPUT_TRIES = 3
+KEY_VERIFICATION_TIMEOUT = 5.0
+DEFAULT_KEY_NAME = "default"  # The key in API_KEY_PATH, as a member of the key pool
+
+# Seconds a pooled key is left out after a rate limit (unless the server says how long), and after it was rejected
+KEY_QUARANTINE_RATE_LIMIT = 60.0
+KEY_QUARANTINE_REJECTED = 3600.0
+
+CACHE_MAX_BYTES = 50 * 1024 * 1024
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+BATCH_MAX_PROMPTS = 20
+ORDERED_WINDOW_FACTOR = 4
+
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+CIRCUIT_BREAKER_THRESHOLD = 5
+CIRCUIT_BREAKER_COOLDOWN = 30.0
+
+CHARACTERS_PER_TOKEN = 4
+
+DAEMON_WORKERS = 4
+
+# Max tokens of the question plus the answer, per model
+MODEL_CONTEXT_TOKENS = {
+    "text-ada-001": 2048,
+    "text-babbage-001": 2048,
+    "text-curie-001": 2048,
+    "text-davinci-003": 4000,
+}
+DEFAULT_CONTEXT_TOKENS = 2048
+CHAT_PREAMBLE = "The following is a conversation between a user and a helpful AI assistant.\n"
+
+MAP_REDUCE_READ_SIZE = 64 * 1024  # Characters read from the file at a time
+MAP_REDUCE_OVERLAP = 100  # Tokens shared by consecutive chunks
+MAP_REDUCE_CONCURRENCY = 4
+MAP_REDUCE_MARGIN = 16  # Tokens kept free in every prompt, since text may encode to a few more tokens within a prompt
+
+# Share of equal SimHash bits for `ask --similar` to reuse the answer to a differently worded prompt
+SIMILARITY_THRESHOLD = 0.92
+
+# How long to wait for an identical request in another process before asking anyway, and how often to check
+SINGLE_FLIGHT_TIMEOUT = 120.0
+SINGLE_FLIGHT_POLL_INTERVAL = 0.02
+
+# Hedged requests: a duplicate is sent after this percentile of the recent latencies, for at most this share
+# of the requests. Latencies of the last HEDGE_HISTORY_SIZE requests are kept, and at least
+# HEDGE_MIN_SAMPLES are needed before hedging
+HEDGE_PERCENTILE = 95.0
+HEDGE_BUDGET = 0.05
+HEDGE_HISTORY_SIZE = 100
+HEDGE_MIN_SAMPLES = 20
+
+# `--model auto`. Prompts of at most AUTO_SHORT_PROMPT_TOKENS tokens that request at most AUTO_SHORT_MAX_TOKENS
+# are short, and prompts that need at most AUTO_MEDIUM_TOKENS including the answer are medium. A model needs
+# AUTO_MIN_SAMPLES answers of a size before its history counts, and is skipped when its smoothed share of good
+# answers falls below AUTO_MIN_QUALITY
+AUTO_MODEL = "auto"
+AUTO_SHORT_PROMPT_TOKENS = 32
+AUTO_SHORT_MAX_TOKENS = 300
+AUTO_MEDIUM_TOKENS = 1024
+AUTO_MIN_SAMPLES = 5
+AUTO_MIN_QUALITY = 0.8
+AUTO_SMOOTHING = 0.2  # Weight of the newest answer in the smoothed latency and quality
+
+# Adaptive concurrency: the window is multiplied by AIMD_DECREASE when a request is rate limited, or when the
+# smoothed latency exceeds AIMD_LATENCY_FACTOR times the lowest of the last AIMD_LATENCY_SAMPLES latencies (once
+# AIMD_MIN_LATENCY_SAMPLES are known). AIMD_MAX_CONCURRENCY is the default ceiling of the window
+AIMD_DECREASE = 0.5
+AIMD_LATENCY_FACTOR = 2.0
+AIMD_LATENCY_SAMPLES = 50
+AIMD_MIN_LATENCY_SAMPLES = 10
+AIMD_SMOOTHING = 0.2
+AIMD_HISTORY_SIZE = 100
+AIMD_MAX_CONCURRENCY = 32
+
+# Job queue. A leased job goes back to the queue when its worker hasn't finished it within JOB_VISIBILITY_TIMEOUT
+# seconds. A failed job is retried after JOB_RETRY_DELAY seconds, doubling with every attempt, until it failed
+# JOB_MAX_ATTEMPTS times. Idle workers look for jobs every JOB_POLL_INTERVAL seconds. A worker sends a request that
+# is not full after JOB_MAX_PACK_WAIT seconds, or half the visibility timeout if that is shorter, so jobs with rare
+# configs don't wait for the queue to empty. The throughput and ETA of `askai jobs status` are over the jobs finished
+# in the last JOB_THROUGHPUT_WINDOW seconds
+JOB_VISIBILITY_TIMEOUT = 600.0
+JOB_RETRY_DELAY = 30.0
+JOB_MAX_ATTEMPTS = 3
+JOB_POLL_INTERVAL = 1.0
+JOB_MAX_PACK_WAIT = 5.0
+JOB_THROUGHPUT_WINDOW = 300.0
+
+# Progress journal of `askai batch`: the keys of answered input lines are synced to disk every JOURNAL_SYNC_ENTRIES
+# answers or JOURNAL_SYNC_INTERVAL seconds. On close, the journal is rewritten by chunks of JOURNAL_CHUNK_LINES
+# input lines
+JOURNAL_SYNC_ENTRIES = 1000
+JOURNAL_SYNC_INTERVAL = 1.0
+JOURNAL_CHUNK_LINES = 10_000
@@ -0,0 +1,126 @@
+"""
+Continues answers that were cut off by `max_tokens` (`finish_reason == "length"`): the prompt and the answer so
+far are sent again, and the model picks up where it stopped. This repeats until the answer is done, its tokens
+reach the total budget or the model's context is full. Nothing that was already generated is paid for again,
+except as part of the prompt.
+"""
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from .retry import CircuitOpenError
+from .tokenizer import PromptTooLongError, fit
+
+# Makes a request for a single answer: (prompt, max_tokens, stream) -> response
+Create = Callable[[str, int, bool], Any]
+
+
+class Continuation:
+    """The continuation requests for one answer"""
+
+    def __init__(self, prompt: str, model: str, max_tokens: int, budget: int, create: Create):
+        self._prompt = prompt
+        self._model = model
+        self._max_tokens = max_tokens
+        self._budget = budget
+        self._create = create
+        self._used = max_tokens  # A cut off answer has all the tokens it was allowed to have
+
+    def next_max_tokens(self, text: str) -> Optional[int]:
+        """`max_tokens` for continuing the answer so far, or None if it can't be continued"""
+        left = self._budget - self._used
+        if left < 1:
+            return None
+        try:
+            _, max_tokens = fit(prompt=self._prompt + text, model=self._model, max_tokens=min(self._max_tokens, left))
+        except PromptTooLongError:
+            return None
+        return max_tokens
+
+    def create(self, text: str, max_tokens: int, stream: bool) -> Optional[Any]:
+        """The response continuing the answer so far, or None if the request failed"""
+        from openai.error import OpenAIError
+
+        self._used += max_tokens
+        try:
+            return self._create(self._prompt + text, max_tokens, stream)
+        except (OpenAIError, CircuitOpenError):
+            return None  # The answer that was cut off is still better than none
+
+
+def continue_response(response: dict, prompt: str, model: str, max_tokens: int, budget: int, create: Create) -> dict:
+    """The response with every answer that was cut off continued, up to `budget` tokens per answer"""
+    choices = []
+    for choice in response["choices"]:
+        text, finish_reason = choice["text"], choice.get("finish_reason")
+        continuation = Continuation(prompt=prompt, model=model, max_tokens=max_tokens, budget=budget, create=create)
+        while finish_reason == "length":
+            next_max_tokens = continuation.next_max_tokens(text=text)
+            if next_max_tokens is None:
+                break
+            continued = continuation.create(text=text, max_tokens=next_max_tokens, stream=False)
+            if continued is None:
+                break
+            text += continued["choices"][0]["text"]
+            finish_reason = continued["choices"][0].get("finish_reason")
+        choices.append({**choice, "text": text, "finish_reason": finish_reason})
+    return {**response, "choices": choices}
+
+
+def continue_stream(response: Iterable[dict],
+                    prompt: str,
+                    model: str,
+                    max_tokens: int,
+                    budget: int,
+                    create: Create) -> Iterator[dict]:
+    """
+    Pass a streamed response through, and then stream the continuations of the answers that were cut off, as
+    part of the same answers. An answer's "length" finish is held back while it will be continued, so that it
+    reads as one answer.
+    """
+    texts: Dict[int, str] = {}
+    continuations: Dict[int, Continuation] = {}
+    next_max_tokens: Dict[int, Optional[int]] = {}
+    current = response
+    try:
+        for chunk in response:
+            hold_back = False
+            for choice in chunk["choices"]:
+                idx = choice["index"]
+                texts[idx] = texts.get(idx, "") + choice["text"]
+                if choice.get("finish_reason") == "length":
+                    continuations[idx] = Continuation(prompt=prompt, model=model, max_tokens=max_tokens,
+                                                      budget=budget, create=create)
+                    next_max_tokens[idx] = continuations[idx].next_max_tokens(text=texts[idx])
+                    hold_back = hold_back or next_max_tokens[idx] is not None
+            if hold_back:
+                chunk = {**chunk, "choices": [
+                    {**choice, "finish_reason": None} if choice.get("finish_reason") == "length" and
+                    next_max_tokens[choice["index"]] is not None else choice
+                    for choice in chunk["choices"]
+                ]}
+            yield chunk
+
+        for idx in sorted(continuations):
+            continuation = continuations[idx]
+            finished = next_max_tokens[idx] is None  # Already sent
+            while next_max_tokens[idx] is not None:
+                current = continuation.create(text=texts[idx], max_tokens=next_max_tokens[idx], stream=True)
+                next_max_tokens[idx] = None
+                if current is None:
+                    break
+                for chunk in current:
+                    for choice in chunk["choices"]:
+                        texts[idx] += choice["text"]
+                        if choice.get("finish_reason") == "length":
+                            next_max_tokens[idx] = continuation.next_max_tokens(text=texts[idx])
+                            if next_max_tokens[idx] is not None:
+                                choice = {**choice, "finish_reason": None}
+                        finished = finished or choice.get("finish_reason") is not None
+                        yield {**chunk, "choices": [{**choice, "index": idx}]}
+            if not finished:
+                # A continuation failed, so the held back finish is sent now
+                yield {"choices": [{"index": idx, "text": "", "finish_reason": "length"}]}
+    finally:
+        for opened in (current, response):
+            close = getattr(opened, "close", None)
+            if callable(close):
+                close()
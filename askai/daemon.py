@@ -0,0 +1,153 @@
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, List, TextIO
+
+from .constants import DAEMON_WORKERS
+from .daemon_client import LOCAL_COMMANDS
+
+
+class _ThreadOutput(io.TextIOBase):
+    """
+    Stand-in for `sys.stdout` or `sys.stderr` that sends every worker thread's output to the client it is
+    answering. Output from other threads goes to the original stream.
+    """
+
+    encoding = "utf-8"
+    errors = "strict"
+
+    def __init__(self, fallback: TextIO):
+        self._fallback = fallback
+        self._local = threading.local()
+
+    @contextmanager
+    def redirect(self, write: Callable[[str], None], isatty: bool) -> Iterator[None]:
+        self._local.write = write
+        self._local.isatty = isatty
+        try:
+            yield
+        finally:
+            del self._local.write, self._local.isatty
+
+    def write(self, text: str) -> int:
+        write = getattr(self._local, "write", None)
+        if write is None:
+            return self._fallback.write(text)
+        write(text)
+        return len(text)
+
+    def writable(self) -> bool:
+        return True
+
+    def isatty(self) -> bool:
+        if hasattr(self._local, "isatty"):
+            return self._local.isatty
+        return self._fallback.isatty()
+
+    def flush(self) -> None:
+        if not hasattr(self._local, "write"):
+            self._fallback.flush()
+
+
+def run_askai(args: List[str]) -> int:
+    """Run the `askai` command line in this process and return its exit code"""
+    from .entrypoint_askai import askai
+
+    try:
+        askai.main(args=args, prog_name="askai")
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else int(e.code is not None)
+    return 0
+
+
+class Daemon(socketserver.UnixStreamServer):
+    """
+    Answers questions sent by `askai` over a Unix socket, in the same process each time.
+
+    The questions are answered by `workers` long-lived threads. The config and the key are only read again
+    when their files change, and every thread keeps its keep-alive HTTPS connection to the API open between
+    questions.
+
+    Protocol: the client sends one JSON line, {"args": [...], "isatty": {"stdout": bool, "stderr": bool}}.
+    The daemon answers with JSON lines, {"stdout": text} or {"stderr": text} as the output is written, and
+    finally {"exit": code}.
+    """
+
+    def __init__(self,
+                 socket_path: Path,
+                 workers: int = DAEMON_WORKERS,
+                 run: Callable[[List[str]], int] = run_askai):
+        self._run = run
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="askai-worker")
+        self._stdout = _ThreadOutput(fallback=sys.stdout)
+        self._stderr = _ThreadOutput(fallback=sys.stderr)
+        super().__init__(str(socket_path), _Handler)
+        os.chmod(socket_path, 0o600)  # Anyone who can connect can use the API key
+
+    @contextmanager
+    def redirected_output(self) -> Iterator[None]:
+        """Replace `sys.stdout` and `sys.stderr`, so every question's output goes to its own client"""
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = self._stdout, self._stderr
+        try:
+            yield
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+    def process_request(self, request, client_address) -> None:
+        self._executor.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def answer(self, args: List[str], isatty: dict, send: Callable[[dict], None]) -> None:
+        if not args or args[0] in LOCAL_COMMANDS:
+            send({"stderr": "The daemon only answers questions.\n"})
+            send({"exit": 2})
+            return
+
+        with self._stdout.redirect(write=lambda text: send({"stdout": text}), isatty=isatty.get("stdout", False)), \
+                self._stderr.redirect(write=lambda text: send({"stderr": text}), isatty=isatty.get("stderr", False)):
+            try:
+                exit_code = self._run(args)
+            except (BrokenPipeError, ConnectionResetError):
+                return  # The client is gone
+            except Exception:
+                traceback.print_exc()
+                exit_code = 1
+        send({"exit": exit_code})
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: Daemon
+
+    def handle(self) -> None:
+        try:
+            request = json.loads(self.rfile.readline())
+            args, isatty = list(request["args"]), dict(request.get("isatty", {}))
+        except (ValueError, KeyError, TypeError):
+            return
+
+        def send(message: dict) -> None:
+            self.wfile.write(json.dumps(message).encode() + b"\n")
+
+        try:
+            self.server.answer(args=args, isatty=isatty, send=send)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
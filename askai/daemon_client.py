@@ -0,0 +1,107 @@
+"""
+The `askai` command. Questions are forwarded to a running `askai serve` daemon if there is one, everything
+else runs in this process.
+
+Only the standard library is imported before forwarding, so a forwarded question doesn't pay for importing
+click, openai or the config and key handling.
+"""
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from .constants import SOCKET_PATH
+
+# Commands that are interactive or long-running, and always run in this process
+LOCAL_COMMANDS = {"batch", "chat", "config", "init", "jobs", "key", "serve", "submit", "tokens", "worker"}
+
+# Options of `ask` whose value is a file path, relative to the directory askai runs in
+PATH_OPTIONS = {"-f", "--file", "--timings-json"}
+
+# Set to any value to never forward questions to the daemon
+NO_DAEMON_ENV = "ASKAI_NO_DAEMON"
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    if is_forwardable(args=args) and not os.environ.get(NO_DAEMON_ENV):
+        exit_code = forward(args=args)
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    from .entrypoint_askai import askai
+    askai()
+
+
+def is_forwardable(args: List[str]) -> bool:
+    """
+    Whether the arguments are a question (`askai "<QUESTION>" ...`) that the daemon can answer. A question about
+    stdin (`-f -`) is not, since the daemon can't read this process's stdin.
+    """
+    return bool(args) and not args[0].startswith("-") and args[0] not in LOCAL_COMMANDS and "--help" not in args \
+        and all(value != "-" for _, _, value in _path_options(args=args))
+
+
+def forward(args: List[str], socket_path: Path = SOCKET_PATH) -> Optional[int]:
+    """
+    Let the daemon answer, writing its output as it arrives. Returns the exit code, or None if no daemon is
+    listening on `socket_path`.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(socket_path))
+    except OSError:
+        sock.close()
+        return None  # No daemon, or a stale socket
+
+    with sock, sock.makefile("rb") as messages:
+        request = {
+            "args": _absolute_paths(args=args),
+            "isatty": {"stdout": sys.stdout.isatty(), "stderr": sys.stderr.isatty()},
+        }
+        sock.sendall(json.dumps(request).encode() + b"\n")
+
+        for line in messages:
+            message = json.loads(line)
+            if "exit" in message:
+                return message["exit"]
+            stream = sys.stdout if "stdout" in message else sys.stderr
+            stream.write(message.get("stdout", message.get("stderr", "")))
+            stream.flush()
+
+    sys.stderr.write("The askai daemon stopped before answering.\n")
+    return 1
+
+
+def _absolute_paths(args: List[str]) -> List[str]:
+    """The daemon runs in another directory, so make file paths in the options absolute"""
+    absolute = list(args)
+    for idx, option, value in _path_options(args=args):
+        path = os.path.abspath(value)
+        absolute[idx] = path if option is None else f"{option}={path}"
+    return absolute
+
+
+def _path_options(args: List[str]) -> Iterator[Tuple[int, Optional[str], str]]:
+    """
+    The position and value of every file path option. The option is None if the value is a separate argument,
+    or the option's long name if the value is part of the same argument (`--file=notes.txt`, `-fnotes.txt`).
+    """
+    idx = 0
+    while idx < len(args):
+        arg = args[idx]
+        if arg in PATH_OPTIONS:
+            if idx + 1 < len(args):
+                yield idx + 1, None, args[idx + 1]
+            idx += 2
+            continue
+        name, equals, value = arg.partition("=")
+        if equals and name in PATH_OPTIONS and name.startswith("--"):
+            yield idx, name, value
+        elif arg.startswith("-f") and not arg.startswith("--"):
+            yield idx, "--file", arg[2:]
+        idx += 1
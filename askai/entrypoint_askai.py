@@ -1,13 +1,25 @@
+import re
+import sys
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from typing import IO, Optional
+
 import click
-import openai
 
-from .constants import OPENAI_NUM_ANSWERS_MIN, OPENAI_TEMPERATURE_MIN, OPENAI_TEMPERATURE_MAX, OPENAI_MAX_TOKENS_MIN, \
+from .constants import API_KEY_PATH, CONFIG_PATH, CACHE_PATH, INFLIGHT_PATH, LATENCY_PATH, ROUTING_PATH, AUTO_MODEL, AIMD_MAX_CONCURRENCY, HEDGE_PERCENTILE, HEDGE_BUDGET, SIMILARITY_THRESHOLD, MAP_REDUCE_OVERLAP, MAP_REDUCE_CONCURRENCY, MAX_RETRIES_MIN, RETRY_TIMEOUT_MIN, OPENAI_NUM_ANSWERS_MIN, OPENAI_TEMPERATURE_MIN, OPENAI_TEMPERATURE_MAX, OPENAI_MAX_TOKENS_MIN, \
     OPENAI_TOP_P_MIN, OPENAI_TOP_P_MAX, OPENAI_FREQUENCY_PENALTY_MIN, OPENAI_FREQUENCY_PENALTY_MAX, \
     OPENAI_PRESENCE_PENALTY_MIN, OPENAI_PRESENCE_PENALTY_MAX
+from .timings import Timings
 from .utils import KeyHelper, ConfigHelper, PrintHelper, AvailableModels
+from .entrypoint_batch import batch
+from .entrypoint_chat import chat
 from .entrypoint_config import config
 from .entrypoint_init import init
+from .entrypoint_jobs import submit, worker, jobs
 from .entrypoint_key import key
+from .entrypoint_serve import serve
+from .entrypoint_tokens import tokens
 
 
 class DefaultCommandGroup(click.Group):
@@ -63,15 +75,46 @@ def askai() -> None:
     pass
 
 
+def _validate_regex(ctx: click.Context, param: click.Parameter, value: Optional[str]) -> Optional[str]:
+    if value is not None:
+        try:
+            re.compile(value)
+        except re.error as e:
+            raise click.BadParameter(f"not a valid regular expression: {e}")
+    return value
+
+
 @askai.command(default_command=True)
 @click.argument("prompt")
 @click.option("-n", "--num-answers", type=click.IntRange(min=OPENAI_NUM_ANSWERS_MIN), help="Number of alternative answers")
-@click.option("-m", "--model", type=click.Choice(choices=AvailableModels.members_as_list()), help="OpenAI model to use. E.g. `text-ada-001`")
+@click.option("-m", "--model", type=click.Choice(choices=AvailableModels.members_as_list() + [AUTO_MODEL]), help="OpenAI model to use. E.g. `text-ada-001`, or `auto` to choose one per question")
 @click.option("-t", "--temperature", type=click.FloatRange(min=OPENAI_TEMPERATURE_MIN, max=OPENAI_TEMPERATURE_MAX), help="Temperature")
 @click.option("--max-tokens", type=click.IntRange(min=OPENAI_MAX_TOKENS_MIN), help="Max tokens")
 @click.option("--top-p", type=click.FloatRange(min=OPENAI_TOP_P_MIN, max=OPENAI_TOP_P_MAX), help="Top p")
 @click.option("--frequency-penalty", type=click.FloatRange(min=OPENAI_FREQUENCY_PENALTY_MIN, max=OPENAI_FREQUENCY_PENALTY_MAX), help="Frequency penalty")
 @click.option("--presence-penalty", type=click.FloatRange(min=OPENAI_PRESENCE_PENALTY_MIN, max=OPENAI_PRESENCE_PENALTY_MAX), help="Presence penalty")
+@click.option("--stream/--no-stream", default=None, help="Print the answer as it is generated. Default: on for terminals")
+@click.option("--no-cache", is_flag=True, help="Neither read nor write the response cache")
+@click.option("--refresh", is_flag=True, help="Ignore any cached answer and overwrite it")
+@click.option("--coalesce/--no-coalesce", default=None, help="Wait for an identical question that is already being asked. Default: on for temperature 0")
+@click.option("--similar", is_flag=True, help="Reuse the cached answer to an almost identically worded question")
+@click.option("--similarity", type=click.FloatRange(min=0.0, max=1.0), default=SIMILARITY_THRESHOLD, help="How similar a question has to be for --similar")
+@click.option("--max-retries", type=click.IntRange(min=MAX_RETRIES_MIN), help="Max retries of a failed request")
+@click.option("--retry-timeout", type=click.FloatRange(min=RETRY_TIMEOUT_MIN), help="Max seconds spent on retries")
+@click.option("-f", "--file", "input_file", type=click.File("r", encoding="utf8", errors="replace"), help="Ask about this file ('-' for stdin), even if it is too long for the model")
+@click.option("--overlap", type=click.IntRange(min=0), default=MAP_REDUCE_OVERLAP, help="Tokens shared by consecutive parts of the file")
+@click.option("--concurrency", type=click.IntRange(min=1), help=f"Max requests in flight for the file's parts. Default: {MAP_REDUCE_CONCURRENCY}, or {AIMD_MAX_CONCURRENCY} with --adaptive-concurrency")
+@click.option("--adaptive-concurrency", is_flag=True, help="Raise the requests in flight for the file's parts while they succeed, and cut them on rate limits or slow answers")
+@click.option("--hedge", is_flag=True, help="Send a slow request again, and use whichever answers first")
+@click.option("--hedge-percentile", type=click.FloatRange(min=0.0, max=100.0), default=HEDGE_PERCENTILE, help="Percentile of recent latencies after which --hedge sends the request again")
+@click.option("--hedge-budget", type=click.FloatRange(min=0.0, max=1.0), default=HEDGE_BUDGET, help="Max share of requests that --hedge sends twice")
+@click.option("--stop-regex", callback=_validate_regex, help="Stop an answer as soon as it matches this regular expression")
+@click.option("--max-lines", type=click.IntRange(min=1), help="Stop an answer after this many lines")
+@click.option("--until-code-block-closes", is_flag=True, help="Stop an answer as soon as its first code block is closed")
+@click.option("--max-total-tokens", type=click.IntRange(min=1), help="Continue answers cut off by max tokens, up to this many tokens in total")
+@click.option("--truncate", is_flag=True, help="Shorten prompts that are too long for the model instead of failing")
+@click.option("--timings", "show_timings", is_flag=True, help="Print how long each phase took to stderr")
+@click.option("--timings-json", type=click.Path(dir_okay=False, path_type=Path), help="Append the timings as JSON to this file")
 def ask(prompt: str,
         num_answers: int,
         model: str,
@@ -79,23 +122,347 @@ def ask(prompt: str,
         max_tokens: int,
         top_p: float,
         frequency_penalty: float,
-        presence_penalty: float) -> None:
-    openai.api_key = KeyHelper.from_file()
-    _config = ConfigHelper.from_file()
-
-    response = openai.Completion.create(
-        model=model if model else _config.model,
+        presence_penalty: float,
+        stream: Optional[bool],
+        no_cache: bool,
+        refresh: bool,
+        coalesce: Optional[bool],
+        similar: bool,
+        similarity: float,
+        max_retries: int,
+        retry_timeout: float,
+        input_file: Optional[IO[str]],
+        overlap: int,
+        concurrency: Optional[int],
+        adaptive_concurrency: bool,
+        hedge: bool,
+        hedge_percentile: float,
+        hedge_budget: float,
+        stop_regex: Optional[str],
+        max_lines: Optional[int],
+        until_code_block_closes: bool,
+        max_total_tokens: Optional[int],
+        truncate: bool,
+        show_timings: bool,
+        timings_json: Optional[Path]) -> None:
+    _ask(
         prompt=prompt,
-        temperature=temperature if temperature else _config.temperature,
-        max_tokens=max_tokens if max_tokens else _config.max_tokens,
-        n=num_answers if num_answers else _config.num_answers,
-        top_p=top_p if top_p else _config.top_p,
-        frequency_penalty=frequency_penalty if frequency_penalty else _config.frequency_penalty,
-        presence_penalty=presence_penalty if presence_penalty else _config.presence_penalty
+        overrides=dict(
+            model=model,
+            num_answers=num_answers,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            frequency_penalty=frequency_penalty,
+            presence_penalty=presence_penalty,
+            max_retries=max_retries,
+            retry_timeout=retry_timeout
+        ),
+        stream=stream,
+        use_cache=not no_cache,
+        refresh=refresh,
+        coalesce=coalesce,
+        similarity=similarity if similar else None,
+        input_file=input_file,
+        overlap=overlap,
+        concurrency=concurrency if concurrency else AIMD_MAX_CONCURRENCY if adaptive_concurrency else MAP_REDUCE_CONCURRENCY,
+        adaptive_concurrency=adaptive_concurrency,
+        hedge=hedge,
+        hedge_percentile=hedge_percentile,
+        hedge_budget=hedge_budget,
+        stop_regex=stop_regex,
+        max_lines=max_lines,
+        until_code_block_closes=until_code_block_closes,
+        max_total_tokens=max_total_tokens,
+        truncate=truncate,
+        show_timings=show_timings,
+        timings_json=timings_json
     )
-    PrintHelper.print_response(response=response)
+
+
+def _ask(prompt: str,
+         overrides: dict,
+         stream: Optional[bool] = None,
+         use_cache: bool = True,
+         refresh: bool = False,
+         coalesce: Optional[bool] = None,
+         similarity: Optional[float] = None,
+         input_file: Optional[IO[str]] = None,
+         overlap: int = MAP_REDUCE_OVERLAP,
+         concurrency: int = MAP_REDUCE_CONCURRENCY,
+         adaptive_concurrency: bool = False,
+         hedge: bool = False,
+         hedge_percentile: float = HEDGE_PERCENTILE,
+         hedge_budget: float = HEDGE_BUDGET,
+         stop_regex: Optional[str] = None,
+         max_lines: Optional[int] = None,
+         until_code_block_closes: bool = False,
+         max_total_tokens: Optional[int] = None,
+         truncate: bool = False,
+         show_timings: bool = False,
+         timings_json: Optional[Path] = None,
+         api_key_path: Path = API_KEY_PATH,
+         config_path: Path = CONFIG_PATH,
+         cache_path: Path = CACHE_PATH,
+         inflight_path: Path = INFLIGHT_PATH,
+         latency_path: Path = LATENCY_PATH,
+         routing_path: Path = ROUTING_PATH) -> None:
+    """Separate function for testing"""
+    timings = Timings(enabled=show_timings or timings_json is not None)
+    timings.startup()
+    try:
+        _answer(
+            prompt=prompt,
+            overrides=overrides,
+            stream=stream,
+            use_cache=use_cache,
+            refresh=refresh,
+            coalesce=coalesce,
+            similarity=similarity,
+            input_file=input_file,
+            overlap=overlap,
+            concurrency=concurrency,
+            adaptive_concurrency=adaptive_concurrency,
+            hedge=hedge,
+            hedge_percentile=hedge_percentile,
+            hedge_budget=hedge_budget,
+            stop_regex=stop_regex,
+            max_lines=max_lines,
+            until_code_block_closes=until_code_block_closes,
+            max_total_tokens=max_total_tokens,
+            truncate=truncate,
+            timings=timings,
+            api_key_path=api_key_path,
+            config_path=config_path,
+            cache_path=cache_path,
+            inflight_path=inflight_path,
+            latency_path=latency_path,
+            routing_path=routing_path
+        )
+    finally:
+        # Also when the question failed, since slow failures are worth looking into too
+        if show_timings:
+            PrintHelper.timings(timings=timings.as_dict())
+        if timings_json is not None:
+            timings.append_json(path=timings_json)
+
+
+def _answer(prompt: str,
+            overrides: dict,
+            stream: Optional[bool],
+            use_cache: bool,
+            refresh: bool,
+            coalesce: Optional[bool],
+            similarity: Optional[float],
+            input_file: Optional[IO[str]],
+            overlap: int,
+            concurrency: int,
+            adaptive_concurrency: bool,
+            hedge: bool,
+            hedge_percentile: float,
+            hedge_budget: float,
+            stop_regex: Optional[str],
+            max_lines: Optional[int],
+            until_code_block_closes: bool,
+            max_total_tokens: Optional[int],
+            truncate: bool,
+            timings: Timings,
+            api_key_path: Path,
+            config_path: Path,
+            cache_path: Path,
+            inflight_path: Path,
+            latency_path: Path,
+            routing_path: Path) -> None:
+    # openai is only imported once the answer isn't in the cache, so cached answers don't wait for it
+    from .cache import ResponseCache
+    from .routing import LONGEST_CONTEXT_MODEL, Choice, RoutingHistory, is_good, record_stream, route
+    from .singleflight import InflightLock
+    from .stopping import StopConditions, stop_response, stop_stream
+    from .tokenizer import PromptTooLongError, fit
+
+    with timings.phase("config"):
+        _config = ConfigHelper.from_file(config_path=config_path).with_overrides(**overrides)
+    if stream is None:
+        stream = sys.stdout.isatty()
+    choice = None
+    if _config.model == AUTO_MODEL:
+        with timings.phase("route"):
+            routing_history = RoutingHistory(path=routing_path)
+            if input_file is None:
+                _config, choice = route(config=_config, prompt=prompt, history=routing_history)
+            else:
+                # The file's parts fill the whole context
+                choice = Choice(model=LONGEST_CONTEXT_MODEL, reason="file")
+                _config = _config.with_overrides(model=choice.model)
+        PrintHelper.routed(model=choice.model, reason=choice.reason)
+    timings.info(model=_config.model, num_answers=_config.num_answers, stream=stream, status="error")
+    if input_file is not None:
+        use_cache = False  # The file might be too large to hash, and changes between questions
+        max_total_tokens = None  # The answers about the file's parts are combined instead
+    stop = StopConditions(regex=stop_regex, max_lines=max_lines, code_block=until_code_block_closes)
+    client_options = {}
+    if stop.enabled:
+        client_options["stop"] = stop.as_dict()
+    if max_total_tokens is not None:
+        client_options["max_total_tokens"] = max_total_tokens
+    # Fail before sending a prompt that doesn't fit, and don't reserve more of the context than is left. The answer
+    # is cached for the prompt and config that are sent, so a prompt cut short by --truncate has its own answer
+    request_prompt, request_config = prompt, _config
+    if input_file is None:
+        try:
+            with timings.phase("tokenize"):
+                request_prompt, max_tokens = fit(prompt=prompt, model=_config.model, max_tokens=_config.max_tokens, truncate=truncate)
+        except PromptTooLongError as e:
+            PrintHelper.prompt_too_long(error=e)
+            exit(1)
+        request_config = _config.with_overrides(max_tokens=max_tokens)
+
+    # Answers changed on the client side are only reused with the same options, so they aren't found by --similar
+    fingerprint_prompt = None if client_options else request_prompt
+
+    with timings.phase("cache"):
+        cache = ResponseCache(cache_path=cache_path)
+        cache_key = ResponseCache.key(prompt=request_prompt, config=request_config, client_options=client_options)
+        cached_response = cache.get(cache_key) if use_cache and not refresh else None
+        similar_response = None
+        if cached_response is None and use_cache and not refresh and similarity is not None and not client_options:
+            similar_response = cache.get_similar(prompt=request_prompt, config=request_config, threshold=similarity)
+    if cached_response is not None:
+        PrintHelper.cached()
+        with timings.phase("render"):
+            PrintHelper.print_response(response=cached_response)
+        timings.info(status="cached")
+        return
+    if similar_response is not None:
+        PrintHelper.cached_similar()
+        with timings.phase("render"):
+            PrintHelper.print_response(response=similar_response)
+        timings.info(status="cached similar")
+        return
+
+    # Identical questions asked at the same time wait for the first one's answer, and read it from the cache
+    if coalesce is None:
+        coalesce = ResponseCache.is_deterministic(config=_config)
+    with ExitStack() as in_flight:
+        if coalesce and use_cache and not refresh:
+            with timings.phase("wait"):
+                in_flight.enter_context(InflightLock(key=cache_key, inflight_path=inflight_path))
+            cached_response = cache.get(cache_key)
+            if cached_response is not None:
+                PrintHelper.cached()
+                with timings.phase("render"):
+                    PrintHelper.print_response(response=cached_response)
+                timings.info(status="coalesced")
+                return
+
+        with timings.phase("import openai"):
+            import openai
+            from openai.error import AuthenticationError, OpenAIError
+            from .aimd import AIMDController
+            from .client import Client
+            from .continuation import continue_response, continue_stream
+            from .hedge import Hedger, LatencyHistory
+            from .mapreduce import MapReduceError, map_reduce
+            from .retry import CircuitOpenError
+
+        with timings.phase("key"):
+            api_key = KeyHelper.from_file(api_key_path=api_key_path)
+            verification = KeyHelper.verification(key=api_key, api_key_path=api_key_path)
+        if verification is False:
+            PrintHelper.key_rejected()
+            exit(1)
+
+        openai.api_key = api_key
+        try:
+            if input_file is None:
+                hedger = None
+                if hedge:
+                    # Streams are hedged until the response headers arrive, other requests until the whole answer
+                    latency_key = f"{request_config.model}:{'stream' if stream else request_config.max_tokens}"
+                    hedger = Hedger(history=LatencyHistory(key=latency_key, path=latency_path),
+                                    percentile=hedge_percentile, budget=hedge_budget)
+                request_started = time.perf_counter()
+                with timings.request():
+                    response = Client(config=request_config, hedger=hedger).create(prompt=request_prompt, stream=stream)
+                if hedger is not None:
+                    timings.info(hedge=hedger.stats)
+            else:
+                controller = AIMDController(maximum=concurrency) if adaptive_concurrency else None
+                try:
+                    with timings.phase("map reduce"):
+                        response = map_reduce(question=prompt, file=input_file, config=_config, stream=stream,
+                                              concurrency=concurrency, overlap=overlap, controller=controller)
+                finally:
+                    if controller is not None:
+                        timings.info(concurrency=controller.stats())
+                request_config = _config.with_overrides(num_answers=1)
+        except AuthenticationError:
+            KeyHelper.record_verification(key=api_key, valid=False, api_key_path=api_key_path)
+            PrintHelper.key_rejected()
+            exit(1)
+        except (OpenAIError, CircuitOpenError, MapReduceError) as e:
+            if choice is not None and isinstance(e, OpenAIError):
+                routing_history.record(choice=choice, seconds=None, good=False)
+            PrintHelper.request_failed(error=e)
+            exit(1)
+        if verification is None:
+            KeyHelper.record_verification(key=api_key, valid=True, api_key_path=api_key_path)
+        continuations = []
+        if max_total_tokens is not None:
+            def create_continuation(continuation_prompt: str, continuation_max_tokens: int, continuation_stream: bool):
+                continuations.append(continuation_max_tokens)
+                continuation_config = request_config.with_overrides(num_answers=1, max_tokens=continuation_max_tokens)
+                return Client(config=continuation_config).create(prompt=continuation_prompt, stream=continuation_stream)
+
+            # Streamed continuations are requested once the stream before them is read, as part of the download
+            continuation_kwargs = dict(prompt=request_prompt, model=request_config.model,
+                                       max_tokens=request_config.max_tokens, budget=max_total_tokens,
+                                       create=create_continuation)
+            if stream:
+                response = continue_stream(response=response, **continuation_kwargs)
+            else:
+                with timings.phase("continue"):
+                    response = continue_response(response=response, **continuation_kwargs)
+        if stop.enabled:
+            # A stream is closed as soon as every answer is done, which stops the generation
+            response = stop_stream(response=response, conditions=stop, num_answers=request_config.num_answers) \
+                if stream else stop_response(response=response, conditions=stop)
+        if choice is not None and input_file is None:
+            # Recorded once the whole answer is known
+            if stream:
+                response = record_stream(history=routing_history, choice=choice, response=response, started=request_started)
+            else:
+                routing_history.record(choice=choice, seconds=time.perf_counter() - request_started,
+                                       good=is_good(answer["text"] for answer in response["choices"]))
+
+        deterministic = ResponseCache.is_deterministic(config=_config)
+        if stream:
+            # The body is downloaded while the answer is printed. Waiting for the next token counts as download
+            response = timings.iterate(response, name="download")
+            if use_cache:
+                response = cache.record_stream(key=cache_key, response=response, deterministic=deterministic,
+                                               prompt=fingerprint_prompt, config=request_config)
+            download_before = timings.get("download")
+            with timings.phase("render"):
+                PrintHelper.print_stream(response=response, num_answers=request_config.num_answers)
+            # Printing the stream includes waiting for it, which is already counted as download
+            timings.add("render", download_before - timings.get("download"))
+        else:
+            if use_cache:
+                cache.set(key=cache_key, response=response, deterministic=deterministic, prompt=fingerprint_prompt,
+                          config=request_config)
+            with timings.phase("render"):
+                PrintHelper.print_response(response=response)
+        timings.info(status="ok", continuations=len(continuations))
 
 
 askai.add_command(init)
+askai.add_command(chat)
 askai.add_command(config)
 askai.add_command(key)
+askai.add_command(batch)
+askai.add_command(serve)
+askai.add_command(submit)
+askai.add_command(worker)
+askai.add_command(jobs)
+askai.add_command(tokens)
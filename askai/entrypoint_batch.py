@@ -0,0 +1,136 @@
+import json
+from pathlib import Path
+from typing import IO, Optional
+
+import click
+
+from .constants import API_KEY_PATH, KEYS_PATH, CONFIG_PATH, AIMD_MAX_CONCURRENCY, BATCH_MAX_PROMPTS, MAX_RETRIES_MIN, \
+    RETRY_TIMEOUT_MIN, ROUTING_PATH
+from .utils import KeyHelper, ConfigHelper, PrintHelper
+
+
+@click.command()
+@click.argument("input_file", type=click.File("r", encoding="utf8"), default="-")
+@click.option("-o", "--output", type=click.Path(dir_okay=False, allow_dash=True), default="-", help="Where to write the answers. Default: stdout")
+@click.option("--jsonl", is_flag=True, help="Each input line is a JSON object with a 'prompt' and optional config overrides")
+@click.option("--batch-size", type=click.IntRange(min=1, max=BATCH_MAX_PROMPTS), default=BATCH_MAX_PROMPTS, help="Max prompts per request")
+@click.option("--concurrency", type=click.IntRange(min=1), help=f"Max requests in flight. Default: 1, or {AIMD_MAX_CONCURRENCY} with --adaptive-concurrency")
+@click.option("--adaptive-concurrency", is_flag=True, help="Raise the requests in flight while they succeed, and cut them on rate limits or slow answers")
+@click.option("--stats", "show_stats", is_flag=True, help="Print how the adaptive concurrency changed to stderr")
+@click.option("--ordered", is_flag=True, help="Write the answers in input order instead of as they finish")
+@click.option("--max-retries", type=click.IntRange(min=MAX_RETRIES_MIN), help="Max retries of a failed request")
+@click.option("--retry-timeout", type=click.FloatRange(min=RETRY_TIMEOUT_MIN), help="Max seconds spent on retries")
+@click.option("--journal", "journal_path", type=click.Path(dir_okay=False, path_type=Path), help="Where to record the answered prompts. Default: the output file + '.journal'")
+@click.option("--resume", is_flag=True, help="Only answer the prompts that aren't answered in the journal, and append to the output")
+def batch(input_file: IO[str],
+          output: str,
+          jsonl: bool,
+          batch_size: int,
+          concurrency: Optional[int],
+          adaptive_concurrency: bool,
+          show_stats: bool,
+          ordered: bool,
+          max_retries: int,
+          retry_timeout: float,
+          journal_path: Optional[Path],
+          resume: bool) -> None:
+    """Answer one prompt per line, many prompts per request."""
+    if journal_path is None and output != "-":
+        journal_path = Path(f"{output}.journal")
+    if resume and journal_path is None:
+        raise click.UsageError("--resume needs the journal of the run, from --output or --journal")
+
+    with click.open_file(output, "a" if resume else "w", encoding="utf8") as output_file:
+        _batch(
+            input_file=input_file,
+            output=output_file,
+            jsonl=jsonl,
+            batch_size=batch_size,
+            concurrency=concurrency if concurrency else AIMD_MAX_CONCURRENCY if adaptive_concurrency else 1,
+            adaptive_concurrency=adaptive_concurrency,
+            show_stats=show_stats,
+            ordered=ordered,
+            overrides=dict(max_retries=max_retries, retry_timeout=retry_timeout),
+            journal_path=journal_path,
+            resume=resume
+        )
+
+
+def _batch(input_file: IO[str],
+           output: IO[str],
+           jsonl: bool = False,
+           batch_size: int = BATCH_MAX_PROMPTS,
+           concurrency: int = 1,
+           adaptive_concurrency: bool = False,
+           show_stats: bool = False,
+           ordered: bool = False,
+           overrides: Optional[dict] = None,
+           journal_path: Optional[Path] = None,
+           resume: bool = False,
+           routing_path: Path = ROUTING_PATH,
+           api_key_path: Path = API_KEY_PATH,
+           keys_path: Path = KEYS_PATH,
+           config_path: Path = CONFIG_PATH) -> None:
+    """Separate function for testing"""
+    import openai
+    from functools import partial
+    from .aimd import AIMDController
+    from .batch import read_prompts, complete, route_prompts
+    from .journal import Journal
+    from .keypool import KeyPool
+    from .pipeline import Pipeline
+    from .ratelimit import RateLimiter
+    from .retry import CircuitBreaker
+    from .routing import RoutingHistory
+
+    # With named keys, the requests are spread over all keys, and a rejected key is left out for a while
+    key_pool = KeyPool.load(api_key_path=api_key_path, keys_path=keys_path)
+    if key_pool is None:
+        openai.api_key = KeyHelper.from_file(api_key_path=api_key_path)
+        if KeyHelper.verification(key=openai.api_key, api_key_path=api_key_path) is False:
+            PrintHelper.key_rejected()
+            exit(1)
+    config = ConfigHelper.from_file(config_path=config_path).with_overrides(**(overrides or {}))
+
+    controller = AIMDController(maximum=concurrency) if adaptive_concurrency else None
+    # Records every answered line, so that a run that stops can be resumed without asking for them again
+    journal = Journal(path=journal_path, resume=resume, output=output) if journal_path is not None else None
+    routing_history = RoutingHistory(path=routing_path)
+
+    def emit(result: dict) -> None:
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+        if journal is not None:
+            journal.record(result)
+
+    pipeline = Pipeline(
+        complete=partial(
+            complete,
+            circuit_breaker=CircuitBreaker(),
+            rate_limiter=RateLimiter(
+                requests_per_minute=config.requests_per_minute,
+                tokens_per_minute=config.tokens_per_minute
+            ),
+            key_pool=key_pool,
+            controller=controller,
+            routing_history=routing_history
+        ),
+        emit=emit,
+        concurrency=concurrency,
+        batch_size=batch_size,
+        ordered=ordered,
+        controller=controller
+    )
+    try:
+        prompts = read_prompts(lines=input_file, config=config, jsonl=jsonl, journal=journal)
+        pipeline.run(prompts=route_prompts(prompts=prompts, history=routing_history))
+    except ValueError as e:
+        click.echo(click.style(f"Invalid input. {e}", fg="red"))
+        exit(1)
+    finally:
+        if journal is not None:
+            journal.close()
+            if resume:
+                PrintHelper.resumed(skipped=journal.skipped)
+        if show_stats and controller is not None:
+            PrintHelper.concurrency(stats=controller.stats())
@@ -0,0 +1,123 @@
+import sys
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+import click
+
+from .constants import API_KEY_PATH, CONFIG_PATH, ROUTING_PATH, AUTO_MODEL, OPENAI_TEMPERATURE_MIN, \
+    OPENAI_TEMPERATURE_MAX, OPENAI_MAX_TOKENS_MIN
+from .utils import KeyHelper, ConfigHelper, PrintHelper, AvailableModels
+
+
+@click.command()
+@click.option("-m", "--model", type=click.Choice(choices=AvailableModels.members_as_list() + [AUTO_MODEL]), help="OpenAI model to use. E.g. `text-ada-001`, or `auto`")
+@click.option("-t", "--temperature", type=click.FloatRange(min=OPENAI_TEMPERATURE_MIN, max=OPENAI_TEMPERATURE_MAX), help="Temperature")
+@click.option("--max-tokens", type=click.IntRange(min=OPENAI_MAX_TOKENS_MIN), help="Max tokens per answer")
+@click.option("--stream/--no-stream", default=None, help="Print the answers as they are generated. Default: on for terminals")
+def chat(model: str, temperature: float, max_tokens: int, stream: Optional[bool]) -> None:
+    """Chat with follow-up questions."""
+    _chat(overrides=dict(model=model, temperature=temperature, max_tokens=max_tokens), stream=stream)
+
+
+def _chat(overrides: dict,
+          stream: Optional[bool] = None,
+          api_key_path: Path = API_KEY_PATH,
+          config_path: Path = CONFIG_PATH,
+          routing_path: Path = ROUTING_PATH) -> None:
+    """Separate function for testing"""
+    import openai
+    from openai.error import AuthenticationError, OpenAIError
+    from .chat import STOP, Conversation, prompt_budget
+    from .client import Client
+    from .retry import CircuitOpenError
+    from .routing import LONGEST_CONTEXT_MODEL, Choice, RoutingHistory, is_good, size
+
+    _config = ConfigHelper.from_file(config_path=config_path).with_overrides(**overrides, num_answers=1)
+    if stream is None:
+        stream = sys.stdout.isatty()
+    choice = None
+    if _config.model == AUTO_MODEL:
+        # One model for the whole conversation, whose history grows to fill the context. Its answers are still
+        # recorded, so the history knows how the model does for prompts of every size
+        choice = Choice(model=LONGEST_CONTEXT_MODEL, reason="conversation")
+        _config = _config.with_overrides(model=choice.model)
+        routing_history = RoutingHistory(path=routing_path)
+        PrintHelper.routed(model=choice.model, reason=choice.reason)
+
+    budget = prompt_budget(model=_config.model, max_tokens=_config.max_tokens)
+    if budget <= 0:
+        PrintHelper.max_tokens_too_large(model=_config.model, max_tokens=_config.max_tokens)
+        exit(1)
+
+    api_key = KeyHelper.from_file(api_key_path=api_key_path)
+    verification = KeyHelper.verification(key=api_key, api_key_path=api_key_path)
+    if verification is False:
+        PrintHelper.key_rejected()
+        exit(1)
+    openai.api_key = api_key
+
+    # One client for the whole chat, so the connection, rate limits and circuit breaker carry over between turns
+    client = Client(config=_config)
+    conversation = Conversation(budget=budget)
+    PrintHelper.chat()
+
+    while True:
+        try:
+            question = input("> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            click.echo()
+            return
+        if not question:
+            continue
+        if question in ("/exit", "/quit"):
+            return
+        if question == "/reset":
+            conversation.clear()
+            PrintHelper.chat_reset()
+            continue
+
+        try:
+            prompt = conversation.prompt(question=question)
+        except ValueError:
+            PrintHelper.question_too_long()
+            continue
+
+        turn_choice = None if choice is None else Choice(
+            model=choice.model, reason=choice.reason,
+            size=size(prompt_tokens=conversation.prompt_tokens, max_tokens=_config.max_tokens))
+        started = time.perf_counter()
+        try:
+            response = client.create(prompt=prompt, stream=stream, stop=STOP)
+            if stream:
+                chunks: List[dict] = []
+                PrintHelper.print_stream(response=_collect(response, into=chunks))
+                answer = "".join(chunk["choices"][0]["text"] for chunk in chunks)
+            else:
+                PrintHelper.print_response(response=response)
+                answer = response["choices"][0]["text"]
+        except AuthenticationError:
+            KeyHelper.record_verification(key=api_key, valid=False, api_key_path=api_key_path)
+            PrintHelper.key_rejected()
+            exit(1)
+        except (OpenAIError, CircuitOpenError) as e:
+            PrintHelper.request_failed(error=e)
+            if turn_choice is not None:
+                routing_history.record(choice=turn_choice, seconds=None, good=False)
+            continue
+        except KeyboardInterrupt:
+            click.echo()
+            continue  # The interrupted answer is left out of the history
+
+        if verification is None:
+            KeyHelper.record_verification(key=api_key, valid=True, api_key_path=api_key_path)
+            verification = True
+        if turn_choice is not None:
+            routing_history.record(choice=turn_choice, seconds=time.perf_counter() - started, good=is_good([answer]))
+        conversation.add(question=question, answer=answer)
+
+
+def _collect(chunks: Iterable[dict], into: List[dict]) -> Iterator[dict]:
+    for chunk in chunks:
+        into.append(chunk)
+        yield chunk
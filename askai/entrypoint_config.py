@@ -75,6 +75,28 @@ def _update_all(config_path: Path = CONFIG_PATH) -> None:
     PrintHelper.presence_penalty()
     config_helper.input_presence_penalty()
 
+    PrintHelper.step(step=8, description="SET MAXIMUM NUMBER OF RETRIES")
+    PrintHelper.max_retries()
+    config_helper.input_max_retries()
+
+    PrintHelper.step(step=9, description="SET RETRY TIMEOUT")
+    PrintHelper.retry_timeout()
+    config_helper.input_retry_timeout()
+
+    PrintHelper.step(step=10, description="SET MAXIMUM NUMBER OF REQUESTS PER MINUTE")
+    PrintHelper.requests_per_minute()
+    config_helper.input_requests_per_minute()
+
+    PrintHelper.step(step=11, description="SET MAXIMUM NUMBER OF TOKENS PER MINUTE")
+    PrintHelper.tokens_per_minute()
+    config_helper.input_tokens_per_minute()
+
+    # The routes for `--model auto` are only edited in the file, so they are kept
+    if config_path.is_file():
+        try:
+            config_helper.routes = ConfigHelper._load(config_path=config_path).routes
+        except ValueError:
+            pass
     config_helper.update(config_path=config_path)
 
 
@@ -167,3 +189,55 @@ def _presence_penalty(config_path: Path = CONFIG_PATH) -> None:
     config_helper = ConfigHelper.from_file()
     config_helper.input_presence_penalty()
     config_helper.update(config_path=config_path)
+
+
+@update.command(help="Update maximum number of retries")
+def max_retries() -> None:
+    _max_retries()
+
+
+def _max_retries(config_path: Path = CONFIG_PATH) -> None:
+    """Separate function for testing"""
+    PrintHelper.max_retries()
+    config_helper = ConfigHelper.from_file(config_path=config_path)
+    config_helper.input_max_retries()
+    config_helper.update(config_path=config_path)
+
+
+@update.command(help="Update retry timeout")
+def retry_timeout() -> None:
+    _retry_timeout()
+
+
+def _retry_timeout(config_path: Path = CONFIG_PATH) -> None:
+    """Separate function for testing"""
+    PrintHelper.retry_timeout()
+    config_helper = ConfigHelper.from_file(config_path=config_path)
+    config_helper.input_retry_timeout()
+    config_helper.update(config_path=config_path)
+
+
+@update.command(help="Update maximum number of requests per minute")
+def requests_per_minute() -> None:
+    _requests_per_minute()
+
+
+def _requests_per_minute(config_path: Path = CONFIG_PATH) -> None:
+    """Separate function for testing"""
+    PrintHelper.requests_per_minute()
+    config_helper = ConfigHelper.from_file(config_path=config_path)
+    config_helper.input_requests_per_minute()
+    config_helper.update(config_path=config_path)
+
+
+@update.command(help="Update maximum number of tokens per minute")
+def tokens_per_minute() -> None:
+    _tokens_per_minute()
+
+
+def _tokens_per_minute(config_path: Path = CONFIG_PATH) -> None:
+    """Separate function for testing"""
+    PrintHelper.tokens_per_minute()
+    config_helper = ConfigHelper.from_file(config_path=config_path)
+    config_helper.input_tokens_per_minute()
+    config_helper.update(config_path=config_path)
@@ -7,16 +7,17 @@ from .utils import KeyHelper, ConfigHelper, PrintHelper
 
 
 @click.command()
-def init() -> None:
+@click.option("--offline", is_flag=True, help="Only check the format of the API key, verify it on first use")
+def init(offline: bool) -> None:
     """Initialize askai."""
-    _init()
+    _init(verify=not offline)
 
 
-def _init(config_path: Path = CONFIG_PATH, api_key_path: Path = API_KEY_PATH) -> None:
+def _init(config_path: Path = CONFIG_PATH, api_key_path: Path = API_KEY_PATH, verify: bool = True) -> None:
     """Separate function for testing"""
     PrintHelper.logo()
 
-    key_helper = KeyHelper()
+    key_helper = KeyHelper(verify=verify)
     PrintHelper.key()
     key_helper.input()
     key_helper.save(api_key_path=api_key_path)
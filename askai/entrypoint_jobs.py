@@ -0,0 +1,219 @@
+import time
+from pathlib import Path
+from typing import IO, Callable, Optional
+
+import click
+
+from .constants import API_KEY_PATH, KEYS_PATH, CONFIG_PATH, JOBS_PATH, AIMD_MAX_CONCURRENCY, BATCH_MAX_PROMPTS, \
+    JOB_POLL_INTERVAL, JOB_VISIBILITY_TIMEOUT, JOB_MAX_PACK_WAIT, ROUTING_PATH
+from .utils import KeyHelper, ConfigHelper, PrintHelper
+
+
+@click.command()
+@click.argument("input_file", type=click.File("r", encoding="utf8"), default="-")
+@click.option("--jsonl", is_flag=True, help="Each input line is a JSON object with a 'prompt' and optional config overrides")
+def submit(input_file: IO[str], jsonl: bool) -> None:
+    """Add one prompt per line to the job queue, for 'askai worker' to answer."""
+    _submit(input_file=input_file, jsonl=jsonl)
+
+
+def _submit(input_file: IO[str],
+            jsonl: bool = False,
+            jobs_path: Path = JOBS_PATH,
+            config_path: Path = CONFIG_PATH) -> None:
+    """Separate function for testing"""
+    from .batch import read_records
+    from .jobqueue import JobQueue
+
+    config = ConfigHelper.from_file(config_path=config_path)
+
+    def validated(records):
+        for prompt, overrides in records:
+            if overrides:
+                config.with_overrides(**overrides).validate()
+            yield prompt, overrides
+
+    try:
+        count = JobQueue(path=jobs_path).submit(records=validated(read_records(lines=input_file, jsonl=jsonl)))
+    except ValueError as e:
+        click.echo(click.style(f"Invalid input. {e}", fg="red"))
+        exit(1)
+    PrintHelper.jobs_submitted(count=count)
+
+
+@click.command()
+@click.option("--procs", type=click.IntRange(min=1), default=1, help="Number of worker processes")
+@click.option("--batch-size", type=click.IntRange(min=1, max=BATCH_MAX_PROMPTS), default=BATCH_MAX_PROMPTS, help="Max prompts per request")
+@click.option("--concurrency", type=click.IntRange(min=1), help=f"Max requests in flight per process. Default: 1, or {AIMD_MAX_CONCURRENCY} with --adaptive-concurrency")
+@click.option("--adaptive-concurrency", is_flag=True, help="Raise the requests in flight while they succeed, and cut them on rate limits or slow answers")
+@click.option("--visibility-timeout", type=click.FloatRange(min=1.0), default=JOB_VISIBILITY_TIMEOUT, help="Seconds before a job that isn't finished is given to another worker")
+@click.option("--wait", is_flag=True, help="Keep waiting for new jobs when the queue is empty")
+def worker(procs: int,
+           batch_size: int,
+           concurrency: Optional[int],
+           adaptive_concurrency: bool,
+           visibility_timeout: float,
+           wait: bool) -> None:
+    """Answer the jobs in the job queue."""
+    _worker(
+        procs=procs,
+        batch_size=batch_size,
+        concurrency=concurrency if concurrency else AIMD_MAX_CONCURRENCY if adaptive_concurrency else 1,
+        adaptive_concurrency=adaptive_concurrency,
+        visibility_timeout=visibility_timeout,
+        wait=wait
+    )
+
+
+def _worker(procs: int = 1, **kwargs) -> None:
+    """Separate function for testing"""
+    if procs == 1:
+        _work(**kwargs)
+        return
+
+    import multiprocessing
+
+    processes = [multiprocessing.Process(target=_work, kwargs=kwargs) for _ in range(procs)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    if any(process.exitcode != 0 for process in processes):
+        exit(1)
+
+
+def _work(batch_size: int = BATCH_MAX_PROMPTS,
+          concurrency: int = 1,
+          adaptive_concurrency: bool = False,
+          visibility_timeout: float = JOB_VISIBILITY_TIMEOUT,
+          wait: bool = False,
+          jobs_path: Path = JOBS_PATH,
+          api_key_path: Path = API_KEY_PATH,
+          keys_path: Path = KEYS_PATH,
+          config_path: Path = CONFIG_PATH,
+          routing_path: Path = ROUTING_PATH,
+          sleep: Callable[[float], None] = time.sleep) -> None:
+    """
+    Lease jobs whenever the pipeline has room for more, and store the results of every request as it finishes.
+    Runs until no job is pending or leased, also by other workers, since their leases may expire.
+    """
+    import openai
+    import os
+    import socket
+    from functools import partial
+    from .aimd import AIMDController
+    from .batch import BatchPrompt, complete, route_prompts
+    from .jobqueue import JobQueue
+    from .keypool import KeyPool
+    from .pipeline import Pipeline
+    from .ratelimit import RateLimiter
+    from .retry import CircuitBreaker
+    from .routing import RoutingHistory
+
+    key_pool = KeyPool.load(api_key_path=api_key_path, keys_path=keys_path)
+    if key_pool is None:
+        openai.api_key = KeyHelper.from_file(api_key_path=api_key_path)
+        if KeyHelper.verification(key=openai.api_key, api_key_path=api_key_path) is False:
+            PrintHelper.key_rejected()
+            exit(1)
+    config = ConfigHelper.from_file(config_path=config_path)
+
+    queue = JobQueue(path=jobs_path, visibility_timeout=visibility_timeout)
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    controller = AIMDController(maximum=concurrency) if adaptive_concurrency else None
+    history = RoutingHistory(path=routing_path)
+    complete_group = partial(
+        complete,
+        circuit_breaker=CircuitBreaker(),
+        rate_limiter=RateLimiter(
+            requests_per_minute=config.requests_per_minute,
+            tokens_per_minute=config.tokens_per_minute
+        ),
+        key_pool=key_pool,
+        controller=controller,
+        routing_history=history
+    )
+    leased = {}  # Job ID -> job
+
+    def complete_jobs(group):
+        results = complete_group(group)
+        # A job is only missing if its lease expired and this worker leased it again, so the newer attempt counts
+        finished = [leased.pop(result["index"], None) for result in results]
+        queue.finish(outcomes=[(job, result) for job, result in zip(finished, results) if job is not None])
+        return results
+
+    def leased_prompts():
+        # Enough jobs for every request in flight, so leases don't expire while the jobs wait for their turn
+        while True:
+            new_jobs = queue.lease(worker=name, limit=concurrency * batch_size)
+            if not new_jobs:
+                return
+            for job in new_jobs:
+                # A job whose lease expired while this worker still sends it only takes the new lease
+                already_held = job.id in leased
+                leased[job.id] = job
+                if not already_held:
+                    yield BatchPrompt(index=job.id, prompt=job.prompt, config=config.with_overrides(**job.overrides))
+
+    pipeline = Pipeline(
+        complete=complete_jobs,
+        emit=lambda result: None,
+        concurrency=concurrency,
+        batch_size=batch_size,
+        controller=controller,
+        max_wait=min(JOB_MAX_PACK_WAIT, visibility_timeout / 2)
+    )
+    while True:
+        pipeline.run(prompts=route_prompts(prompts=leased_prompts(), history=history))
+        if not wait and not queue.has_unfinished():
+            break
+        sleep(JOB_POLL_INTERVAL)
+
+
+@click.group()
+def jobs():
+    """Follow and collect the jobs of the job queue."""
+    pass
+
+
+@jobs.command()
+def status() -> None:
+    """Show the number of jobs in every state, the throughput and the ETA"""
+    _status()
+
+
+def _status(jobs_path: Path = JOBS_PATH) -> None:
+    """Separate function for testing"""
+    from .jobqueue import JobQueue
+
+    PrintHelper.jobs_status(status=JobQueue(path=jobs_path).status())
+
+
+@jobs.command()
+@click.option("-o", "--output", type=click.File("w", encoding="utf8"), default="-", help="Where to write the answers. Default: stdout")
+def results(output: IO[str]) -> None:
+    """Write the answers of the finished jobs as JSON lines"""
+    _results(output=output)
+
+
+def _results(output: IO[str], jobs_path: Path = JOBS_PATH) -> None:
+    """Separate function for testing"""
+    import json
+    from .jobqueue import JobQueue
+
+    for result in JobQueue(path=jobs_path).results():
+        output.write(json.dumps(result) + "\n")
+
+
+@jobs.command()
+def retry() -> None:
+    """Put the failed jobs back in the queue"""
+    _retry()
+
+
+def _retry(jobs_path: Path = JOBS_PATH) -> None:
+    """Separate function for testing"""
+    from .jobqueue import JobQueue
+
+    count = JobQueue(path=jobs_path).retry_failed()
+    click.echo(click.style(f"{count} failed jobs are back in the queue.", fg="green"))
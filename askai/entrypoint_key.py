@@ -1,42 +1,78 @@
+import os
 from pathlib import Path
+from typing import Optional
 
 import click
 
 from .utils import KeyHelper, PrintHelper
-from .constants import API_KEY_PATH
+from .constants import API_KEY_PATH, KEYS_PATH, KEY_HEALTH_PATH, DEFAULT_KEY_NAME, REQUESTS_PER_MINUTE_MIN, \
+    TOKENS_PER_MINUTE_MIN
+
+
+def _validate_name(ctx: click.Context, param: click.Parameter, value: Optional[str]) -> Optional[str]:
+    if value == DEFAULT_KEY_NAME:
+        raise click.BadParameter(f"'{DEFAULT_KEY_NAME}' is the key added without a name")
+    if value is not None and ("/" in value or os.sep in value):
+        raise click.BadParameter("The name can't contain a path separator")
+    return value
 
 
 @click.group()
 def key():
-    """Update or remove your API key."""
+    """Update or remove your API keys."""
     pass
 
 
 @key.command()
-def add() -> None:
+@click.option("--offline", is_flag=True, help="Only check the format of the key, verify it on first use")
+@click.option("--name", callback=_validate_name, help="Add the key to the key pool under this name, next to the default key")
+@click.option("--organization", help="OpenAI organization ID to use with the named key")
+@click.option("--requests-per-minute", type=click.IntRange(min=REQUESTS_PER_MINUTE_MIN), default=0, help="Rate limit of the named key. Default: no limit")
+@click.option("--tokens-per-minute", type=click.IntRange(min=TOKENS_PER_MINUTE_MIN), default=0, help="Token rate limit of the named key. Default: no limit")
+def add(offline: bool,
+        name: Optional[str],
+        organization: Optional[str],
+        requests_per_minute: int,
+        tokens_per_minute: int) -> None:
     """Add API key"""
-    _add()
+    if name is None and (organization is not None or requests_per_minute or tokens_per_minute):
+        raise click.UsageError("--organization, --requests-per-minute and --tokens-per-minute need a --name")
+    _add(verify=not offline, name=name, organization=organization, requests_per_minute=requests_per_minute,
+         tokens_per_minute=tokens_per_minute)
 
 
-def _add(api_key_path: Path = API_KEY_PATH) -> None:
+def _add(api_key_path: Path = API_KEY_PATH,
+         verify: bool = True,
+         name: Optional[str] = None,
+         organization: Optional[str] = None,
+         requests_per_minute: int = 0,
+         tokens_per_minute: int = 0,
+         keys_path: Path = KEYS_PATH) -> None:
     """Separate function for testing"""
-    if API_KEY_PATH.is_file():
+    if name is None and API_KEY_PATH.is_file():
         PrintHelper.key_exists()
 
-    key_helper = KeyHelper()
+    key_helper = KeyHelper(verify=verify)
     key_helper.input()
-    key_helper.save(api_key_path=api_key_path)
+    if name is None:
+        key_helper.save(api_key_path=api_key_path)
+    else:
+        key_helper.save_named(name=name, organization=organization, requests_per_minute=requests_per_minute,
+                              tokens_per_minute=tokens_per_minute, keys_path=keys_path, api_key_path=api_key_path)
 
 
 @key.command()
-def remove() -> None:
+@click.option("--name", help="Remove the key with this name from the key pool")
+def remove(name: Optional[str]) -> None:
     """Remove your stored API key"""
-    _remove()
+    _remove(name=name)
 
 
-def _remove(api_key_path: Path = API_KEY_PATH) -> None:
+def _remove(api_key_path: Path = API_KEY_PATH, name: Optional[str] = None, keys_path: Path = KEYS_PATH) -> None:
     """Separate function for testing"""
-    if not API_KEY_PATH.is_file():
+    if name is not None and name != DEFAULT_KEY_NAME:
+        KeyHelper.remove_named(name=name, keys_path=keys_path)
+    elif not API_KEY_PATH.is_file():
         PrintHelper.no_key()
     else:
         user_verification = input("Do you want to remove your API key? [y/Y]? ")
@@ -44,3 +80,26 @@ def _remove(api_key_path: Path = API_KEY_PATH) -> None:
             KeyHelper().remove(api_key_path=api_key_path)
         else:
             click.echo("API key not removed.")
+
+
+@key.command(name="list")
+def list_keys() -> None:
+    """List your API keys and whether they are quarantined"""
+    _list_keys()
+
+
+def _list_keys(api_key_path: Path = API_KEY_PATH, keys_path: Path = KEYS_PATH, health_path: Path = KEY_HEALTH_PATH) -> None:
+    """Separate function for testing"""
+    from .keypool import KeyHealth, load_keys
+
+    keys = load_keys(api_key_path=api_key_path, keys_path=keys_path)
+    if not keys:
+        PrintHelper.no_key()
+        return
+    health = KeyHealth(path=health_path)
+    PrintHelper.keys(keys=[
+        dict(name=pooled.name, key=pooled.key, organization=pooled.organization,
+             requests_per_minute=pooled.requests_per_minute, tokens_per_minute=pooled.tokens_per_minute,
+             quarantined_until=health.quarantined_until(pooled), reason=health.reason(pooled))
+        for pooled in keys
+    ])
@@ -0,0 +1,61 @@
+import signal
+import socket
+import sys
+from pathlib import Path
+
+import click
+
+from .constants import API_KEY_PATH, CONFIG_PATH, DAEMON_WORKERS, SOCKET_PATH
+from .utils import ConfigHelper, KeyHelper, PrintHelper
+
+
+@click.command()
+@click.option("--workers", type=click.IntRange(min=1), default=DAEMON_WORKERS, show_default=True,
+              help="Number of questions answered at the same time")
+def serve(workers: int) -> None:
+    """Keep askai warm in the background, for faster answers."""
+    _serve(workers=workers)
+
+
+def _serve(workers: int = DAEMON_WORKERS,
+           socket_path: Path = SOCKET_PATH,
+           api_key_path: Path = API_KEY_PATH,
+           config_path: Path = CONFIG_PATH) -> None:
+    """Separate function for testing"""
+    from .daemon import Daemon
+    from .timings import skip_startup
+
+    if _is_listening(socket_path=socket_path):
+        PrintHelper.daemon_running(socket_path=socket_path)
+        exit(1)
+    socket_path.unlink(missing_ok=True)  # Left behind by a daemon that was killed
+
+    # Import and load everything a question needs up front, so the first question is fast too
+    import openai  # noqa: F401
+    from . import cache, client  # noqa: F401
+    from .tokenizer import get_tokenizer
+    get_tokenizer()
+    ConfigHelper.from_file(config_path=config_path)
+    KeyHelper.from_file(api_key_path=api_key_path)
+    skip_startup()
+
+    daemon = Daemon(socket_path=socket_path, workers=workers)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    PrintHelper.daemon_started(socket_path=socket_path)
+    try:
+        with daemon.redirected_output():
+            daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.server_close()
+        socket_path.unlink(missing_ok=True)
+
+
+def _is_listening(socket_path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
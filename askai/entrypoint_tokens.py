@@ -0,0 +1,23 @@
+from pathlib import Path
+
+import click
+
+from .constants import CONFIG_PATH
+from .utils import ConfigHelper, PrintHelper, AvailableModels
+
+
+@click.command()
+@click.argument("prompt")
+@click.option("-m", "--model", type=click.Choice(choices=AvailableModels.members_as_list()), help="OpenAI model to count for. Default: from the config")
+def tokens(prompt: str, model: str) -> None:
+    """Count the tokens of a question."""
+    _tokens(prompt=prompt, model=model)
+
+
+def _tokens(prompt: str, model: str = None, config_path: Path = CONFIG_PATH) -> None:
+    """Separate function for testing"""
+    from .tokenizer import context_tokens, get_tokenizer
+
+    if model is None:
+        model = ConfigHelper.from_file(config_path=config_path).model
+    PrintHelper.tokens(num_tokens=get_tokenizer().count(prompt), model=model, context_tokens=context_tokens(model=model))
@@ -0,0 +1,158 @@
+"""
+Hedged requests: if a request takes longer than most recent requests did, the same request is sent again
+and whichever answers first is used. This cuts the slowest answers, at the cost of a few extra requests.
+"""
+import contextvars
+import json
+import math
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, TypeVar
+
+from .constants import LATENCY_PATH, HEDGE_HISTORY_SIZE, HEDGE_MIN_SAMPLES, HEDGE_PERCENTILE, HEDGE_BUDGET
+
+T = TypeVar("T")
+
+
+class LatencyHistory:
+    """
+    The latencies of the last `size` requests for `key` (e.g. the model), and whether they were hedged.
+    Shared by all askai processes through a small JSON file. Concurrent updates may lose a sample, which is
+    fine for statistics.
+    """
+
+    def __init__(self, key: str, path: Path = LATENCY_PATH, size: int = HEDGE_HISTORY_SIZE):
+        self._key = key
+        self._path = path
+        self._size = size
+        self._samples: Optional[List[List]] = None  # [latency, hedged]
+
+    def delay(self, percentile: float) -> Optional[float]:
+        """The `percentile` of the recent latencies, or None if too few are known"""
+        latencies = sorted(latency for latency, _ in self._load())
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        rank = max(math.ceil(percentile / 100 * len(latencies)), 1)
+        return latencies[rank - 1]
+
+    def can_hedge(self, budget: float) -> bool:
+        """Whether one more hedge keeps the hedged share of the recent requests within `budget`"""
+        samples = self._load()
+        hedged = sum(1 for _, was_hedged in samples if was_hedged)
+        return hedged + 1 <= budget * max(len(samples), self._size)
+
+    def record(self, latency: float, hedged: bool) -> None:
+        try:
+            with open(self._path) as f:
+                history: Dict[str, List[List]] = json.load(f)
+        except (OSError, ValueError):
+            history = {}
+        samples = [*history.get(self._key, []), [latency, hedged]][-self._size:]
+        history[self._key] = samples
+        self._samples = samples
+
+        # Written to a temporary file first, so that readers never see half a file
+        temporary_path = self._path.with_name(f"{self._path.name}.{os.getpid()}.{threading.get_ident()}")
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with open(temporary_path, "w") as f:
+                json.dump(history, f)
+            os.replace(temporary_path, self._path)
+        except OSError:
+            temporary_path.unlink(missing_ok=True)
+
+    def _load(self) -> List[List]:
+        if self._samples is None:
+            try:
+                with open(self._path) as f:
+                    self._samples = list(json.load(f).get(self._key, []))
+            except (OSError, ValueError, AttributeError):
+                self._samples = []
+        return self._samples
+
+
+class Hedger:
+    """
+    Calls a function, and calls it again in parallel if it hasn't returned after the `percentile` of the
+    recent latencies. The first call to return wins; the loser's result is closed (e.g. a streamed response)
+    as soon as it arrives. Hedges are only sent while at most `budget` of the recent requests were hedged.
+
+    When a hedge is possible, both calls run on daemon threads, so a process doesn't wait for the loser
+    before it exits. After each call, `stats` tells whether it was hedged and which call won.
+    """
+
+    def __init__(self,
+                 history: LatencyHistory,
+                 percentile: float = HEDGE_PERCENTILE,
+                 budget: float = HEDGE_BUDGET,
+                 clock: Callable[[], float] = time.monotonic):
+        self._history = history
+        self._percentile = percentile
+        self._budget = budget
+        self._clock = clock
+        self.stats: Dict[str, object] = {}
+
+    def call(self, func: Callable[[], T]) -> T:
+        delay = self._history.delay(percentile=self._percentile) if self._history.can_hedge(budget=self._budget) else None
+        if delay is None:
+            # Nothing to hedge, so the call is made on this thread, with its keep-alive connection
+            started = self._clock()
+            result = func()
+            self.stats = {"hedged": False, "winner": "primary", "hedge_delay": None}
+            self._history.record(latency=self._clock() - started, hedged=False)
+            return result
+
+        results: "queue.Queue" = queue.Queue()
+        decided = threading.Lock()
+        winner: List[str] = []
+
+        def attempt(name: str) -> None:
+            try:
+                result = func()
+            except BaseException as e:
+                results.put((name, None, e))
+                return
+            with decided:
+                if not winner:
+                    results.put((name, result, None))
+                    return
+            _close(result)
+
+        # The calls run in copies of this context, so e.g. `Timings.request` measures their connections
+        started = self._clock()
+        threading.Thread(target=contextvars.copy_context().run, args=(attempt, "primary"), daemon=True,
+                         name="askai-primary").start()
+        attempts = 1
+        try:
+            name, result, error = results.get(timeout=delay)
+        except queue.Empty:
+            threading.Thread(target=contextvars.copy_context().run, args=(attempt, "hedge"), daemon=True,
+                             name="askai-hedge").start()
+            attempts = 2
+            name, result, error = results.get()
+            if error is not None:
+                # The other call might still succeed
+                name, result, error = results.get()
+
+        with decided:
+            winner.append(name)
+        # A result that arrived before the winner was taken is the loser's
+        while not results.empty():
+            _, late_result, _ = results.get_nowait()
+            _close(late_result)
+
+        latency = self._clock() - started
+        self.stats = {"hedged": attempts == 2, "winner": name, "hedge_delay": delay}
+        if error is not None:
+            raise error
+        self._history.record(latency=latency, hedged=attempts == 2)
+        return result
+
+
+def _close(result: object) -> None:
+    close = getattr(result, "close", None)
+    if callable(close):
+        close()
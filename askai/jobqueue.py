@@ -0,0 +1,217 @@
+"""
+A durable queue of prompts, so that many prompts can be answered by worker processes that may crash or be
+restarted without losing or repeating work, and be followed while they run.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from .constants import JOBS_PATH, JOB_VISIBILITY_TIMEOUT, JOB_RETRY_DELAY, JOB_MAX_ATTEMPTS, JOB_THROUGHPUT_WINDOW
+
+JOB_STATES = ("pending", "leased", "done", "failed")
+
+
+@dataclass
+class Job:
+    id: int
+    prompt: str
+    overrides: dict  # Config overrides
+    attempt: int  # 1 for the first lease
+    lease: str
+
+
+class JobQueue:
+    """
+    Jobs in a SQLite database in WAL mode, so that workers lease and finish jobs while others read the status.
+    A job is pending, leased, done or failed.
+
+    A worker leases pending jobs for `visibility_timeout` seconds. When a lease expires, because its worker died
+    or hangs, the job is leased again by the next worker that asks. Only the holder of a job's current lease can
+    finish it, so a result that comes in after the job was leased again is dropped. A failed attempt puts the job
+    back after `retry_delay` seconds, doubling with every attempt, until it failed `max_attempts` times.
+
+    Leases are taken in immediate transactions, which hold the database's write lock from the start, so two
+    workers never lease the same job. WAL needs shared memory between the processes, so the workers must run on
+    the host that has the database on a local disk.
+
+    Thread-safe, but the queue must be created again after a fork.
+    """
+
+    def __init__(self,
+                 path: Path = JOBS_PATH,
+                 visibility_timeout: float = JOB_VISIBILITY_TIMEOUT,
+                 retry_delay: float = JOB_RETRY_DELAY,
+                 max_attempts: int = JOB_MAX_ATTEMPTS,
+                 clock: Callable[[], float] = time.time):
+        self._path = path
+        self._visibility_timeout = visibility_timeout
+        self._retry_delay = retry_delay
+        self._max_attempts = max_attempts
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def submit(self, records: Iterable[Tuple[str, dict]]) -> int:
+        """Add a pending job for every prompt and its config overrides, all or none. Returns the number added"""
+        now = self._clock()
+        with self._transaction() as connection:
+            cursor = connection.executemany(
+                "INSERT INTO jobs (prompt, overrides, state, available, submitted) VALUES (?, ?, 'pending', ?, ?)",
+                ((prompt, json.dumps(overrides), now, now) for prompt, overrides in records)
+            )
+            return max(cursor.rowcount, 0)
+
+    def lease(self, worker: str, limit: int) -> List[Job]:
+        """
+        Lease up to `limit` jobs for `worker`: jobs whose lease expired first, then pending jobs in the order they
+        became available. A job whose lease expired on its last attempt fails instead.
+        """
+        now = self._clock()
+        lease = uuid.uuid4().hex
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET state = 'failed', error = 'The worker did not finish the last attempt in time', "
+                "finished = ?, lease = NULL WHERE state = 'leased' AND available <= ? AND attempts >= ?",
+                (now, now, self._max_attempts)
+            )
+            rows = connection.execute(
+                "SELECT id, prompt, overrides, attempts FROM jobs WHERE state = 'leased' AND available <= ? "
+                "ORDER BY available, id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            rows += connection.execute(
+                "SELECT id, prompt, overrides, attempts FROM jobs WHERE state = 'pending' AND available <= ? "
+                "ORDER BY available, id LIMIT ?",
+                (now, limit - len(rows))
+            ).fetchall()
+            connection.executemany(
+                "UPDATE jobs SET state = 'leased', available = ?, attempts = attempts + 1, lease = ?, worker = ? "
+                "WHERE id = ?",
+                [(now + self._visibility_timeout, lease, worker, row[0]) for row in rows]
+            )
+        return [Job(id=job_id, prompt=prompt, overrides=json.loads(overrides), attempt=attempts + 1, lease=lease)
+                for job_id, prompt, overrides, attempts in rows]
+
+    def finish(self, outcomes: Iterable[Tuple[Job, dict]]) -> int:
+        """
+        Store the results of leased jobs, as returned by `batch.complete`: a result with answers completes its job,
+        and one with an `error` fails the attempt. Returns the number of results stored, without the dropped ones.
+        """
+        now = self._clock()
+        done, retried, failed = [], [], []
+        for job, result in outcomes:
+            if "error" not in result:
+                done.append((json.dumps(result["answers"]), now, job.id, job.lease))
+            elif job.attempt < self._max_attempts:
+                retried.append((result["error"], now + self._retry_delay * 2 ** (job.attempt - 1), job.id, job.lease))
+            else:
+                failed.append((result["error"], now, job.id, job.lease))
+
+        stored = 0
+        with self._transaction() as connection:
+            for statement, rows in [
+                ("UPDATE jobs SET state = 'done', answers = ?, error = NULL, finished = ?, lease = NULL "
+                 "WHERE id = ? AND lease = ?", done),
+                ("UPDATE jobs SET state = 'pending', error = ?, available = ?, lease = NULL "
+                 "WHERE id = ? AND lease = ?", retried),
+                ("UPDATE jobs SET state = 'failed', error = ?, finished = ?, lease = NULL "
+                 "WHERE id = ? AND lease = ?", failed),
+            ]:
+                if rows:
+                    stored += connection.executemany(statement, rows).rowcount
+        return stored
+
+    def has_unfinished(self) -> bool:
+        """Whether any job is pending or leased"""
+        with self._lock:
+            return bool(self._connect().execute(
+                "SELECT EXISTS (SELECT 1 FROM jobs WHERE state IN ('pending', 'leased'))"
+            ).fetchone()[0])
+
+    def retry_failed(self) -> int:
+        """Put all failed jobs back, with a fresh set of attempts. Returns the number of jobs"""
+        now = self._clock()
+        with self._transaction() as connection:
+            return connection.execute(
+                "UPDATE jobs SET state = 'pending', available = ?, attempts = 0, finished = NULL WHERE state = 'failed'",
+                (now,)
+            ).rowcount
+
+    def results(self) -> Iterator[dict]:
+        """The answers of the done jobs and the errors of the failed ones, in the order submitted"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id, prompt, state, answers, error FROM jobs WHERE state IN ('done', 'failed') ORDER BY id"
+            )
+            for job_id, prompt, state, answers, error in rows:
+                if state == "done":
+                    yield {"id": job_id, "prompt": prompt, "answers": json.loads(answers)}
+                else:
+                    yield {"id": job_id, "prompt": prompt, "error": error}
+
+    def status(self, window: float = JOB_THROUGHPUT_WINDOW) -> dict:
+        """
+        The number of jobs in every state, the throughput in jobs per minute over the jobs finished in the last
+        `window` seconds, and the ETA of the unfinished jobs in seconds at that throughput
+        """
+        now = self._clock()
+        with self._lock:
+            connection = self._connect()
+            counts = {state: 0 for state in JOB_STATES}
+            counts.update(connection.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+            finished, first = connection.execute(
+                "SELECT COUNT(*), MIN(finished) FROM jobs WHERE finished >= ?", (now - window,)
+            ).fetchone()
+
+        throughput = finished / (now - first) * 60 if finished > 1 and now > first else None
+        unfinished = counts["pending"] + counts["leased"]
+        if not unfinished:
+            eta = 0.0
+        else:
+            eta = unfinished / throughput * 60 if throughput else None
+        return {**counts, "throughput": throughput, "eta": eta}
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            # Transactions are begun explicitly, and serialized between threads by the lock
+            connection = sqlite3.connect(self._path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "  id INTEGER PRIMARY KEY,"
+                "  prompt TEXT NOT NULL,"
+                "  overrides TEXT NOT NULL,"
+                "  state TEXT NOT NULL,"
+                "  available REAL NOT NULL,"  # When a pending job may be leased, or when a lease expires
+                "  attempts INTEGER NOT NULL DEFAULT 0,"
+                "  lease TEXT,"
+                "  worker TEXT,"
+                "  submitted REAL NOT NULL,"
+                "  finished REAL,"
+                "  answers TEXT,"
+                "  error TEXT"
+                ")"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, available)")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)")
+            self._connection = connection
+        return self._connection
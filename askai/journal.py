@@ -0,0 +1,241 @@
+"""
+Progress journal of batch runs, so that a run that stopped (Ctrl-C, a crash, an API outage) can be resumed without
+paying again for the prompts that were already answered.
+"""
+import hashlib
+import io
+import os
+import sys
+import time
+from array import array
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import accumulate, islice
+from pathlib import Path
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .constants import JOURNAL_SYNC_ENTRIES, JOURNAL_SYNC_INTERVAL, JOURNAL_CHUNK_LINES
+
+_KEY_BYTES = 8  # Keys are 64-bit integers, written in the machine's byte order
+_MAGIC = int.from_bytes(b"askaijnl", "little")  # First word of a compacted journal
+
+
+@dataclass
+class _Chunk:
+    """`JOURNAL_CHUNK_LINES` consecutive input lines, keyed by their text"""
+    key: int
+    answered: array = field(default_factory=lambda: array("Q"))  # Keys of the answered lines
+    unanswered: Set[int] = field(default_factory=set)  # Positions in the chunk of the lines without an answer
+
+
+class Journal:
+    """
+    File of the keys of the input lines whose prompts were answered, 8 bytes per line. A line is keyed by its text,
+    so lines that were added to or removed from the input before resuming don't matter, and identical lines are
+    counted.
+
+    During a run, the keys are appended in batches of `sync_entries`, or after `sync_interval` seconds, and synced
+    to disk after the output. So every line in the journal has its answer in the output, while a few answers right
+    before a stop may be in the output without being in the journal, and are asked again when resuming.
+
+    When the journal is closed, it is rewritten by chunks of `chunk_lines` input lines: the key of the chunk's text,
+    the keys of its answered lines and the positions of the others. A resumed run skips a chunk whose text didn't
+    change in one step, and only looks at the lines without an answer, so resuming doesn't hash every line. Lines
+    of chunks that changed, and the keys appended by a run that crashed, are looked up one by one.
+    """
+
+    def __init__(self,
+                 path: Path,
+                 resume: bool = False,
+                 output: Optional[IO[str]] = None,
+                 sync_entries: int = JOURNAL_SYNC_ENTRIES,
+                 sync_interval: float = JOURNAL_SYNC_INTERVAL,
+                 chunk_lines: int = JOURNAL_CHUNK_LINES,
+                 clock: Callable[[], float] = time.monotonic):
+        self._path = path
+        self._output = output
+        self._sync_entries = sync_entries
+        self._sync_interval = sync_interval
+        self._chunk_lines = chunk_lines
+        self._clock = clock
+
+        # The chunks in the journal by their key, and the keys of answered lines that aren't in a chunk, counted
+        # as a set of the keys and how many more times than once the keys of repeated lines are in it
+        self._groups, self._answered, self._repeats = self._load(path) if resume else ({}, set(), {})
+        self._chunks: List[_Chunk] = []  # Read in this run
+        self._keys: Dict[int, Tuple[_Chunk, int, int]] = {}  # Index -> chunk, position and key of the prompts given out
+        self._buffer: List[int] = []
+        self._last_sync = clock()
+        self._changed = not resume
+        self.skipped = 0
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "ab" if resume else "wb")
+        # Drop a key that was cut off by a crash, so the keys written next are aligned
+        self._file.truncate(self._file.tell() - self._file.tell() % _KEY_BYTES)
+
+    def __enter__(self) -> "Journal":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def unanswered(self, lines: Iterable[str]) -> Iterator[Tuple[int, int, str]]:
+        """Like `batch.number_lines`, but leaves out the lines that are answered in the journal"""
+        lines = iter(lines)
+        index = line_number = 0
+        while True:
+            chunk = list(islice(lines, self._chunk_lines))
+            if not chunk:
+                return
+            key = _key("".join(chunk).encode())
+            same = self._groups.get(key)
+            changed = not same
+            if same:
+                current = same.pop()
+                todo = sorted(current.unanswered)
+                current.unanswered = set()
+            else:
+                current = _Chunk(key=key)
+                todo = range(len(chunk))
+                self._changed = True
+            self._chunks.append(current)
+
+            texts = list(map(str.strip, chunk))
+            # The number of lines with text before every position, if some lines are empty
+            before = None if all(texts) else list(accumulate(map(bool, texts), initial=0))
+            numbered = []
+            for position in todo:
+                if not texts[position]:
+                    continue
+                line = chunk[position].rstrip("\n")
+                line_key = _key(line.encode())
+                if self._take(line_key, changed_chunk=changed):
+                    current.answered.append(line_key)
+                    continue
+                line_index = index + (position if before is None else before[position])
+                current.unanswered.add(position)
+                self._keys[line_index] = (current, position, line_key)
+                numbered.append((line_index, line_number + position + 1, line))
+
+            count = len(chunk) if before is None else before[-1]
+            self.skipped += count - len(numbered)
+            index += count
+            line_number += len(chunk)
+            yield from numbered
+
+    def record(self, result: dict) -> None:
+        """Record the result of a prompt given out by `unanswered`. Only answered prompts go in the journal"""
+        chunk, position, key = self._keys.pop(result["index"])
+        if "error" in result:
+            return
+        chunk.unanswered.discard(position)
+        chunk.answered.append(key)
+        self._changed = True
+        self._buffer.append(key)
+        if len(self._buffer) >= self._sync_entries or self._clock() - self._last_sync >= self._sync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        self._last_sync = self._clock()
+        if not self._buffer:
+            return
+        if self._output is not None:
+            self._output.flush()
+            try:
+                os.fsync(self._output.fileno())
+            except (OSError, ValueError, io.UnsupportedOperation):
+                pass  # Not a file, e.g. a terminal or a pipe
+        self._file.write(array("Q", self._buffer).tobytes())
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._buffer.clear()
+
+    def close(self) -> None:
+        self.sync()
+        self._file.close()
+        if self._changed:
+            self._compact()
+
+    def _take(self, key: int, changed_chunk: bool) -> bool:
+        """Whether the journal has an answer for a line with this key that no other line took yet"""
+        if key not in self._answered and changed_chunk and self._groups:
+            # The answer might be in a chunk that changed since, so from now on every line is looked up by its key
+            for chunks in self._groups.values():
+                for chunk in chunks:
+                    self._add(chunk.answered)
+            self._groups.clear()
+        if key not in self._answered:
+            return False
+        repeats = self._repeats.get(key)
+        if repeats:
+            self._repeats[key] = repeats - 1
+        else:
+            self._answered.discard(key)
+        self._changed = True
+        return True
+
+    def _add(self, keys: Iterable[int]) -> None:
+        for key in keys:
+            if key in self._answered:
+                self._repeats[key] = self._repeats.get(key, 0) + 1
+            else:
+                self._answered.add(key)
+
+    def _compact(self) -> None:
+        """Rewrite the journal by chunks, see the class docstring. Written to a temporary file first, and replaced"""
+        words = array("Q", [_MAGIC, 0])
+        for chunk in self._chunks + [chunk for chunks in self._groups.values() for chunk in chunks]:
+            words.extend((chunk.key, len(chunk.answered), len(chunk.unanswered)))
+            words.extend(chunk.answered)
+            words.extend(sorted(chunk.unanswered))
+        words[1] = len(words) - 2
+        words.extend(self._answered)
+        for key, repeats in self._repeats.items():
+            words.extend([key] * repeats)
+
+        temporary_path = self._path.with_name(f"{self._path.name}.{os.getpid()}")
+        try:
+            with open(temporary_path, "wb") as f:
+                words.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary_path, self._path)
+        except OSError:
+            temporary_path.unlink(missing_ok=True)  # The journal as appended is still complete
+
+    @staticmethod
+    def _load(path: Path) -> Tuple[Dict[int, List[_Chunk]], Set[int], Dict[int, int]]:
+        """The chunks in the journal, and the keys outside of them, see `_answered` and `_repeats`"""
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return {}, set(), {}
+        raw = memoryview(data)[:len(data) - len(data) % _KEY_BYTES]
+        words = raw.cast("Q")
+
+        groups: Dict[int, List[_Chunk]] = {}
+        start = 0
+        if len(words) >= 2 and words[0] == _MAGIC:
+            start = min(2 + words[1], len(words))
+            position = 2
+            while position + 3 <= start:
+                key, num_answered, num_unanswered = words[position:position + 3]
+                position += 3
+                chunk = _Chunk(key=key)
+                chunk.answered.frombytes(raw[position * _KEY_BYTES:(position + num_answered) * _KEY_BYTES])
+                position += num_answered
+                chunk.unanswered = set(words[position:position + num_unanswered])
+                position += num_unanswered
+                groups.setdefault(key, []).append(chunk)
+
+        keys = words[start:]
+        answered = set(keys)
+        if len(answered) == len(keys):
+            return groups, answered, {}
+        return groups, answered, {key: count - 1 for key, count in Counter(keys).items() if count > 1}
+
+
+def _key(data: bytes) -> int:
+    """The 64-bit BLAKE2b hash of a line or a chunk, so different texts practically never share a key"""
+    return int.from_bytes(hashlib.blake2b(data, digest_size=_KEY_BYTES).digest(), sys.byteorder)
@@ -0,0 +1,172 @@
+"""
+A pool of API keys, e.g. of different organizations, that requests are spread over, so the throughput grows with
+the number of keys instead of stopping at the rate limits of one.
+"""
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .constants import API_KEY_PATH, KEYS_PATH, KEY_HEALTH_PATH, RATE_LIMIT_PATH, DEFAULT_KEY_NAME, \
+    KEY_QUARANTINE_RATE_LIMIT, KEY_QUARANTINE_REJECTED
+from .ratelimit import RateLimiter
+from .retry import retry_after
+from .utils import KeyHelper, _key_hash
+
+
+@dataclass
+class PooledKey:
+    name: str
+    key: str
+    organization: Optional[str] = None
+    requests_per_minute: int = 0  # 0: no limit
+    tokens_per_minute: int = 0
+
+
+def load_keys(api_key_path: Path = API_KEY_PATH, keys_path: Path = KEYS_PATH) -> List[PooledKey]:
+    """The default key, if there is one, and the keys added with a name"""
+    keys = []
+    if api_key_path.is_file():
+        keys.append(PooledKey(name=DEFAULT_KEY_NAME, key=api_key_path.read_text(encoding="utf8").strip()))
+    for name, value in KeyHelper.named_keys(keys_path=keys_path).items():
+        keys.append(PooledKey(
+            name=name,
+            key=value["key"],
+            organization=value.get("organization"),
+            requests_per_minute=value.get("requests_per_minute") or 0,
+            tokens_per_minute=value.get("tokens_per_minute") or 0
+        ))
+    return keys
+
+
+class KeyHealth:
+    """
+    Which keys are quarantined, and until when. Shared by all askai processes through a small JSON file, by a
+    hash of the key. Concurrent updates may lose a quarantine, which only costs another failed request.
+    """
+
+    def __init__(self, path: Path = KEY_HEALTH_PATH, clock: Callable[[], float] = time.time):
+        self._path = path
+        self._clock = clock
+
+    def quarantined_until(self, key: PooledKey) -> Optional[float]:
+        """When the key may be used again, if it's quarantined now"""
+        entry = self._load().get(_key_hash(key.key))
+        if not isinstance(entry, dict) or not isinstance(entry.get("until"), (int, float)):
+            return None
+        return entry["until"] if entry["until"] > self._clock() else None
+
+    def reason(self, key: PooledKey) -> Optional[str]:
+        if self.quarantined_until(key) is None:
+            return None
+        return self._load()[_key_hash(key.key)].get("reason")
+
+    def quarantine(self, key: PooledKey, seconds: float, reason: str) -> None:
+        now = self._clock()
+        health = {key_hash: entry for key_hash, entry in self._load().items()
+                  if isinstance(entry, dict) and isinstance(entry.get("until"), (int, float)) and entry["until"] > now}
+        health[_key_hash(key.key)] = {"until": now + seconds, "reason": reason}
+
+        # Written to a temporary file first, so that readers never see half a file
+        temporary_path = self._path.with_name(f"{self._path.name}.{os.getpid()}.{threading.get_ident()}")
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with open(temporary_path, "w") as f:
+                json.dump(health, f)
+            os.replace(temporary_path, self._path)
+        except OSError:
+            temporary_path.unlink(missing_ok=True)
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self._path) as f:
+                health = json.load(f)
+            return health if isinstance(health, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+
+class KeyPool:
+    """
+    Picks a key for every request: among the keys that aren't quarantined, the one whose own rate limits let
+    the request go soonest, taking turns between equally good keys. Then waits for that key's limits, which
+    are shared by all askai processes on the host like the limits in the config.
+
+    A key that hits a rate limit is quarantined for as long as the server asks, or KEY_QUARANTINE_RATE_LIMIT
+    seconds, and a rejected key or one without quota for KEY_QUARANTINE_REJECTED seconds. If every key is
+    quarantined, the one that is released first is used anyway.
+    """
+
+    def __init__(self,
+                 keys: List[PooledKey],
+                 health: Optional[KeyHealth] = None,
+                 rate_limit_path: Path = RATE_LIMIT_PATH,
+                 clock: Callable[[], float] = time.time,
+                 sleep: Callable[[float], None] = time.sleep):
+        if not keys:
+            raise ValueError("A key pool needs at least one key")
+        self._keys = keys
+        self._health = health if health else KeyHealth(clock=clock)
+        self._limiters = {
+            key.name: RateLimiter(
+                requests_per_minute=key.requests_per_minute,
+                tokens_per_minute=key.tokens_per_minute,
+                # Named by the key, since a name may hold characters a file name can't
+                state_path=rate_limit_path.with_name(f"{rate_limit_path.name}.{_key_hash(key.key)[:16]}"),
+                clock=clock,
+                sleep=sleep
+            )
+            for key in keys
+        }
+        self._lock = threading.Lock()
+        self._turn = 0
+
+    @classmethod
+    def load(cls, api_key_path: Path = API_KEY_PATH, keys_path: Path = KEYS_PATH, **kwargs) -> Optional["KeyPool"]:
+        """The pool of the default key and the named keys, or None if no key has a name (the usual single key)"""
+        keys = load_keys(api_key_path=api_key_path, keys_path=keys_path)
+        if not any(key.name != DEFAULT_KEY_NAME for key in keys):
+            return None
+        return cls(keys=keys, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def available(self) -> int:
+        """The number of keys that aren't quarantined"""
+        return sum(1 for key in self._keys if self._health.quarantined_until(key) is None)
+
+    def acquire(self, tokens: int) -> PooledKey:
+        """Pick a key for a request using `tokens` tokens, and wait until it's within the key's limits"""
+        quarantined = {key.name: self._health.quarantined_until(key) for key in self._keys}
+        healthy = [key for key in self._keys if quarantined[key.name] is None]
+        if not healthy:
+            healthy = [min(self._keys, key=lambda key: quarantined[key.name])]
+
+        with self._lock:
+            start = self._turn % len(healthy)
+            self._turn += 1
+        in_turn = healthy[start:] + healthy[:start]
+        key = min(in_turn, key=lambda key: self._limiters[key.name].delay(tokens=tokens))
+        self._limiters[key.name].acquire(tokens=tokens)
+        return key
+
+    def report(self, key: PooledKey, error: Exception) -> bool:
+        """Quarantine the key if `error` was its fault. Returns whether another key might succeed"""
+        from openai import error as openai_error
+
+        if isinstance(error, openai_error.RateLimitError):
+            if error.code == "insufficient_quota":
+                self._health.quarantine(key=key, seconds=KEY_QUARANTINE_REJECTED, reason="no quota left")
+            else:
+                seconds = retry_after(error)
+                self._health.quarantine(key=key, seconds=seconds if seconds else KEY_QUARANTINE_RATE_LIMIT,
+                                        reason="rate limited")
+            return True
+        if isinstance(error, (openai_error.AuthenticationError, openai_error.PermissionError)):
+            self._health.quarantine(key=key, seconds=KEY_QUARANTINE_REJECTED, reason="rejected")
+            return True
+        return False
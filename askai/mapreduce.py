@@ -0,0 +1,214 @@
+"""
+Answers a question about a text that is too long for the model: the text is split into chunks that each
+fit into a prompt, every chunk is asked the question ("map"), and the answers are combined a few at a time
+until a single answer is left ("reduce").
+
+Only a few chunks and partial answers are held in memory at a time, however long the text is.
+"""
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from itertools import chain
+from typing import IO, Callable, Deque, Iterable, Iterator, List, Optional
+
+from .aimd import AIMDController
+from .batch import BatchPrompt, complete
+from .client import Client
+from .constants import MAP_REDUCE_READ_SIZE, MAP_REDUCE_MARGIN
+from .pipeline import Pipeline
+from .ratelimit import RateLimiter
+from .retry import CircuitBreaker
+from .tokenizer import Tokenizer, context_tokens, get_tokenizer
+from .utils import ConfigHelper
+
+NOTHING_RELEVANT = "Nothing relevant."
+
+MAP_PROMPT = (
+    "{text}\n\n"
+    "Answer the question using only the text above. If the text doesn't help, answer \"{nothing}\"\n"
+    "Question: {question}\n"
+    "Answer:"
+)
+
+REDUCE_PROMPT = (
+    "Answers to a question, each based on a different part of the same document:\n\n"
+    "{answers}\n\n"
+    "Combine them into a single answer to the question.\n"
+    "Question: {question}\n"
+    "Answer:"
+)
+
+
+class MapReduceError(Exception):
+    """Raised when a chunk of the text couldn't be answered"""
+
+
+def read_pieces(file: IO[str], size: int = MAP_REDUCE_READ_SIZE) -> Iterator[str]:
+    """
+    Read the file in pieces of about `size` characters, even if it has no line breaks. Pieces end before
+    whitespace, so that words aren't split between pieces.
+    """
+    carry = ""
+    while True:
+        block = file.read(size)
+        if not block:
+            break
+        block = carry + block
+        split = max(block.rfind(" "), block.rfind("\n"), block.rfind("\t"))
+        if split <= 0:
+            carry = ""
+            yield block
+        else:
+            carry = block[split:]
+            yield block[:split]
+    if carry:
+        yield carry
+
+
+def chunk(pieces: Iterable[str], tokenizer: Tokenizer, chunk_tokens: int, overlap: int) -> Iterator[str]:
+    """
+    Join the pieces into chunks of at most `chunk_tokens` tokens, each starting with the last `overlap` tokens of
+    the one before. Chunks are cut between characters, so a character that takes several tokens may make a chunk
+    a few tokens shorter, or its overlap a few tokens longer.
+    """
+    def character_start(tokens: List[int], position: int) -> int:
+        while position > 0 and not tokenizer.starts_character(tokens[position]):
+            position -= 1
+        return position
+
+    tokens: List[int] = []
+    carried = 0  # Tokens at the start of `tokens` that are already part of the previous chunk
+    for piece in pieces:
+        tokens.extend(tokenizer.encode(piece))
+        while len(tokens) > chunk_tokens:
+            end = character_start(tokens, chunk_tokens)
+            start = character_start(tokens, end - overlap)
+            yield tokenizer.decode(tokens[:end])
+            tokens = tokens[start:]
+            carried = end - start
+    if len(tokens) > carried:
+        yield tokenizer.decode(tokens)
+
+
+class Reducer:
+    """
+    Combines partial answers, in order, with `reduce` as soon as there are enough to fill a prompt of `budget`
+    tokens. Combined answers are combined again in the same way, one level up. At most one group of answers
+    per level is kept.
+    """
+
+    def __init__(self, reduce: Callable[[List[str]], str], count: Callable[[str], int], budget: int):
+        self._reduce = reduce
+        self._count = count
+        self._budget = budget
+        self._levels: List[List[str]] = []
+        self._level_tokens: List[int] = []
+
+    def add(self, answer: str, level: int = 0) -> None:
+        if level == len(self._levels):
+            self._levels.append([])
+            self._level_tokens.append(0)
+
+        tokens = self._count(answer)
+        if self._levels[level] and self._level_tokens[level] + tokens > self._budget:
+            combined = self._reduce(self._levels[level])
+            self._levels[level], self._level_tokens[level] = [], 0
+            self.add(combined, level=level + 1)
+        self._levels[level].append(answer)
+        self._level_tokens[level] += tokens
+
+    def finish(self) -> List[str]:
+        """Reduce the remaining answers until they fit into a single prompt, and return them in order"""
+        answers = [answer for level in reversed(self._levels) for answer in level]  # Higher levels came first
+        self._levels, self._level_tokens = [], []
+        while sum(self._count(answer) for answer in answers) > self._budget:
+            for answer in answers:
+                self.add(answer)
+            combined = [answer for level in reversed(self._levels) for answer in level]
+            self._levels, self._level_tokens = [], []
+            if len(combined) >= len(answers):
+                break  # The answers are too long to be combined with each other
+            answers = combined
+        return answers
+
+
+def map_reduce(question: str,
+               file: IO[str],
+               config: ConfigHelper,
+               stream: bool,
+               concurrency: int,
+               overlap: int,
+               controller: Optional[AIMDController] = None):
+    """
+    Answer `question` about the text in `file`, and return the response of the final request.
+
+    The chunks are answered with up to `concurrency` requests in flight. Partial answers are reduced in order as
+    they arrive, on a thread of their own, so that new chunks are sent while a reduce request is made. With a
+    `controller`, the requests in flight adapt to the API's capacity, up to `concurrency`.
+    """
+    tokenizer = get_tokenizer()
+    answer_config = config.with_overrides(num_answers=1)
+    template_tokens = tokenizer.count(MAP_PROMPT.format(text="", nothing=NOTHING_RELEVANT, question=question))
+    chunk_tokens = context_tokens(model=config.model) - config.max_tokens - template_tokens - MAP_REDUCE_MARGIN
+    reduce_budget = context_tokens(model=config.model) - config.max_tokens - MAP_REDUCE_MARGIN - \
+        tokenizer.count(REDUCE_PROMPT.format(answers="", question=question))
+    if chunk_tokens <= 2 * overlap or reduce_budget < 2 * config.max_tokens:
+        raise MapReduceError(f"max_tokens={config.max_tokens} leaves too little room for the text with {config.model}. "
+                             f"Please lower max_tokens or --overlap.")
+
+    chunks = chunk(pieces=read_pieces(file), tokenizer=tokenizer, chunk_tokens=chunk_tokens, overlap=overlap)
+    first = next(chunks, "")
+    second = next(chunks, None)
+    circuit_breaker = CircuitBreaker()
+    rate_limiter = RateLimiter(requests_per_minute=config.requests_per_minute, tokens_per_minute=config.tokens_per_minute)
+    client = Client(config=answer_config, circuit_breaker=circuit_breaker, rate_limiter=rate_limiter,
+                    controller=controller)
+    if second is None:
+        # The text fits into a single prompt
+        return client.create(prompt=MAP_PROMPT.format(text=first, nothing=NOTHING_RELEVANT, question=question), stream=stream)
+
+    def reduce(answers: List[str]) -> str:
+        response = client.create(prompt=REDUCE_PROMPT.format(answers="\n\n".join(answers), question=question))
+        return response["choices"][0]["text"].strip()
+
+    # Every answer also takes the blank line in between, which is one token
+    reducer = Reducer(reduce=reduce, count=lambda answer: tokenizer.count(answer) + 1, budget=reduce_budget)
+
+    reduce_executor = ThreadPoolExecutor(max_workers=1)
+    reductions: Deque[Future] = deque()
+
+    def emit(result: dict) -> None:
+        if "error" in result:
+            raise MapReduceError(f"Part {result['index'] + 1} of the text couldn't be answered: {result['error']}")
+        while reductions and reductions[0].done():
+            reductions.popleft().result()  # Raises the error of a failed reduce request
+        answer = result["answers"][0].strip()
+        if answer and answer != NOTHING_RELEVANT:
+            reductions.append(reduce_executor.submit(reducer.add, answer))
+
+    def map_prompts() -> Iterator[BatchPrompt]:
+        for idx, text in enumerate(chain([first, second], chunks)):
+            yield BatchPrompt(
+                index=idx,
+                prompt=MAP_PROMPT.format(text=text, nothing=NOTHING_RELEVANT, question=question),
+                config=answer_config
+            )
+
+    pipeline = Pipeline(
+        complete=partial(complete, circuit_breaker=circuit_breaker, rate_limiter=rate_limiter, controller=controller),
+        emit=emit,
+        concurrency=concurrency,
+        batch_size=1,
+        ordered=True,
+        controller=controller
+    )
+    try:
+        pipeline.run(prompts=map_prompts())
+        for reduction in reductions:
+            reduction.result()
+    finally:
+        reduce_executor.shutdown(cancel_futures=True)
+
+    answers = reducer.finish() or [NOTHING_RELEVANT]
+    return client.create(prompt=REDUCE_PROMPT.format(answers="\n\n".join(answers), question=question), stream=stream)
+
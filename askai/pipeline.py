@@ -0,0 +1,123 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .aimd import AIMDController
+from .batch import BatchPrompt, Packer, ReorderBuffer
+from .constants import BATCH_MAX_PROMPTS, ORDERED_WINDOW_FACTOR
+
+
+class Pipeline:
+    """
+    Answers a stream of prompts with at most `concurrency` requests in flight, and emits the results as they finish.
+
+    The requests are made by a pool of `concurrency` threads. Every thread keeps its own keep-alive HTTPS session,
+    so the connections are reused between requests. The prompts are read in a separate thread, so results are
+    emitted while waiting for more input.
+
+    With a `controller`, the number of requests in flight follows its window, up to `concurrency`.
+
+    With `ordered`, the results are emitted in input order. At most `window` prompts are either in flight or
+    waiting in the reorder buffer. When the window is full, new input is not read until the oldest result is done.
+    The prompts' indices may have gaps, e.g. when a resumed batch leaves out the answered prompts.
+
+    With `max_wait`, a group that is not full is sent once its first prompt waited `max_wait` seconds, instead of
+    when the input ends, e.g. so that a job with a rare config is answered before its lease expires.
+    """
+
+    def __init__(self,
+                 complete: Callable[[List[BatchPrompt]], List[dict]],
+                 emit: Callable[[dict], None],
+                 concurrency: int = 1,
+                 batch_size: int = BATCH_MAX_PROMPTS,
+                 ordered: bool = False,
+                 window: Optional[int] = None,
+                 controller: Optional[AIMDController] = None,
+                 max_wait: Optional[float] = None):
+        self._complete = complete
+        self._emit = emit
+        self._concurrency = concurrency
+        self._batch_size = batch_size
+        self._ordered = ordered
+        self._window = window if window else concurrency * batch_size * ORDERED_WINDOW_FACTOR
+        self._controller = controller
+        self._max_wait = max_wait
+
+        self._in_flight: Dict[asyncio.Future, int] = {}  # Request -> number of prompts
+        self._reorder_buffer = ReorderBuffer()
+        self._indices: Dict[int, int] = {}  # Position in the input -> index, of the prompts in the reorder window
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def run(self, prompts: Iterable[BatchPrompt]) -> None:
+        asyncio.run(self.run_async(prompts=prompts))
+
+    async def run_async(self, prompts: Iterable[BatchPrompt]) -> None:
+        loop = asyncio.get_running_loop()
+        prompts = iter(prompts)
+        packer = Packer(max_prompts=self._batch_size)
+        position = 0
+
+        with ThreadPoolExecutor(max_workers=self._concurrency) as self._executor, \
+                ThreadPoolExecutor(max_workers=1) as reader:
+            try:
+                while True:
+                    prompt = await loop.run_in_executor(reader, next, prompts, None)
+                    if prompt is None:
+                        break
+                    if self._ordered:
+                        # Reordered by position, so gaps in the indices don't hold back the results after them
+                        self._indices[position] = prompt.index
+                        prompt = replace(prompt, index=position)
+                        position += 1
+
+                    group = packer.add(prompt)
+                    if group is not None:
+                        await self._submit(group)
+                    if self._max_wait is not None:
+                        for group in packer.expired(max_wait=self._max_wait):
+                            await self._submit(group)
+
+                    if self._ordered and self._occupied() >= self._window:
+                        # The oldest prompt might wait in a group that is not full, so send all groups
+                        for group in packer.flush():
+                            await self._submit(group)
+                        while self._in_flight and self._occupied() >= self._window:
+                            await self._wait()
+
+                for group in packer.flush():
+                    await self._submit(group)
+                while self._in_flight:
+                    await self._wait()
+            finally:
+                for future in self._in_flight:
+                    future.cancel()
+
+    def _limit(self) -> int:
+        """The number of requests that may be in flight now"""
+        if self._controller is None:
+            return self._concurrency
+        return min(self._controller.window, self._concurrency)
+
+    def _occupied(self) -> int:
+        """Number of prompts that are either in flight or waiting in the reorder buffer"""
+        return sum(self._in_flight.values()) + len(self._reorder_buffer)
+
+    async def _submit(self, group: List[BatchPrompt]) -> None:
+        while len(self._in_flight) >= self._limit():
+            await self._wait()
+
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self._complete, group)
+        self._in_flight[future] = len(group)
+
+    async def _wait(self) -> None:
+        """Wait for at least one request to finish and emit its results"""
+        done, _ = await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+        for future in done:
+            del self._in_flight[future]
+            for result in future.result():
+                if self._ordered:
+                    for ready in self._reorder_buffer.add(result):
+                        self._emit({**ready, "index": self._indices.pop(ready["index"])})
+                else:
+                    self._emit(result)
@@ -0,0 +1,122 @@
+import math
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Union
+
+from .constants import RATE_LIMIT_PATH, CHARACTERS_PER_TOKEN
+
+try:
+    import fcntl
+except ImportError:  # Windows, where the limiter is only shared between threads of the same process
+    fcntl = None
+
+# Requests available, tokens available, time of last update
+_STATE = struct.Struct("<ddd")
+
+# Per state file, for the threads of this process. Without fcntl, that is the only lock
+_THREAD_LOCKS: Dict[Path, threading.Lock] = {}
+_THREAD_LOCKS_LOCK = threading.Lock()
+
+
+def _thread_lock(state_path: Path) -> threading.Lock:
+    with _THREAD_LOCKS_LOCK:
+        return _THREAD_LOCKS.setdefault(state_path.absolute(), threading.Lock())
+
+
+def estimate_tokens(prompt: Union[str, List[str]], max_tokens: int, num_answers: int) -> int:
+    """Upper estimate of the tokens a request will use: the prompt(s) plus `max_tokens` for every answer"""
+    prompts = [prompt] if isinstance(prompt, str) else prompt
+    prompt_tokens = sum(math.ceil(len(p) / CHARACTERS_PER_TOKEN) for p in prompts)
+    return prompt_tokens + max_tokens * num_answers * len(prompts)
+
+
+class RateLimiter:
+    """
+    Client-side token buckets for requests per minute and tokens per minute, shared by all askai processes
+    on the host through a small state file that is locked while it is updated.
+
+    A request reserves its budget immediately, even if the buckets go negative, and then waits until the
+    buckets have been refilled to zero. Requests are therefore served in the order they arrive, and a
+    waiting process never needs to touch the file again. A limit of 0 disables that bucket.
+    """
+
+    def __init__(self,
+                 requests_per_minute: int,
+                 tokens_per_minute: int,
+                 state_path: Path = RATE_LIMIT_PATH,
+                 clock: Callable[[], float] = time.time,
+                 sleep: Callable[[float], None] = time.sleep):
+        self._requests_per_minute = requests_per_minute
+        self._tokens_per_minute = tokens_per_minute
+        self._state_path = state_path
+        self._clock = clock
+        self._sleep = sleep
+        self._thread_lock = _thread_lock(state_path)
+
+    @property
+    def enabled(self) -> bool:
+        return self._requests_per_minute > 0 or self._tokens_per_minute > 0
+
+    def acquire(self, tokens: int) -> float:
+        """Wait until a request using `tokens` tokens is within the limits. Returns the number of seconds waited."""
+        if not self.enabled:
+            return 0.0
+
+        wait = self._reserve(tokens=tokens)
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def delay(self, tokens: int) -> float:
+        """How many seconds a request using `tokens` tokens would wait now, without reserving anything"""
+        if not self.enabled:
+            return 0.0
+        return self._reserve(tokens=tokens, commit=False)
+
+    def _reserve(self, tokens: int, commit: bool = True) -> float:
+        self._state_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._thread_lock:
+            fd = os.open(self._state_path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+
+                now = self._clock()
+                data = os.read(fd, _STATE.size)
+                if len(data) == _STATE.size:
+                    requests_available, tokens_available, updated = _STATE.unpack(data)
+                else:
+                    requests_available, tokens_available, updated = \
+                        self._requests_per_minute, self._tokens_per_minute, now
+
+                elapsed = max(now - updated, 0.0)
+                requests_available = self._take(requests_available, self._requests_per_minute, elapsed, amount=1)
+                tokens_available = self._take(tokens_available, self._tokens_per_minute, elapsed, amount=tokens)
+
+                if commit:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    os.write(fd, _STATE.pack(requests_available, tokens_available, now))
+            finally:
+                os.close(fd)  # Also releases the file lock
+
+        return max(
+            self._time_to_zero(requests_available, self._requests_per_minute),
+            self._time_to_zero(tokens_available, self._tokens_per_minute)
+        )
+
+    @staticmethod
+    def _take(available: float, per_minute: int, elapsed: float, amount: int) -> float:
+        """Refill the bucket for the elapsed time and take `amount` from it"""
+        if per_minute <= 0:
+            return 0.0
+        # A request larger than the whole bucket could never fit, so it only has to wait for a full bucket
+        return min(available + per_minute * elapsed / 60, per_minute) - min(amount, per_minute)
+
+    @staticmethod
+    def _time_to_zero(available: float, per_minute: int) -> float:
+        if per_minute <= 0 or available >= 0:
+            return 0.0
+        return -available * 60 / per_minute
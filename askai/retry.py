@@ -0,0 +1,143 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional, TypeVar
+
+from .constants import (
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_RETRY_TIMEOUT,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    CIRCUIT_BREAKER_THRESHOLD,
+    CIRCUIT_BREAKER_COOLDOWN
+)
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a request when too many requests in a row have failed"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a request that failed with `error` might succeed if it is made again"""
+    from openai import error as openai_error
+
+    if isinstance(error, openai_error.RateLimitError):
+        # Running out of quota is reported as a rate limit, but waiting doesn't help
+        return error.code != "insufficient_quota"
+    if isinstance(error, (openai_error.APIConnectionError,
+                          openai_error.Timeout,
+                          openai_error.TryAgain,
+                          openai_error.ServiceUnavailableError)):
+        return True
+    if isinstance(error, openai_error.APIError):
+        return error.http_status is None or error.http_status >= 500
+    return False
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Number of seconds the server asked us to wait before retrying, if any"""
+    headers = {key.lower(): value for key, value in (getattr(error, "headers", None) or {}).items()}
+    try:
+        if "retry-after-ms" in headers:
+            return max(float(headers["retry-after-ms"]) / 1000, 0.0)
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return max(float(value), 0.0)
+            except ValueError:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `threshold` failed requests in a row. After `cooldown` seconds, one request is let
+    through to probe the API: if it succeeds the breaker closes again, otherwise it stays open.
+    """
+
+    def __init__(self,
+                 threshold: int = CIRCUIT_BREAKER_THRESHOLD,
+                 cooldown: float = CIRCUIT_BREAKER_COOLDOWN,
+                 clock: Callable[[], float] = time.monotonic):
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+
+    def before_request(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._clock() - self._opened_at < self._cooldown:
+                raise CircuitOpenError(f"{self._consecutive_failures} requests in a row failed. "
+                                       f"Not trying again for {self._cooldown:.0f} seconds.")
+            self._opened_at = self._clock()  # Let this request probe, hold back the others
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self._threshold:
+                self._opened_at = self._clock()
+
+
+class Retrier:
+    """
+    Retries failed requests with exponential backoff and full jitter, or as long as the server asks for
+    with a `Retry-After` header. Gives up when an error isn't retryable, after `max_retries` retries, or
+    when the next attempt would start more than `timeout` seconds after the first one.
+    """
+
+    def __init__(self,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 timeout: float = DEFAULT_RETRY_TIMEOUT,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 base_delay: float = RETRY_BASE_DELAY,
+                 max_delay: float = RETRY_MAX_DELAY,
+                 sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        self._max_retries = max_retries
+        self._timeout = timeout
+        self._circuit_breaker = circuit_breaker if circuit_breaker else CircuitBreaker(clock=clock)
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._sleep = sleep
+        self._clock = clock
+
+    def call(self, func: Callable[..., T], *args, **kwargs) -> T:
+        deadline = self._clock() + self._timeout
+        attempt = 0
+        while True:
+            self._circuit_breaker.before_request()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                self._circuit_breaker.record_failure()
+
+                delay = self._delay(attempt=attempt, error=e)
+                if attempt >= self._max_retries or self._clock() + delay > deadline:
+                    raise
+                self._sleep(delay)
+                attempt += 1
+            else:
+                self._circuit_breaker.record_success()
+                return result
+
+    def _delay(self, attempt: int, error: Exception) -> float:
+        server_delay = retry_after(error)
+        if server_delay is not None:
+            return server_delay
+        return random.uniform(0, min(self._max_delay, self._base_delay * 2 ** attempt))
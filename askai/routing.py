@@ -0,0 +1,198 @@
+"""
+`--model auto`: picks a model for every prompt.
+
+User-defined routes in the config are tried first, in order. Otherwise the prompt is sorted by its tokens and
+`max_tokens` into "short", "medium" or "long", which start at ada, curie and davinci. A model is skipped
+when too many of its recent answers for prompts of that size were empty or failed, and a faster model is
+preferred when the local history shows one. Only models whose context fits the prompt are considered.
+"""
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .constants import ROUTING_PATH, AUTO_SHORT_PROMPT_TOKENS, AUTO_SHORT_MAX_TOKENS, AUTO_MEDIUM_TOKENS, \
+    AUTO_MIN_SAMPLES, AUTO_MIN_QUALITY, AUTO_SMOOTHING
+from .tokenizer import context_tokens, get_tokenizer
+from .utils import AvailableModels, ConfigHelper
+
+# Cheapest and fastest first
+MODELS = AvailableModels.members_as_list()
+STARTING_MODELS = {"short": "text-ada-001", "medium": "text-curie-001", "long": "text-davinci-003"}
+LONGEST_CONTEXT_MODEL = max(MODELS, key=lambda model: context_tokens(model=model))
+ROUTE_FIELDS = {"model", "pattern", "max_prompt_tokens", "max_tokens"}
+
+
+@dataclass
+class Choice:
+    model: str
+    reason: str
+    size: Optional[str] = None  # None if chosen by a route, and not by the history
+
+
+@dataclass
+class Route:
+    """Use `model` for prompts matching `pattern` (a regular expression), and/or with at most `max_prompt_tokens`
+    tokens and `max_tokens` requested"""
+    model: str
+    pattern: Optional[str] = None
+    max_prompt_tokens: Optional[int] = None
+    max_tokens: Optional[int] = None
+
+    def matches(self, prompt: str, prompt_tokens: int, max_tokens: int) -> bool:
+        return (self.pattern is None or re.search(self.pattern, prompt) is not None) and \
+            (self.max_prompt_tokens is None or prompt_tokens <= self.max_prompt_tokens) and \
+            (self.max_tokens is None or max_tokens <= self.max_tokens)
+
+
+def validate_routes(routes: object) -> None:
+    """Raise a ValueError if `routes` from the config isn't a list of valid routes"""
+    if not isinstance(routes, list):
+        raise ValueError("routes must be a list")
+    for idx, route in enumerate(routes, start=1):
+        if not isinstance(route, dict) or route.get("model") not in MODELS:
+            raise ValueError(f"route {idx} must have a model, one of {', '.join(MODELS)}")
+        unknown_fields = set(route) - ROUTE_FIELDS
+        if unknown_fields:
+            raise ValueError(f"route {idx} has unknown fields: {', '.join(sorted(unknown_fields))}")
+        for name in ("max_prompt_tokens", "max_tokens"):
+            value = route.get(name)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 0):
+                raise ValueError(f"route {idx}: {name} must be an integer >= 0")
+        if "pattern" in route:
+            try:
+                re.compile(route["pattern"])
+            except (re.error, TypeError):
+                raise ValueError(f"route {idx}: pattern must be a valid regular expression")
+
+
+def size(prompt_tokens: int, max_tokens: int) -> str:
+    if prompt_tokens <= AUTO_SHORT_PROMPT_TOKENS and max_tokens <= AUTO_SHORT_MAX_TOKENS:
+        return "short"
+    return "medium" if prompt_tokens + max_tokens <= AUTO_MEDIUM_TOKENS else "long"
+
+
+class RoutingHistory:
+    """
+    Per prompt size and model: how many answers were seen, and the smoothed time to a full answer and share
+    of good answers (not empty, no error). Shared by all askai processes through a small JSON file.
+    """
+
+    def __init__(self, path: Path = ROUTING_PATH):
+        self._path = path
+        self._history: Optional[Dict[str, Dict[str, dict]]] = None
+        self._lock = threading.Lock()  # Batch requests record their answers from several threads
+
+    def stats(self, size: str, model: str) -> Optional[dict]:
+        with self._lock:
+            return self._load().get(size, {}).get(model)
+
+    def record(self, choice: Choice, seconds: Optional[float], good: bool) -> None:
+        """
+        Record an answer by the chosen model. `seconds` is None for failed requests, whose time says nothing
+        about the model. Models chosen by a route aren't recorded, since the history didn't choose them.
+        """
+        self.record_all(answers=[(choice, seconds, good)])
+
+    def record_all(self, answers: Iterable[Tuple[Choice, Optional[float], bool]]) -> None:
+        """Record several answers like `record`, e.g. those of a batch request, writing the file once"""
+        answers = [(choice, seconds, good) for choice, seconds, good in answers if choice.size is not None]
+        if not answers:
+            return
+        with self._lock:
+            self._history = None  # Other processes might have recorded answers in the meantime
+            history = self._load()
+            for choice, seconds, good in answers:
+                stats = history.setdefault(choice.size, {}).setdefault(choice.model, {"answers": 0, "seconds": None, "quality": 1.0})
+                stats["answers"] += 1
+                stats["quality"] += AUTO_SMOOTHING * (float(good) - stats["quality"])
+                if seconds is not None:
+                    stats["seconds"] = seconds if stats["seconds"] is None else \
+                        stats["seconds"] + AUTO_SMOOTHING * (seconds - stats["seconds"])
+
+            # Written to a temporary file first, so that readers never see half a file
+            temporary_path = self._path.with_name(f"{self._path.name}.{os.getpid()}.{threading.get_ident()}")
+            try:
+                self._path.parent.mkdir(parents=True, exist_ok=True)
+                with open(temporary_path, "w") as f:
+                    json.dump(history, f)
+                os.replace(temporary_path, self._path)
+            except OSError:
+                temporary_path.unlink(missing_ok=True)
+
+    def _load(self) -> Dict[str, Dict[str, dict]]:
+        if self._history is None:
+            try:
+                with open(self._path) as f:
+                    history = json.load(f)
+                self._history = history if isinstance(history, dict) else {}
+            except (OSError, ValueError):
+                self._history = {}
+        return self._history
+
+
+class ModelRouter:
+    def __init__(self, routes: List[dict], history: RoutingHistory):
+        self._routes = [Route(**route) for route in routes]
+        self._history = history
+
+    def choose(self, prompt: str, max_tokens: int) -> Choice:
+        # Every token is at least a byte, so short prompts are counted without loading the tokenizer
+        prompt_tokens = len(prompt.encode("utf8"))
+        if prompt_tokens > AUTO_SHORT_PROMPT_TOKENS:
+            prompt_tokens = get_tokenizer().count(prompt)
+
+        for idx, route in enumerate(self._routes, start=1):
+            if route.matches(prompt=prompt, prompt_tokens=prompt_tokens, max_tokens=max_tokens):
+                return Choice(model=route.model, reason=f"route {idx}")
+
+        prompt_size = size(prompt_tokens=prompt_tokens, max_tokens=max_tokens)
+        fitting = [model for model in MODELS if prompt_tokens + max_tokens <= context_tokens(model=model)]
+        if not fitting:
+            return Choice(model=LONGEST_CONTEXT_MODEL, reason="longest context")
+        start = MODELS.index(STARTING_MODELS[prompt_size])
+        candidates = [model for model in fitting if MODELS.index(model) >= start] or fitting[-1:]
+
+        reason = f"{prompt_size} prompt"
+        known = {model: self._history.stats(size=prompt_size, model=model) for model in candidates}
+        known = {model: stats for model, stats in known.items() if stats and stats["answers"] >= AUTO_MIN_SAMPLES}
+        good = [model for model in candidates if model not in known or known[model]["quality"] >= AUTO_MIN_QUALITY]
+        if not good:
+            return Choice(model=candidates[-1], reason=f"{reason}, no model answered well", size=prompt_size)
+        if good[0] != candidates[0]:
+            reason += f", {candidates[0]} answered badly"
+
+        # Stay with the smallest good model, unless a larger one has been faster
+        chosen = good[0]
+        if chosen in known and known[chosen]["seconds"] is not None:
+            faster = [model for model in good if model in known and known[model]["seconds"] is not None and
+                      known[model]["seconds"] < known[chosen]["seconds"]]
+            if faster:
+                chosen = min(faster, key=lambda model: known[model]["seconds"])
+                reason += ", faster"
+        return Choice(model=chosen, reason=reason, size=prompt_size)
+
+
+def route(config: ConfigHelper, prompt: str, history: RoutingHistory) -> Tuple[ConfigHelper, Choice]:
+    """The config with the model chosen for the prompt"""
+    choice = ModelRouter(routes=config.routes, history=history).choose(prompt=prompt, max_tokens=config.max_tokens)
+    return config.with_overrides(model=choice.model), choice
+
+
+def is_good(texts: Iterable[str]) -> bool:
+    """Whether every answer has some text"""
+    return all(text.strip() for text in texts)
+
+
+def record_stream(history: RoutingHistory, choice: Choice, response: Iterable[dict], started: float) -> Iterator[dict]:
+    """Pass a streamed response through, and record the answer once the stream is completely consumed"""
+    texts: Dict[int, str] = {}
+    for chunk in response:
+        for answer in chunk["choices"]:
+            texts[answer["index"]] = texts.get(answer["index"], "") + answer["text"]
+        yield chunk
+    history.record(choice=choice, seconds=time.perf_counter() - started, good=bool(texts) and is_good(texts.values()))
@@ -0,0 +1,68 @@
+"""
+SimHash fingerprints of prompts, to find cached prompts that are worded almost the same.
+
+Similar prompts get fingerprints that differ in only a few bits. To find them without comparing against every
+cached prompt, the 64 bits are split into bands: if two fingerprints differ in fewer than twice as many bits as
+there are bands, at least one band differs in at most one bit. So it's enough to look up the prompts whose band
+is equal or one bit off (multi-index hashing). Few wide bands match far fewer unrelated prompts than many narrow
+ones, which would find the same prompts by exact lookups alone.
+"""
+import hashlib
+import re
+import unicodedata
+from typing import List
+
+BITS = 64
+BANDS = 3  # Finds every fingerprint that differs in at most 5 bits
+_MASK = (1 << BITS) - 1
+_BAND_EDGES = [BITS * idx // BANDS for idx in range(BANDS + 1)]
+
+_NOT_WORD = re.compile(r"[\W_]+")
+_SHINGLE = 4  # Characters per feature
+
+
+def normalize(prompt: str) -> str:
+    """The prompt without differences in casing, whitespace, punctuation or unicode representation"""
+    return _NOT_WORD.sub(" ", unicodedata.normalize("NFKC", prompt).casefold()).strip()
+
+
+def simhash(prompt: str) -> int:
+    """64-bit fingerprint of the normalized prompt, from its overlapping 4-character pieces"""
+    text = f" {normalize(prompt)} "
+    features = {text[idx:idx + _SHINGLE] for idx in range(max(len(text) - _SHINGLE + 1, 1))}
+
+    values = [int.from_bytes(hashlib.blake2b(feature.encode("utf8"), digest_size=8).digest(), "little")
+              for feature in features]
+    # A bit is set if it's set in more than half of the features' hashes, counted per column of their binary digits
+    columns = zip(*(f"{value:0{BITS}b}" for value in values))
+    return int("".join("1" if column.count("1") * 2 > len(values) else "0" for column in columns), 2)
+
+
+def bands(fingerprint: int) -> List[int]:
+    return [fingerprint >> start & ((1 << (end - start)) - 1) for start, end in zip(_BAND_EDGES, _BAND_EDGES[1:])]
+
+
+def probes(fingerprint: int) -> List[List[int]]:
+    """For every band, its value and the values that differ from it in one bit"""
+    return [[band] + [band ^ 1 << bit for bit in range(end - start)]
+            for band, start, end in zip(bands(fingerprint), _BAND_EDGES, _BAND_EDGES[1:])]
+
+
+def distance(first: int, second: int) -> int:
+    """Number of different bits. Either fingerprint may also be given as a signed integer"""
+    return bin((first ^ second) & _MASK).count("1")
+
+
+def similarity(first: int, second: int) -> float:
+    """Fraction of equal bits"""
+    return 1 - distance(first, second) / BITS
+
+
+def max_distance(threshold: float) -> int:
+    """The most bits that may differ for a similarity of at least `threshold`"""
+    return int((1 - threshold) * BITS + 1e-9)
+
+
+def to_signed(fingerprint: int) -> int:
+    """SQLite stores signed 64-bit integers"""
+    return fingerprint - (1 << BITS) if fingerprint >= 1 << (BITS - 1) else fingerprint
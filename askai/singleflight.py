@@ -0,0 +1,97 @@
+import os
+import time
+from pathlib import Path
+from types import TracebackType
+from typing import Callable, Optional, Type
+
+from .constants import INFLIGHT_PATH, SINGLE_FLIGHT_POLL_INTERVAL, SINGLE_FLIGHT_TIMEOUT
+
+try:
+    import fcntl
+except ImportError:  # Windows, where identical requests are not coalesced
+    fcntl = None
+
+
+class InflightLock:
+    """
+    Lets only one of the askai processes on the host make a request with the same key at a time, so the
+    others can wait for its answer in the response cache instead of asking again ("single flight").
+
+    The lock is an exclusive `flock` on `<inflight_path>/<key>.lock`. The kernel releases it when its
+    process exits, so a crashed process never leaves a stale lock behind. The holder removes the file when
+    it is done; a process that locked the removed file in the meantime notices and locks the new one.
+
+    A process that waits longer than `timeout` seconds goes ahead without the lock, so a hanging process
+    only makes the others ask themselves.
+    """
+
+    def __init__(self,
+                 key: str,
+                 inflight_path: Path = INFLIGHT_PATH,
+                 timeout: float = SINGLE_FLIGHT_TIMEOUT,
+                 poll_interval: float = SINGLE_FLIGHT_POLL_INTERVAL,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self._path = inflight_path / f"{key}.lock"
+        self._timeout = timeout
+        self._poll_interval = poll_interval
+        self._clock = clock
+        self._sleep = sleep
+        self._fd: Optional[int] = None
+
+    @property
+    def locked(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self) -> bool:
+        """Wait until no other process holds the lock, and take it. Returns False if that timed out"""
+        if fcntl is None:
+            return False
+        deadline = self._clock() + self._timeout
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            while True:
+                fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+                if not self._lock(fd=fd, deadline=deadline):
+                    os.close(fd)
+                    return False
+                try:
+                    same_file = os.fstat(fd).st_ino == os.stat(self._path).st_ino
+                except FileNotFoundError:
+                    same_file = False
+                if same_file:
+                    self._fd = fd
+                    return True
+                os.close(fd)  # The previous holder removed the file while we were waiting
+        except OSError:
+            return False  # Coalescing is an optimization, it should never stop a question from being asked
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            # Removed before unlocking, so that no one can lock this file after we're done with it
+            self._path.unlink(missing_ok=True)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def _lock(self, fd: int, deadline: float) -> bool:
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if self._clock() >= deadline:
+                    return False
+                self._sleep(self._poll_interval)
+
+    def __enter__(self) -> "InflightLock":
+        self.acquire()
+        return self
+
+    def __exit__(self,
+                 exc_type: Optional[Type[BaseException]],
+                 exc_value: Optional[BaseException],
+                 traceback: Optional[TracebackType]) -> None:
+        self.release()
@@ -0,0 +1,126 @@
+"""
+Client-side stop conditions: an answer is cut off as soon as it matches a regular expression, has a number of
+lines or closes its code block. Streamed answers are checked as every token arrives, and the stream is closed
+as soon as all answers are done, which stops the generation and the billing of more tokens.
+"""
+import re
+from typing import Dict, Iterable, Iterator, List, Optional
+
+CODE_FENCE = "```"
+
+
+class StopConditions:
+    def __init__(self, regex: Optional[str] = None, max_lines: Optional[int] = None, code_block: bool = False):
+        self._regex = re.compile(regex) if regex is not None else None
+        self._max_lines = max_lines
+        self._code_block = code_block
+
+    @property
+    def enabled(self) -> bool:
+        return self._regex is not None or self._max_lines is not None or self._code_block
+
+    def as_dict(self) -> dict:
+        """The conditions, as part of the response cache's key"""
+        return {
+            "regex": self._regex.pattern if self._regex is not None else None,
+            "max_lines": self._max_lines,
+            "code_block": self._code_block,
+        }
+
+    def watch(self) -> "_Watcher":
+        """A watcher for a single answer"""
+        return _Watcher(regex=self._regex, max_lines=self._max_lines, code_block=self._code_block)
+
+
+class _Watcher:
+    """
+    Follows the text of an answer as it arrives. Lines are only scanned once; the regular expression is searched
+    in the whole text, since a match can start anywhere.
+    """
+
+    def __init__(self, regex: Optional["re.Pattern"], max_lines: Optional[int], code_block: bool):
+        self._regex = regex
+        self._max_lines = max_lines
+        self._code_block = code_block
+        self._text = ""
+        self._line_start = 0  # Start of the first line that isn't complete yet
+        self._lines = 0
+        self._in_code_block = False
+
+    def feed(self, text: str) -> Optional[int]:
+        """Add the next piece of the answer. If the answer is done, return how much of the piece to keep"""
+        start = len(self._text)
+        self._text += text
+        ends: List[int] = []
+
+        if self._regex is not None:
+            match = self._regex.search(self._text)
+            if match is not None:
+                ends.append(match.end())
+
+        while self._max_lines is not None or self._code_block:
+            newline = self._text.find("\n", self._line_start)
+            line = self._text[self._line_start:newline if newline != -1 else len(self._text)]
+            stripped = line.lstrip()
+            if self._code_block and stripped.startswith(CODE_FENCE):
+                if self._in_code_block:
+                    # A closing fence has no info string, so it's done as soon as its backticks are
+                    backticks = len(stripped) - len(stripped.lstrip("`"))
+                    ends.append(self._line_start + len(line) - len(stripped) + backticks)
+                    break
+                if newline != -1:
+                    self._in_code_block = True
+            if newline == -1:
+                break
+            if self._max_lines is not None and (self._lines or line.strip()):  # Leading blank lines don't count
+                self._lines += 1
+                if self._lines >= self._max_lines:
+                    ends.append(newline)
+                    break
+            self._line_start = newline + 1
+
+        if not ends:
+            return None
+        return max(min(ends) - start, 0)
+
+
+def stop_stream(response: Iterable[dict], conditions: StopConditions, num_answers: int) -> Iterator[dict]:
+    """
+    Pass a streamed response through, cutting every answer off where a condition is met. Once all answers are
+    done and one was cut off, the response is closed, which closes its connection.
+    """
+    watchers: Dict[int, _Watcher] = {}
+    done = set()
+    cut_off = False
+    try:
+        for chunk in response:
+            choices = []
+            for choice in chunk["choices"]:
+                idx = choice["index"]
+                if idx in done:
+                    continue
+                keep = watchers.setdefault(idx, conditions.watch()).feed(choice["text"])
+                if keep is not None:
+                    choice = {**choice, "text": choice["text"][:keep], "finish_reason": "stop"}
+                    cut_off = True
+                if keep is not None or choice.get("finish_reason"):
+                    done.add(idx)
+                choices.append(choice)
+
+            if choices:
+                yield {**chunk, "choices": choices} if len(choices) != len(chunk["choices"]) or cut_off else chunk
+            if cut_off and len(done) >= num_answers:
+                return
+    finally:
+        close = getattr(response, "close", None)
+        if callable(close):
+            close()
+
+
+def stop_response(response: dict, conditions: StopConditions) -> dict:
+    """The response with every answer cut off where a condition is met"""
+    choices = []
+    for choice in response["choices"]:
+        keep = conditions.watch().feed(choice["text"])
+        choices.append(choice if keep is None else {**choice, "text": choice["text"][:keep], "finish_reason": "stop"})
+    return {**response, "choices": choices}
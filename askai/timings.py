@@ -0,0 +1,186 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# When askai started loading. Imported first by `askai/__init__.py`, so this is as close to the end of
+# Python's own startup as we can get
+IMPORTED = time.perf_counter()
+
+# False in a long-running process like `askai serve`, where the startup isn't part of any command
+_measure_startup = True
+
+
+def skip_startup() -> None:
+    global _measure_startup
+    _measure_startup = False
+
+
+def _process_started() -> Optional[float]:
+    """When this process was started, on the `perf_counter` clock. Only known on Linux (to ~10 ms)"""
+    try:
+        with open("/proc/self/stat") as f:
+            # The command name might contain spaces, so count the fields from after it
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        started_ago = time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, AttributeError, ValueError, IndexError):
+        return None
+    return time.perf_counter() - started_ago
+
+
+class _ConnectionEvents:
+    """Start and end times of the connects and the waits for response headers of one measured request"""
+
+    def __init__(self, clock: Callable[[], float]):
+        self.clock = clock
+        self.connects: List[Tuple[float, float]] = []
+        self.responses: List[Tuple[float, float]] = []
+
+
+# The events of the request measured in this context. Every thread starts with an empty context
+_connection_events: ContextVar[Optional[_ConnectionEvents]] = ContextVar("connection_events", default=None)
+_wrap_lock = threading.Lock()
+_wrapped = False
+
+
+def _wrap_connections() -> None:
+    """Wrap urllib3's connections, once, to record their events in the measured request of the current context"""
+    global _wrapped
+    with _wrap_lock:
+        if _wrapped:
+            return
+        from urllib3.connection import HTTPConnection, HTTPSConnection
+
+        for cls in (HTTPConnection, HTTPSConnection):
+            if "connect" in vars(cls):
+                cls.connect = _recorded(vars(cls)["connect"], kind="connects")
+        HTTPConnection.getresponse = _recorded(HTTPConnection.getresponse, kind="responses")
+        _wrapped = True
+
+
+def _recorded(func: Callable[..., T], kind: str) -> Callable[..., T]:
+    """Wrap `func` to add its start and end times to the `kind` events of the current context, if any"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs) -> T:
+        events = _connection_events.get()
+        if events is None:
+            return func(*args, **kwargs)
+        started = events.clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            getattr(events, kind).append((started, events.clock()))
+    return wrapper
+
+
+class Timings:
+    """
+    Measures how long each phase of a command takes, with a monotonic high-resolution clock.
+
+    Phases are kept in the order they were first measured. Time measured again for the same phase, e.g. for
+    every retry of a request, is added to it. When not `enabled`, nothing is measured or patched.
+    """
+
+    def __init__(self, enabled: bool = True, clock: Callable[[], float] = time.perf_counter):
+        self.enabled = enabled
+        self._clock = clock
+        self._created = clock()
+        self._started = self._created
+        self._phases: Dict[str, float] = {}
+        self._info: Dict[str, object] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        if self.enabled:
+            self._phases[name] = self._phases.get(name, 0.0) + seconds
+
+    def get(self, name: str) -> float:
+        return self._phases.get(name, 0.0)
+
+    def info(self, **info) -> None:
+        """Extra fields for the JSON record, e.g. whether the answer was cached"""
+        if self.enabled:
+            self._info.update(info)
+
+    def startup(self) -> None:
+        """Measure Python's startup and the imports up until now. Only meaningful at the start of a command"""
+        if not self.enabled or not _measure_startup:
+            return
+        process_started = _process_started()
+        if process_started is not None and process_started < IMPORTED:
+            self.add("startup", IMPORTED - process_started)
+        self.add("imports", self._created - IMPORTED)
+        self._started = min(self._started, IMPORTED, process_started or IMPORTED)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.add(name, self._clock() - start)
+
+    def iterate(self, iterable: Iterable[T], name: str) -> Iterator[T]:
+        """Yield from `iterable`, adding the time spent waiting for each item to phase `name`"""
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    @contextmanager
+    def request(self) -> Iterator[None]:
+        """
+        Measure an HTTP request, split into `connect` (DNS, TCP and TLS), `first byte` (until the response
+        headers arrive, incl. retries and waiting for the rate limits) and `download` (reading and parsing
+        the body, for non-streamed responses).
+
+        The phases are taken from urllib3's connections, which are wrapped once per process. The wrappers only
+        measure the connections of the thread that is inside `request`, or of threads started in its context,
+        so requests on other threads, e.g. of `askai serve`, don't mix into the measurement.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        _wrap_connections()
+        start = self._clock()
+        events = _ConnectionEvents(clock=self._clock)
+        token = _connection_events.set(events)
+        try:
+            yield
+        finally:
+            _connection_events.reset(token)
+
+            end = self._clock()
+            connect_time = sum(finished - started for started, finished in events.connects)
+            headers_received = events.responses[-1][1] if events.responses else end
+            first_byte = headers_received - start
+            self.add("connect", connect_time)
+            self.add("first byte", first_byte - connect_time)
+            self.add("download", end - start - first_byte)
+
+    def as_dict(self) -> dict:
+        """Phases and total in seconds, plus the extra info"""
+        return {
+            "time": time.time(),
+            **self._info,
+            "phases": dict(self._phases),
+            "total": self._clock() - self._started,
+        }
+
+    def append_json(self, path: Path) -> None:
+        """Append the timings as one JSON line, so many runs can be aggregated"""
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.as_dict()) + "\n")
@@ -0,0 +1,156 @@
+"""
+Byte-pair encoding of the GPT-3 models, to count the tokens of a prompt without asking the API.
+
+The merges in `data/vocab.bpe.gz` are OpenAI's GPT-2/GPT-3 vocabulary (r50k_base, MIT licensed). Token ids
+follow from the vocabulary itself: the 256 byte tokens first, then one token per merge in rank order.
+text-davinci-003's encoding additionally has tokens for runs of spaces, so its counts for such prompts are
+slightly too high, which is the safe side for fitting a prompt into the context.
+"""
+import gzip
+import re
+from functools import cached_property, lru_cache
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .constants import DEFAULT_CONTEXT_TOKENS, MODEL_CONTEXT_TOKENS
+
+VOCAB_PATH = Path(__file__).parent / "data" / "vocab.bpe.gz"
+
+# GPT-2's pre-tokenizer, with the `regex` module's \p{L} (letters) and \p{N} (numbers) written with `re`
+_PRE_TOKENIZER = re.compile(r"""'s|'t|'re|'ve|'m|'ll|'d| ?[^\W\d_]+| ?\d+| ?(?:[^\s\w]|_)+|\s+(?!\S)|\s+""")
+
+# Words seen before are not merged again. Prompts repeat the same words a lot
+_WORD_CACHE_SIZE = 2 ** 16
+
+
+class PromptTooLongError(ValueError):
+    """Raised when a prompt leaves no room for an answer in the model's context"""
+
+
+def _bytes_to_unicode() -> Tuple[List[str], List[int]]:
+    """
+    The printable character that stands for every byte in the vocabulary, and the bytes in token id order.
+    Printable bytes stand for themselves, the others are shifted past 255.
+    """
+    printable = [*range(ord("!"), ord("~") + 1), *range(ord("¡"), ord("¬") + 1), *range(ord("®"), ord("ÿ") + 1)]
+    shifted = [byte for byte in range(256) if byte not in printable]
+    byte_order = printable + shifted
+    characters = [chr(byte) for byte in printable] + [chr(256 + idx) for idx in range(len(shifted))]
+    return [char for _, char in sorted(zip(byte_order, characters))], byte_order
+
+
+class Tokenizer:
+    """Splits text into GPT-3 tokens. Use `get_tokenizer()`, which loads the vocabulary once"""
+
+    def __init__(self, merges: List[Tuple[str, str]]):
+        byte_characters, byte_order = _bytes_to_unicode()
+        self._byte_characters = byte_characters  # byte -> character
+        self._ranks: Dict[Tuple[str, str], int] = {merge: rank for rank, merge in enumerate(merges)}
+        self._encoder: Dict[str, int] = {byte_characters[byte]: idx for idx, byte in enumerate(byte_order)}
+        self._encoder.update({first + second: 256 + rank for rank, (first, second) in enumerate(merges)})
+        self._word_tokens = lru_cache(maxsize=_WORD_CACHE_SIZE)(self._merge)
+
+    @classmethod
+    def from_file(cls, vocab_path: Path = VOCAB_PATH) -> "Tokenizer":
+        with gzip.open(vocab_path, "rt", encoding="utf8") as f:
+            lines = f.read().split("\n")
+        merges = [tuple(line.split(" ")) for line in lines[1:] if line]  # The first line is a version comment
+        return cls(merges=merges)
+
+    def encode(self, text: str) -> List[int]:
+        return [self._encoder[token] for word in _PRE_TOKENIZER.findall(text) for token in self._word_tokens(word)]
+
+    def decode(self, tokens: List[int]) -> str:
+        characters = "".join(self._decoder[token] for token in tokens)
+        return bytes(self._bytes[char] for char in characters).decode("utf8", errors="replace")
+
+    @cached_property
+    def _decoder(self) -> Dict[int, str]:
+        return {idx: token for token, idx in self._encoder.items()}
+
+    @cached_property
+    def _bytes(self) -> Dict[str, int]:
+        return {char: byte for byte, char in enumerate(self._byte_characters)}
+
+    def starts_character(self, token: int) -> bool:
+        """Whether the token starts with the first byte of a character, so that text can be cut before it"""
+        return self._bytes[self._decoder[token][0]] & 0xC0 != 0x80  # Not a UTF-8 continuation byte
+
+    def count(self, text: str) -> int:
+        return sum(len(self._word_tokens(word)) for word in _PRE_TOKENIZER.findall(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """The beginning of `text`, at most `max_tokens` tokens long"""
+        return self.decode(self.encode(text)[:max_tokens])
+
+    def _merge(self, word: str) -> Tuple[str, ...]:
+        """Split the word into its bytes, and merge the pair of parts with the lowest rank until none can be merged"""
+        parts = [self._byte_characters[byte] for byte in word.encode("utf8")]
+        ranks = self._ranks
+        while len(parts) > 1:
+            best_rank, best_idx = None, -1
+            for idx in range(len(parts) - 1):
+                rank = ranks.get((parts[idx], parts[idx + 1]))
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best_rank, best_idx = rank, idx
+            if best_rank is None:
+                break
+
+            # Merge every occurrence of the pair, left to right
+            first, second = parts[best_idx], parts[best_idx + 1]
+            merged = []
+            idx = 0
+            while idx < len(parts):
+                if idx < len(parts) - 1 and parts[idx] == first and parts[idx + 1] == second:
+                    merged.append(first + second)
+                    idx += 2
+                else:
+                    merged.append(parts[idx])
+                    idx += 1
+            parts = merged
+        return tuple(parts)
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer() -> Tokenizer:
+    return Tokenizer.from_file()
+
+
+def context_tokens(model: str) -> int:
+    return MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+
+
+def fit_max_tokens(prompt_tokens: int, model: str, max_tokens: int) -> int:
+    """
+    `max_tokens` lowered to what is left of the model's context after the prompt. Raises PromptTooLongError
+    if nothing is left.
+    """
+    remaining = context_tokens(model=model) - prompt_tokens
+    if remaining < 1:
+        raise PromptTooLongError(f"The prompt is {prompt_tokens} tokens long, but {model} can only handle "
+                                 f"{context_tokens(model=model)} tokens including the answer")
+    return min(max_tokens, remaining)
+
+
+def fit(prompt: str, model: str, max_tokens: int, truncate: bool = False) -> Tuple[str, int]:
+    """
+    The prompt and `max_tokens` to send, so that both fit into the model's context.
+
+    With `truncate`, a prompt that leaves less than `max_tokens` for the answer is cut short, but to no less
+    than half the context. Otherwise, or if that isn't enough, `max_tokens` is lowered. Raises
+    PromptTooLongError if no room is left for the answer.
+    """
+    # Every token is at least one byte long, so short prompts fit without loading the tokenizer
+    if len(prompt.encode("utf8")) + max_tokens <= context_tokens(model=model):
+        return prompt, max_tokens
+
+    tokenizer = get_tokenizer()
+    if not truncate:
+        return prompt, fit_max_tokens(prompt_tokens=tokenizer.count(prompt), model=model, max_tokens=max_tokens)
+
+    tokens = tokenizer.encode(prompt)
+    keep = max(context_tokens(model=model) - max_tokens, context_tokens(model=model) // 2)
+    if len(tokens) > keep:
+        tokens = tokens[:keep]
+        prompt = tokenizer.decode(tokens)
+    return prompt, fit_max_tokens(prompt_tokens=len(tokens), model=model, max_tokens=max_tokens)
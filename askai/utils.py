@@ -1,28 +1,37 @@
+import hashlib
+import json
+import os
+import re
+import time
 from pathlib import Path
 
-import yaml
 import click
-import openai
 from getpass import getpass
 from enum import Enum, auto
-from typing import Callable
-from dataclasses import dataclass, asdict
-from openai.error import AuthenticationError
-from openai.openai_object import OpenAIObject
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tuple
+from dataclasses import dataclass, asdict, field, fields, replace
 from .constants import (
     CONFIG_PATH,
     API_KEY_PATH,
+    KEYS_PATH,
     DEFAULT_MODEL,
     DEFAULT_NUM_ANSWERS,
     DEFAULT_MAX_TOKENS,
     DEFAULT_TEMPERATURE,
     DEFAULT_TOP_P,
     DEFAULT_FREQUENCY_PENALTY,
-    DEFAULT_PRESENCE_PENALTY, MAX_INPUT_TRIES, OPENAI_NUM_ANSWERS_MIN, OPENAI_MAX_TOKENS_MIN, OPENAI_TEMPERATURE_MIN,
+    DEFAULT_PRESENCE_PENALTY, DEFAULT_MAX_RETRIES, DEFAULT_RETRY_TIMEOUT, DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_TOKENS_PER_MINUTE, MAX_RETRIES_MIN, RETRY_TIMEOUT_MIN, REQUESTS_PER_MINUTE_MIN, TOKENS_PER_MINUTE_MIN,
+    MAX_INPUT_TRIES, KEY_VERIFICATION_TIMEOUT, OPENAI_NUM_ANSWERS_MIN, OPENAI_MAX_TOKENS_MIN, OPENAI_TEMPERATURE_MIN,
     OPENAI_TEMPERATURE_MAX, OPENAI_TOP_P_MIN, OPENAI_TOP_P_MAX, OPENAI_FREQUENCY_PENALTY_MIN,
     OPENAI_FREQUENCY_PENALTY_MAX, OPENAI_PRESENCE_PENALTY_MIN, OPENAI_PRESENCE_PENALTY_MAX
 )
 
+# `openai` and `yaml` are slow to import and only needed by a few code paths,
+# so they are imported where they are used to keep the CLI startup fast.
+if TYPE_CHECKING:
+    from openai.openai_object import OpenAIObject
+
 
 class AvailableModels(Enum):
     TEXT_ADA_001 = auto()
@@ -38,6 +47,12 @@ class AvailableModels(Enum):
             return list(map(lambda c: c.name, cls))
 
 
+# Config and keys already loaded by this process, by path, with the file's (mtime_ns, size) when it was loaded.
+# Only a long-running process like `askai serve` loads them more than once, and then only has to stat the file
+_loaded_configs: Dict[Path, Tuple[int, int, 'ConfigHelper']] = {}
+_loaded_keys: Dict[Path, Tuple[int, int, str]] = {}
+
+
 @dataclass
 class ConfigHelper:
     model: str = DEFAULT_MODEL
@@ -47,18 +62,110 @@ class ConfigHelper:
     top_p: float = DEFAULT_TOP_P
     frequency_penalty: float = DEFAULT_FREQUENCY_PENALTY
     presence_penalty: float = DEFAULT_PRESENCE_PENALTY
+    max_retries: int = DEFAULT_MAX_RETRIES
+    retry_timeout: float = DEFAULT_RETRY_TIMEOUT
+    requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE
+    tokens_per_minute: int = DEFAULT_TOKENS_PER_MINUTE
+    routes: list = field(default_factory=list)  # Rules for `--model auto`, see `routing.Route`
 
     @classmethod
     def from_file(cls, config_path: Path = CONFIG_PATH) -> 'ConfigHelper':
         if config_path.is_file():
-            with open(config_path, "r", encoding="utf8") as f:
-                config = yaml.safe_load(f)
-                return cls(**config)
+            try:
+                return cls._load(config_path=config_path)
+            except ValueError as e:
+                click.echo(click.style(f"The config is not valid: {e}. "
+                                       "Run 'askai config reset' to create a default config.", fg="red"))
+                exit(1)
         else:
             click.echo(click.style("No config file found, can't initialize config. "
                                     "Run 'askai config reset' to create a default config.", fg="red"))
             exit()
 
+    @classmethod
+    def _load(cls, config_path: Path) -> 'ConfigHelper':
+        """
+        Load the config from a JSON snapshot of the validated config. The YAML file is only parsed, and
+        the snapshot rewritten, when the YAML file's modification time or size has changed.
+        """
+        stat = config_path.stat()
+        loaded = _loaded_configs.get(config_path)
+        if loaded is not None and loaded[:2] == (stat.st_mtime_ns, stat.st_size):
+            return replace(loaded[2])
+
+        snapshot_path = _snapshot_path(config_path=config_path)
+        try:
+            snapshot = json.loads(snapshot_path.read_text(encoding="utf8"))
+            if snapshot["mtime_ns"] == stat.st_mtime_ns and snapshot["size"] == stat.st_size:
+                config_helper = cls(**snapshot["config"])
+                _loaded_configs[config_path] = (stat.st_mtime_ns, stat.st_size, replace(config_helper))
+                return config_helper
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # Missing, outdated format or corrupt snapshot
+
+        config_helper = cls._from_yaml(config_path=config_path)
+        snapshot = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "config": config_helper.as_dict()}
+        try:
+            tmp_path = snapshot_path.with_name(f"{snapshot_path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(snapshot), encoding="utf8")
+            os.replace(tmp_path, snapshot_path)
+        except OSError:
+            pass  # Only slower next time
+        _loaded_configs[config_path] = (stat.st_mtime_ns, stat.st_size, replace(config_helper))
+        return config_helper
+
+    @classmethod
+    def _from_yaml(cls, config_path: Path) -> 'ConfigHelper':
+        import yaml
+
+        loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+        try:
+            with open(config_path, "r", encoding="utf8") as f:
+                config = yaml.load(f, Loader=loader)
+        except yaml.YAMLError:
+            raise ValueError("the file is not valid YAML")
+
+        if not isinstance(config, dict):
+            raise ValueError("the file is not a mapping of config values")
+        unknown_fields = set(config) - {field.name for field in fields(cls)}
+        if unknown_fields:
+            raise ValueError(f"unknown config values: {', '.join(sorted(unknown_fields))}")
+
+        config_helper = cls(**config)
+        config_helper.validate()
+        return config_helper
+
+    def validate(self) -> None:
+        """Raise a ValueError if any value is of the wrong type or outside its allowed range"""
+        integers = [
+            ("num_answers", OPENAI_NUM_ANSWERS_MIN),
+            ("max_tokens", OPENAI_MAX_TOKENS_MIN),
+            ("max_retries", MAX_RETRIES_MIN),
+            ("requests_per_minute", REQUESTS_PER_MINUTE_MIN),
+            ("tokens_per_minute", TOKENS_PER_MINUTE_MIN),
+        ]
+        floats = [
+            ("temperature", OPENAI_TEMPERATURE_MIN, OPENAI_TEMPERATURE_MAX),
+            ("top_p", OPENAI_TOP_P_MIN, OPENAI_TOP_P_MAX),
+            ("frequency_penalty", OPENAI_FREQUENCY_PENALTY_MIN, OPENAI_FREQUENCY_PENALTY_MAX),
+            ("presence_penalty", OPENAI_PRESENCE_PENALTY_MIN, OPENAI_PRESENCE_PENALTY_MAX),
+            ("retry_timeout", RETRY_TIMEOUT_MIN, float("inf")),
+        ]
+
+        from .routing import validate_routes
+
+        if not isinstance(self.model, str):
+            raise ValueError("model must be a string")
+        validate_routes(self.routes)
+        for name, min_value in integers:
+            value = getattr(self, name)
+            if isinstance(value, bool) or not isinstance(value, int) or value < min_value:
+                raise ValueError(f"{name} must be an integer >= {min_value}")
+        for name, min_value, max_value in floats:
+            value = getattr(self, name)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not min_value <= value <= max_value:
+                raise ValueError(f"{name} must be a number between {min_value} and {max_value}")
+
     def input_model(self, max_input_tries: int = MAX_INPUT_TRIES) -> None:
         model = input("Choose model (1-4): ")
         num_of_tries = 1
@@ -140,10 +247,68 @@ class ConfigHelper:
             max_input_tries=max_input_tries
         )
 
+    def input_max_retries(self,
+                          default_value: int = DEFAULT_MAX_RETRIES,
+                          min_value: int = MAX_RETRIES_MIN,
+                          max_input_tries: int = MAX_INPUT_TRIES) -> None:
+        self.max_retries = self._input_integer(
+            default_value=default_value,
+            predicate=lambda x: x >= min_value,
+            max_input_tries=max_input_tries
+        )
+
+    def input_retry_timeout(self,
+                            default_value: float = DEFAULT_RETRY_TIMEOUT,
+                            min_value: float = RETRY_TIMEOUT_MIN,
+                            max_input_tries: int = MAX_INPUT_TRIES) -> None:
+        self.retry_timeout = self._input_float(
+            default_value=default_value,
+            predicate=lambda x: x >= min_value,
+            max_input_tries=max_input_tries
+        )
+
+    def input_requests_per_minute(self,
+                                  default_value: int = DEFAULT_REQUESTS_PER_MINUTE,
+                                  min_value: int = REQUESTS_PER_MINUTE_MIN,
+                                  max_input_tries: int = MAX_INPUT_TRIES) -> None:
+        self.requests_per_minute = self._input_integer(
+            default_value=default_value,
+            predicate=lambda x: x >= min_value,
+            max_input_tries=max_input_tries
+        )
+
+    def input_tokens_per_minute(self,
+                                default_value: int = DEFAULT_TOKENS_PER_MINUTE,
+                                min_value: int = TOKENS_PER_MINUTE_MIN,
+                                max_input_tries: int = MAX_INPUT_TRIES) -> None:
+        self.tokens_per_minute = self._input_integer(
+            default_value=default_value,
+            predicate=lambda x: x >= min_value,
+            max_input_tries=max_input_tries
+        )
+
     def as_dict(self) -> dict:
         return asdict(self)
 
+    def with_overrides(self, **overrides) -> 'ConfigHelper':
+        """Return a copy of the config where all overrides that are not None are applied"""
+        return replace(self, **{key: value for key, value in overrides.items() if value is not None})
+
+    def completion_kwargs(self) -> dict:
+        """The config as keyword arguments to `openai.Completion.create`"""
+        return {
+            "model": self.model,
+            "n": self.num_answers,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "frequency_penalty": self.frequency_penalty,
+            "presence_penalty": self.presence_penalty
+        }
+
     def update(self, config_path: Path = CONFIG_PATH) -> None:
+        import yaml
+
         config = self.as_dict()
         with open(config_path, "w", encoding="utf8") as f:
             yaml.dump(config, f)
@@ -152,6 +317,8 @@ class ConfigHelper:
 
     @staticmethod
     def reset(config_path: Path = CONFIG_PATH) -> None:
+        import yaml
+
         config = ConfigHelper().as_dict()  # Create config with default values
         with open(config_path, "w", encoding="utf8") as f:
             yaml.dump(config, f)
@@ -168,13 +335,12 @@ class ConfigHelper:
             click.echo("No config exists. Please reset the config ('askai config reset') "
                        "or see 'askai config --help'.\n")
         else:
-            with open(config_path, "r", encoding="utf8") as f:
-                try:
-                    config = yaml.safe_load(f)
-                    for key, value in config.items():
-                        click.echo(f"{key}: {value}")
-                except yaml.YAMLError:
-                    click.echo("Something is wrong with the config. Please reset the config: 'askai config reset'")
+            try:
+                config = ConfigHelper._load(config_path=config_path).as_dict()
+                for key, value in config.items():
+                    click.echo(f"{key}: {value}")
+            except ValueError:
+                click.echo("Something is wrong with the config. Please reset the config: 'askai config reset'")
 
     @staticmethod
     def _input_integer(default_value: int,
@@ -230,8 +396,10 @@ class ConfigHelper:
 
 
 class KeyHelper:
-    def __init__(self):
+    def __init__(self, verify: bool = True):
         self._api_key: str = ""
+        self._verify = verify
+        self._verified: Optional[bool] = None  # None until the key has been checked against the API
 
     def input(self) -> None:
         key = getpass("Enter API Key: ")
@@ -250,7 +418,11 @@ class KeyHelper:
     def save(self, api_key_path: Path = API_KEY_PATH) -> None:
         api_key_path.parent.mkdir(parents=True, exist_ok=True)
         api_key_path.write_text(self._api_key, encoding="utf8")
+        if self._verified is not None:
+            self.record_verification(key=self._api_key, valid=self._verified, api_key_path=api_key_path)
         click.echo(click.style("Your API key has been successfully added!", fg="green"))
+        if self._verified is None:
+            PrintHelper.key_not_verified()
 
     @staticmethod
     def remove(api_key_path: Path = API_KEY_PATH) -> None:
@@ -261,11 +433,58 @@ class KeyHelper:
             click.echo(click.style("No API key found.", fg="red"))
             exit()
 
+    def save_named(self,
+                   name: str,
+                   organization: Optional[str] = None,
+                   requests_per_minute: int = 0,
+                   tokens_per_minute: int = 0,
+                   keys_path: Path = KEYS_PATH,
+                   api_key_path: Path = API_KEY_PATH) -> None:
+        """Add the key to the key pool under `name`, replacing any key with the same name"""
+        keys = KeyHelper.named_keys(keys_path=keys_path)
+        keys[name] = {
+            "key": self._api_key,
+            "organization": organization,
+            "requests_per_minute": requests_per_minute,
+            "tokens_per_minute": tokens_per_minute
+        }
+        _write_keys(keys=keys, keys_path=keys_path)
+        if self._verified is not None:
+            self.record_verification(key=self._api_key, valid=self._verified, api_key_path=api_key_path)
+        click.echo(click.style(f"Your API key '{name}' has been successfully added to the key pool!", fg="green"))
+        if self._verified is None:
+            PrintHelper.key_not_verified()
+
+    @staticmethod
+    def remove_named(name: str, keys_path: Path = KEYS_PATH) -> None:
+        keys = KeyHelper.named_keys(keys_path=keys_path)
+        if keys.pop(name, None) is None:
+            click.echo(click.style(f"No API key named '{name}' found.", fg="red"))
+            exit()
+        _write_keys(keys=keys, keys_path=keys_path)
+        click.echo(click.style(f"API key '{name}' removed.", fg="green"))
+
+    @staticmethod
+    def named_keys(keys_path: Path = KEYS_PATH) -> Dict[str, dict]:
+        """The keys added with a name, by name. They are used together with the default key as a key pool"""
+        try:
+            with open(keys_path, "r", encoding="utf8") as f:
+                keys = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {name: value for name, value in keys.items() if isinstance(value, dict) and value.get("key")} \
+            if isinstance(keys, dict) else {}
+
     @staticmethod
     def from_file(api_key_path: Path = API_KEY_PATH) -> str:
         if api_key_path.is_file():
+            stat = api_key_path.stat()
+            loaded = _loaded_keys.get(api_key_path)
+            if loaded is not None and loaded[:2] == (stat.st_mtime_ns, stat.st_size):
+                return loaded[2]
             with open(api_key_path, "r", encoding="utf8") as f:
                 api_key = f.read().strip()
+            _loaded_keys[api_key_path] = (stat.st_mtime_ns, stat.st_size, api_key)
             return api_key
         else:
             click.echo(click.style("No API-key found, can't answer question. "
@@ -273,14 +492,56 @@ class KeyHelper:
             exit()
 
     @staticmethod
-    def _is_valid_api_key(key: str) -> bool:
-        openai.api_key = key
+    def verification(key: str, api_key_path: Path = API_KEY_PATH) -> Optional[bool]:
+        """Whether the key was accepted (True) or rejected (False) by the API the last time it was used"""
+        try:
+            records = json.loads(_verification_path(api_key_path=api_key_path).read_text(encoding="utf8"))
+            return records[_key_hash(key)]["valid"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @staticmethod
+    def record_verification(key: str, valid: bool, api_key_path: Path = API_KEY_PATH) -> None:
+        """Record whether the API accepted the key. Only a hash of the key is stored."""
+        verification_path = _verification_path(api_key_path=api_key_path)
+        try:
+            records = json.loads(verification_path.read_text(encoding="utf8"))
+        except (OSError, ValueError):
+            records = {}
+        records[_key_hash(key)] = {"valid": valid, "checked": int(time.time())}
+        try:
+            verification_path.write_text(json.dumps(records), encoding="utf8")
+        except OSError:
+            pass
+
+    def _is_valid_api_key(self, key: str) -> bool:
+        """
+        Check the format of the key locally first. If it looks right, and verification is on, ask the API.
+        A key that can't be checked because the API is unreachable is accepted, and verified on first use.
+        """
+        if not _is_api_key_format(key):
+            return False
+        if not self._verify:
+            return True
+
+        self._verified = self._check_api_key(key)
+        return self._verified is not False
+
+    @staticmethod
+    def _check_api_key(key: str) -> Optional[bool]:
+        import openai
+        from openai.error import AuthenticationError, PermissionError, APIConnectionError, Timeout, OpenAIError
+
         try:
             # Use free `content-filter-alpha` endpoint to check if API key is valid.
-            openai.Completion.create(model="content-filter-alpha")
+            openai.Completion.create(model="content-filter-alpha", api_key=key, request_timeout=KEY_VERIFICATION_TIMEOUT)
             return True
-        except AuthenticationError:
+        except (AuthenticationError, PermissionError):
             return False
+        except (APIConnectionError, Timeout):
+            return None
+        except OpenAIError:
+            return True  # Any other error response means that the key got past authentication
 
 
 class PrintHelper:
@@ -343,7 +604,9 @@ class PrintHelper:
                    "    Allowed values: >0\n"
                    "\n"
                    "  --model or -m\n"
-                   "    Which model to use. See list of available models below.\n"
+                   "    Which model to use. See list of available models below. With 'auto', a model is\n"
+                   "    chosen for every question by its length, max_tokens, the routes in the config and\n"
+                   "    how fast and well the models answered similar questions before.\n"
                    "\n"
                    "  --temperature or -t\n"
                    "    What sampling temperature to use. Higher value makes the model more \"creative\".\n"
@@ -368,14 +631,78 @@ class PrintHelper:
                    "    Positive values penalize new tokens based on their existing frequency in the text \n"
                    "    so far, decreasing the model's likelihood to repeat the same line verbatim.\n"
                    "    Allowed values: -2.0 <= presence_penalty <= 2.0\n"
+                   "\n"
+                   "  --stream/--no-stream\n"
+                   "    Print the answer token by token as it is generated. Enabled by default when\n"
+                   "    writing to a terminal.\n"
+                   "\n"
+                   "  --no-cache\n"
+                   "    Neither read nor write the local answer cache in ~/.askai/cache.db.\n"
+                   "\n"
+                   "  --refresh\n"
+                   "    Ask again even if the answer is cached, and overwrite the cached answer.\n"
+                   "\n"
+                   "  --coalesce/--no-coalesce\n"
+                   "    Wait for an identical question that another askai process is already asking, and\n"
+                   "    use its answer. Enabled by default when temperature is 0.\n"
+                   "\n"
+                   "  --similar\n"
+                   "    Reuse the cached answer to a question that is worded almost the same, with the\n"
+                   "    same model and settings. How similar is set with --similarity (default 0.92).\n"
+                   "    Allowed values: 0.0 <= similarity <= 1.0\n"
+                   "\n"
+                   "  --max-retries\n"
+                   "    How many times a failed request is retried.\n"
+                   "    Allowed values: >=0\n"
+                   "\n"
+                   "  --retry-timeout\n"
+                   "    Maximum number of seconds spent on a request including all retries.\n"
+                   "    Allowed values: >=0.0\n"
+                   "\n"
+                   "  --file or -f\n"
+                   "    Ask the question about a file ('-' for stdin) of any length. The file is split into\n"
+                   "    parts that are asked about at the same time (--concurrency, default 4, with --overlap\n"
+                   "    tokens shared by consecutive parts, default 100), and the answers are combined.\n"
+                   "    With --adaptive-concurrency, the requests in flight follow the API's capacity,\n"
+                   "    up to --concurrency (default 32).\n"
+                   "\n"
+                   "  --hedge\n"
+                   "    Send a slow request again, and use whichever answers first. A request is slow if\n"
+                   "    it takes longer than --hedge-percentile (default 95) of the recent requests, and\n"
+                   "    at most --hedge-budget (default 0.05) of the requests are sent twice.\n"
+                   "\n"
+                   "  --stop-regex, --max-lines and --until-code-block-closes\n"
+                   "    Stop an answer as soon as it matches a regular expression, has this many lines or\n"
+                   "    closes its first code block. A streamed answer stops generating right away.\n"
+                   "\n"
+                   "  --max-total-tokens\n"
+                   "    Continue an answer that was cut off by --max-tokens, until it is done or has this\n"
+                   "    many tokens in total. The continuation is printed as part of the same answer.\n"
+                   "\n"
+                   "  --truncate\n"
+                   "    Shorten a question that is too long for the model instead of failing.\n"
+                   "\n"
+                   "  --timings\n"
+                   "    Print how long each phase of the question took (startup, imports, loading the\n"
+                   "    key and config, connecting, waiting for the server, downloading and printing).\n"
+                   "\n"
+                   "  --timings-json\n"
+                   "    Append the timings as one JSON line to this file.\n"
                    "\n")
 
     @staticmethod
     def help_commands() -> None:
         click.echo("Commands:\n"
+                   "  batch   Answer one prompt per line, many prompts per request.\n"
+                   "  chat    Chat with follow-up questions.\n"
                    "  config  Handle your config.\n"
                    "  init    Initialize askai.\n"
-                   "  key     Update or remove your API key.")
+                   "  jobs    Follow and collect the jobs of the job queue.\n"
+                   "  key     Update or remove your API key.\n"
+                   "  serve   Keep askai warm in the background, for faster answers.\n"
+                   "  submit  Add prompts to the job queue.\n"
+                   "  tokens  Count the tokens of a question.\n"
+                   "  worker  Answer the jobs in the job queue.")
     
     @staticmethod
     def key() -> None:
@@ -388,6 +715,50 @@ class PrintHelper:
     def key_exists() -> None:
         click.echo("NOTE: You've already added a key. This old key will be overwritten in this setup!\n")
 
+    @staticmethod
+    def key_not_verified() -> None:
+        click.echo(click.style("The key could not be verified with OpenAI right now. "
+                               "It will be verified the first time it's used.", fg="yellow"))
+
+    @staticmethod
+    def key_rejected() -> None:
+        click.echo(click.style("Your API key was rejected by OpenAI. "
+                               "Please add a new key ('askai key add').", fg="red"), err=True)
+
+    @staticmethod
+    def keys(keys: List[dict]) -> None:
+        """One line per key, with only the end of the key shown"""
+        for pooled in keys:
+            limits = ", ".join(f"{pooled[name]} {unit}" for name, unit in
+                               (("requests_per_minute", "requests/min"), ("tokens_per_minute", "tokens/min"))
+                               if pooled[name]) or "no limits"
+            line = f"{pooled['name']}: sk-...{pooled['key'][-4:]}"
+            if pooled["organization"]:
+                line += f", organization {pooled['organization']}"
+            line += f", {limits}"
+            if pooled["quarantined_until"] is None:
+                click.echo(line)
+            else:
+                until = time.strftime("%H:%M:%S", time.localtime(pooled["quarantined_until"]))
+                click.echo(line + click.style(f", quarantined until {until} ({pooled['reason']})", fg="yellow"))
+
+    @staticmethod
+    def jobs_submitted(count: int) -> None:
+        click.echo(click.style(f"Submitted {count} jobs. Answer them with 'askai worker'.", fg="green"))
+
+    @staticmethod
+    def jobs_status(status: dict) -> None:
+        """The number of jobs in every state, and when the unfinished ones will be done"""
+        click.echo(", ".join(f"{status[state]} {state}" for state in ("pending", "leased", "done", "failed")))
+        throughput, eta = status["throughput"], status["eta"]
+        click.echo(f"Throughput: {throughput:.1f} jobs/min" if throughput is not None else "Throughput: unknown")
+        if eta is None:
+            click.echo("ETA: unknown")
+        else:
+            seconds = round(eta)
+            finished = time.strftime("%H:%M:%S", time.localtime(time.time() + seconds))
+            click.echo(f"ETA: {seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d} (at {finished})")
+
     @staticmethod
     def no_key() -> None:
         click.echo(click.style("No stored API key found.", fg="red"))
@@ -453,7 +824,116 @@ class PrintHelper:
                    "   Allowed values: -2.0 <= presence penalty <= 2.0\n")
 
     @staticmethod
-    def print_response(response: OpenAIObject) -> None:
+    def max_retries() -> None:
+        click.echo("   How many times a request is retried when it fails because of rate \n"
+                   "   limits, timeouts, connection errors or server errors.\n\n"
+                   "   Allowed values: >=0\n")
+
+    @staticmethod
+    def retry_timeout() -> None:
+        click.echo("   Maximum number of seconds spent on a request including all retries.\n\n"
+                   "   Allowed values: >=0.0\n")
+
+    @staticmethod
+    def requests_per_minute() -> None:
+        click.echo("   Maximum number of requests per minute, shared by all askai commands \n"
+                   "   running on this computer. Requests over the limit wait for their turn \n"
+                   "   instead of being rejected by OpenAI. 0 means no limit.\n\n"
+                   "   Allowed values: >=0\n")
+
+    @staticmethod
+    def tokens_per_minute() -> None:
+        click.echo("   Maximum number of tokens per minute (question + max tokens of all answers), \n"
+                   "   shared by all askai commands running on this computer. 0 means no limit.\n\n"
+                   "   Allowed values: >=0\n")
+
+    @staticmethod
+    def daemon_started(socket_path: Path) -> None:
+        click.echo(f"askai is answering questions sent to {socket_path}. Press Ctrl+C to stop.")
+
+    @staticmethod
+    def daemon_running(socket_path: Path) -> None:
+        click.echo(click.style(f"askai serve is already running ({socket_path}).", fg="red"), err=True)
+
+    @staticmethod
+    def chat() -> None:
+        click.echo("Ask a question, and follow up on the answers. The oldest questions and answers are\n"
+                   "forgotten when the conversation gets too long.\n"
+                   "  /reset  Start a new conversation\n"
+                   "  /exit   Quit (or press Ctrl+D)\n")
+
+    @staticmethod
+    def chat_reset() -> None:
+        click.echo(click.style("Started a new conversation.", fg="green"))
+
+    @staticmethod
+    def question_too_long() -> None:
+        click.echo(click.style("The question is too long for the model. Please shorten it or lower max_tokens.", fg="red"))
+
+    @staticmethod
+    def prompt_too_long(error: Exception) -> None:
+        click.echo(click.style(f"{error}. Please shorten it, or use --truncate.", fg="red"), err=True)
+
+    @staticmethod
+    def tokens(num_tokens: int, model: str, context_tokens: int) -> None:
+        click.echo(f"{num_tokens} tokens. {model} has room for {max(context_tokens - num_tokens, 0)} more tokens "
+                   f"in the answer.")
+
+    @staticmethod
+    def max_tokens_too_large(model: str, max_tokens: int) -> None:
+        click.echo(click.style(f"max_tokens={max_tokens} leaves no room for the question with {model}. "
+                               "Please lower max_tokens.", fg="red"))
+
+    @staticmethod
+    def routed(model: str, reason: str) -> None:
+        click.echo(click.style(f"(model: {model}, {reason})", fg="yellow"), err=True)
+
+    @staticmethod
+    def cached() -> None:
+        click.echo(click.style("(cached answer, use --refresh to ask again)", fg="yellow"), err=True)
+
+    @staticmethod
+    def cached_similar() -> None:
+        click.echo(click.style("(cached answer to a similar question, use --refresh to ask again)", fg="yellow"), err=True)
+
+    @staticmethod
+    def request_failed(error: Exception) -> None:
+        click.echo(click.style(f"The request failed: {error}", fg="red"), err=True)
+
+    @staticmethod
+    def timings(timings: dict) -> None:
+        phases = {**timings["phases"], "total": timings["total"]}
+        width = max(len(name) for name in phases)
+        lines = [f"  {name:<{width}} {seconds * 1000:8.1f} ms" for name, seconds in phases.items()]
+        hedge = timings.get("hedge")
+        if hedge:
+            lines.append(f"  hedged: {'yes, ' + hedge['winner'] + ' won' if hedge['hedged'] else 'no'}")
+        concurrency = timings.get("concurrency")
+        if concurrency:
+            lines += ["  " + line for line in PrintHelper.concurrency_lines(stats=concurrency)]
+        click.echo("Timings:\n" + "\n".join(lines), err=True)
+
+    @staticmethod
+    def resumed(skipped: int) -> None:
+        click.echo(f"Resumed: {skipped} prompts were already answered.", err=True)
+
+    @staticmethod
+    def concurrency(stats: dict) -> None:
+        click.echo("Adaptive concurrency:\n" + "\n".join("  " + line for line in PrintHelper.concurrency_lines(stats=stats)),
+                   err=True)
+
+    @staticmethod
+    def concurrency_lines(stats: dict) -> List[str]:
+        """The adaptive concurrency's window, and how it got there"""
+        lines = [f"concurrency: {stats['window']} (between {stats['minimum']} and {stats['maximum']}), "
+                 f"{stats['requests']} requests, {stats['rate_limited']} rate limited, "
+                 f"{stats['latency_spikes']} latency spikes"]
+        lines += [f"  {change['seconds']:8.1f} s: {change['window']:>3} ({change['reason']})"
+                  for change in stats["history"]]
+        return lines
+
+    @staticmethod
+    def print_response(response: 'OpenAIObject') -> None:
         if len(response["choices"]) == 1:
             print(response["choices"][0]["text"].lstrip("\n"))
         else:
@@ -462,6 +942,93 @@ class PrintHelper:
                 print(answer["text"].lstrip("\n"))
                 print("\n")
 
+    @staticmethod
+    def print_stream(response: Iterable['OpenAIObject'], num_answers: int = 1) -> None:
+        """
+        Print a streamed response as the tokens arrive.
+
+        Only one answer can be written to the terminal at a time. Tokens belonging to later answers
+        are buffered and printed as soon as all answers before them are finished.
+        """
+        answer_stream = _AnswerStream(num_answers=num_answers)
+        for chunk in response:
+            answer_stream.feed(chunk)
+        answer_stream.close()
+
+
+class _AnswerStream:
+    """Routes streamed choices to their own answer section, in the same layout as `print_response`"""
+
+    def __init__(self, num_answers: int):
+        self._num_answers = num_answers
+        self._buffers: List[str] = ["" for _ in range(num_answers)]
+        self._finished: List[bool] = [False for _ in range(num_answers)]
+        self._current = 0
+        self._started = False
+        self._header()
+
+    def feed(self, chunk: 'OpenAIObject') -> None:
+        for choice in chunk["choices"]:
+            self._buffers[choice["index"]] += choice["text"]
+            if choice.get("finish_reason") is not None:
+                self._finished[choice["index"]] = True
+        self._flush()
+
+    def close(self) -> None:
+        """Print everything that is left, also answers that never got a `finish_reason`"""
+        self._finished = [True for _ in range(self._num_answers)]
+        self._flush()
+
+    def _flush(self) -> None:
+        while self._current < self._num_answers:
+            text = self._buffers[self._current]
+            self._buffers[self._current] = ""
+            if not self._started:
+                text = text.lstrip("\n")
+                self._started = text != ""
+            if text:
+                click.echo(text, nl=False)
+
+            if not self._finished[self._current]:
+                return
+
+            click.echo()
+            if self._num_answers > 1:
+                click.echo("\n")
+            self._current += 1
+            self._started = False
+            self._header()
+
+    def _header(self) -> None:
+        if self._num_answers > 1 and self._current < self._num_answers:
+            click.echo(f"### ANSWER {self._current + 1} ###")
+
+
+def _verification_path(api_key_path: Path) -> Path:
+    return api_key_path.with_name(f"{api_key_path.name}_verification.json")
+
+
+def _write_keys(keys: Dict[str, dict], keys_path: Path) -> None:
+    """Only readable by the user, and written to a temporary file first, so that readers never see half a file"""
+    keys_path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = keys_path.with_name(f"{keys_path.name}.{os.getpid()}")
+    fd = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with open(fd, "w", encoding="utf8") as f:
+        json.dump(keys, f, indent=2)
+    os.replace(temporary_path, keys_path)
+
+
+def _key_hash(key: str) -> str:
+    return hashlib.sha256(key.encode("utf8")).hexdigest()
+
+
+def _is_api_key_format(key: str) -> bool:
+    return re.fullmatch(r"sk-[A-Za-z0-9_-]{20,}", key) is not None
+
+
+def _snapshot_path(config_path: Path) -> Path:
+    return config_path.with_name(f".{config_path.name}.snapshot.json")
+
 
 def _is_int(x):
     try:
@@ -12,6 +12,7 @@ setup(
     url="https://github.com/maxvfischer/askai",
     download_url="https://github.com/maxvfischer/askai/archive/refs/tags/v1.0.5.tar.gz",
     packages=["askai"],
+    package_data={"askai": ["data/vocab.bpe.gz"]},
     install_requires=[
         "click==8.1.3",
         "openai==0.25.0",
@@ -19,6 +20,6 @@ setup(
     ],
     entry_points="""
         [console_scripts]
-        askai=askai.entrypoint_askai:askai
+        askai=askai.daemon_client:main
     """
 )
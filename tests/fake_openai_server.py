@@ -0,0 +1,155 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List, Optional, Set
+
+import pytest
+from pytest import MonkeyPatch
+
+TOKEN = " tok"
+
+
+class FakeOpenAIServer:
+    """
+    Local stand-in for the OpenAI API, implementing `POST /v1/completions` with and without streaming.
+
+    Every answer is exactly `max_tokens` tokens long (or `answer_tokens`, if set) and ends with
+    finish_reason "length". `latency` is the time to the first byte, and `token_latency` the time between
+    streamed tokens. Status codes queued with `fail_next` are returned, one per request, before any answers.
+
+    Usage:
+        with FakeOpenAIServer(latency=0.05) as server:
+            openai.api_base = server.url
+    """
+
+    def __init__(self,
+                 latency: float = 0.0,
+                 token_latency: float = 0.0,
+                 answer_tokens: Optional[int] = None,
+                 retry_after: Optional[float] = None):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+        self.retry_after = retry_after
+        self.requests: List[dict] = []
+        self.connections: Set[int] = set()  # Client ports, to check that connections are reused
+        self.server_time = 0.0  # Total time spent handling requests, incl. latency
+        self._failures: List[int] = []
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def fail_next(self, status: int, count: int = 1) -> None:
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                start = time.perf_counter()
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                fake._handle(handler=self, path=self.path, body=body)
+                with fake._lock:
+                    fake.server_time += time.perf_counter() - start
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def _handle(self, handler: BaseHTTPRequestHandler, path: str, body: dict) -> None:
+        with self._lock:
+            self.requests.append(body)
+            self.connections.add(handler.client_address[1])
+            failure = self._failures.pop(0) if self._failures else None
+
+        if path != "/v1/completions":
+            return self._send_json(handler, 404, {"error": {"message": f"Unknown path {path}", "type": "invalid_request_error"}})
+
+        time.sleep(self.latency)
+        if failure is not None:
+            headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+            error_type = "requests" if failure == 429 else "server_error"
+            return self._send_json(handler, failure, {"error": {"message": f"Fake {failure}", "type": error_type}}, headers)
+
+        prompts = body.get("prompt", "")
+        prompts = prompts if isinstance(prompts, list) else [prompts]
+        num_choices = len(prompts) * body.get("n", 1)
+        num_tokens = self.answer_tokens if self.answer_tokens is not None else body.get("max_tokens", 16)
+
+        if body.get("stream"):
+            self._stream(handler=handler, model=body.get("model"), num_choices=num_choices, num_tokens=num_tokens)
+        else:
+            choices = [
+                {"text": TOKEN * num_tokens, "index": idx, "logprobs": None, "finish_reason": "length"}
+                for idx in range(num_choices)
+            ]
+            self._send_json(handler, 200, _completion(model=body.get("model"), choices=choices))
+
+    def _stream(self, handler: BaseHTTPRequestHandler, model: str, num_choices: int, num_tokens: int) -> None:
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.close_connection = True
+
+        for token_idx in range(num_tokens):
+            if token_idx:
+                time.sleep(self.token_latency)
+            for idx in range(num_choices):
+                finish_reason = "length" if token_idx == num_tokens - 1 else None
+                choice = {"text": TOKEN, "index": idx, "logprobs": None, "finish_reason": finish_reason}
+                handler.wfile.write(f"data: {json.dumps(_completion(model=model, choices=[choice]))}\n\n".encode())
+            handler.wfile.flush()
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
+
+    @staticmethod
+    def _send_json(handler: BaseHTTPRequestHandler, status: int, body: dict, headers: Optional[dict] = None) -> None:
+        data = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+
+def _completion(model: str, choices: List[dict]) -> dict:
+    return {
+        "id": "cmpl-fake",
+        "object": "text_completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": choices,
+    }
+
+
+@pytest.fixture
+def fake_openai_server(monkeypatch: MonkeyPatch) -> Iterator[FakeOpenAIServer]:
+    """A running fake server that openai sends all requests to"""
+    import openai
+
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1")
+    with FakeOpenAIServer() as server:
+        monkeypatch.setattr(openai, "api_base", server.url)
+        yield server
@@ -0,0 +1,102 @@
+import pytest_mock.plugin
+from openai.error import RateLimitError
+
+from askai.aimd import AIMDController
+from askai.client import Client
+from askai.utils import ConfigHelper
+from tests.test_client import CountingRateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_slow_start_doubles_window() -> None:
+    controller = AIMDController(maximum=100, clock=FakeClock())
+
+    for _ in range(7):
+        controller.record(latency=1.0)
+
+    assert controller.window == 8
+
+
+def test_rate_limit_halves_window_and_ends_slow_start() -> None:
+    clock = FakeClock()
+    controller = AIMDController(maximum=100, initial=16, clock=clock)
+    controller.record(latency=1.0)
+    controller.record(rate_limited=True)
+    assert controller.window == 8
+
+    # Additive increase: one more request per window of successes
+    for _ in range(8):
+        controller.record(latency=1.0)
+    assert controller.window == 9
+
+
+def test_decrease_at_most_once_per_latency() -> None:
+    clock = FakeClock()
+    controller = AIMDController(maximum=100, initial=32, clock=clock)
+    controller.record(latency=1.0)
+
+    controller.record(rate_limited=True)
+    controller.record(rate_limited=True)
+    assert controller.window == 16
+
+    clock.now += 2
+    controller.record(rate_limited=True)
+    assert controller.window == 8
+    assert controller.stats()["decreases"] == 2
+    assert controller.stats()["rate_limited"] == 3
+
+
+def test_latency_spike_cuts_window() -> None:
+    clock = FakeClock()
+    controller = AIMDController(maximum=100, initial=20, clock=clock)
+    for _ in range(10):
+        controller.record(latency=1.0)
+    assert controller.window == 30
+
+    for _ in range(10):
+        controller.record(latency=10.0)
+    assert controller.window == 15
+    assert controller.stats()["latency_spikes"] == 1
+
+
+def test_window_stays_within_bounds() -> None:
+    controller = AIMDController(maximum=4, clock=FakeClock())
+    for _ in range(10):
+        controller.record(latency=1.0)
+    assert controller.window == 4
+
+    for _ in range(5):
+        controller.record(rate_limited=True)
+    assert controller.window >= 1
+
+
+def test_history() -> None:
+    clock = FakeClock()
+    controller = AIMDController(maximum=100, initial=4, clock=clock)
+    clock.now = 1.5
+    controller.record(latency=1.0)
+    controller.record(rate_limited=True)
+
+    assert controller.stats()["history"] == [{"seconds": 1.5, "window": 5, "reason": "increase"},
+                                             {"seconds": 1.5, "window": 2, "reason": "rate limited"}]
+
+
+def test_client_reports_to_controller(mocker: pytest_mock.plugin.MockerFixture) -> None:
+    mocker.patch("openai.Completion.create", side_effect=[RateLimitError("Rate limit reached", headers={"Retry-After": "0"}),
+                                                          "response"])
+    controller = AIMDController(maximum=100, initial=8)
+
+    client = Client(config=ConfigHelper(), rate_limiter=CountingRateLimiter(), controller=controller)
+    assert client.create(prompt="question") == "response"
+
+    stats = controller.stats()
+    assert stats["requests"] == 2
+    assert stats["rate_limited"] == 1
+    assert stats["window"] == 4
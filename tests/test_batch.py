@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from askai.batch import BatchPrompt, Packer, ReorderBuffer, read_prompts, pack, split_choices
+from askai.utils import ConfigHelper
+
+
+def test_read_prompts_plain() -> None:
+    config = ConfigHelper()
+    prompts = list(read_prompts(lines=["first\n", "\n", "second\n"], config=config))
+
+    assert [(p.index, p.prompt) for p in prompts] == [(0, "first"), (1, "second")]
+    assert all(p.config == config for p in prompts)
+
+
+def test_read_prompts_jsonl_overrides() -> None:
+    lines = ['{"prompt": "first"}\n', '{"prompt": "second", "max_tokens": 1, "temperature": 0}\n']
+    prompts = list(read_prompts(lines=lines, config=ConfigHelper(), jsonl=True))
+
+    assert prompts[0].config == ConfigHelper()
+    assert prompts[1].config == ConfigHelper(max_tokens=1, temperature=0)
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "not json",
+        '{"no_prompt": "first"}',
+        '["prompt"]',
+        '{"prompt": "first", "unknown": 1}',
+    ]
+)
+def test_read_prompts_jsonl_bad_input(line: str) -> None:
+    with pytest.raises(ValueError):
+        list(read_prompts(lines=[line], config=ConfigHelper(), jsonl=True))
+
+
+def test_pack_groups_by_config() -> None:
+    config, other_config = ConfigHelper(), ConfigHelper(max_tokens=1)
+    prompts = [BatchPrompt(index=idx, prompt=str(idx), config=config if idx % 3 else other_config) for idx in range(10)]
+    groups = list(pack(prompts=prompts, max_prompts=3))
+
+    assert sorted(p.index for group in groups for p in group) == list(range(10))
+    for group in groups:
+        assert 0 < len(group) <= 3
+        assert len({id(p.config) for p in group}) == 1
+
+
+def test_packer_expires_groups_that_are_not_full() -> None:
+    now = [0.0]
+    packer = Packer(max_prompts=3, clock=lambda: now[0])
+    config, other_config = ConfigHelper(), ConfigHelper(max_tokens=1)
+    packer.add(BatchPrompt(index=0, prompt="0", config=other_config))
+    now[0] = 4.0
+    packer.add(BatchPrompt(index=1, prompt="1", config=config))
+    now[0] = 5.0
+
+    assert [[p.index for p in group] for group in packer.expired(max_wait=5.0)] == [[0]]
+    assert packer.expired(max_wait=5.0) == []
+    assert [[p.index for p in group] for group in packer.flush()] == [[1]]
+
+
+def test_split_choices_multiple_answers() -> None:
+    config = ConfigHelper(num_answers=2)
+    group = [BatchPrompt(index=5, prompt="a", config=config), BatchPrompt(index=6, prompt="b", config=config)]
+    response = {"choices": [{"index": idx, "text": f"\n{text}"} for idx, text in [(3, "b2"), (0, "a1"), (2, "b1"), (1, "a2")]]}
+
+    assert split_choices(group=group, response=response) == [
+        {"index": 5, "prompt": "a", "answers": ["a1", "a2"]},
+        {"index": 6, "prompt": "b", "answers": ["b1", "b2"]},
+    ]
+
+
+def test_reorder_buffer() -> None:
+    results = [{"index": idx} for idx in range(100)]
+    shuffled = random.Random(0).sample(results, len(results))
+
+    reorder_buffer = ReorderBuffer()
+    ordered = [ready for result in shuffled for ready in reorder_buffer.add(result)]
+    assert ordered == results
+    assert len(reorder_buffer) == 0
@@ -0,0 +1,186 @@
+"""
+End-to-end benchmarks against the fake OpenAI server.
+
+Every benchmark fails if its mean is over its budget. The budgets leave room for slow machines, so they catch
+large regressions. The slow benchmarks only run when selected:
+    pytest tests/test_benchmarks.py --benchmark-only -m "slow or not slow"
+
+To catch smaller regressions on one machine, save a baseline and compare later runs against it:
+    pytest tests/test_benchmarks.py --benchmark-only --benchmark-autosave
+    pytest tests/test_benchmarks.py --benchmark-only --benchmark-compare --benchmark-compare-fail=mean:15%
+"""
+import io
+import subprocess
+import sys
+from pathlib import Path
+from typing import List
+
+import pytest
+from pytest import CaptureFixture
+
+from askai.entrypoint_askai import _ask
+from askai.entrypoint_batch import _batch
+from askai.utils import ConfigHelper, PrintHelper, _snapshot_path
+from tests.fake_openai_server import FakeOpenAIServer, TOKEN, fake_openai_server  # noqa: F401
+from tests.test_entrypoint_askai import askai_paths  # noqa: F401
+from tests.test_import_time import RUN_ASKAI
+
+pytest.importorskip("pytest_benchmark")
+
+ROUNDS = 5
+
+
+def _assert_mean_below(benchmark, seconds: float) -> None:
+    """Fail if the benchmark's mean is over its budget. Benchmarks that were disabled have no stats"""
+    if benchmark.stats is not None:
+        assert benchmark.stats.stats.mean < seconds
+
+
+def _skip_if_disabled(benchmark) -> None:
+    """Don't build large inputs for a benchmark that only runs once, as a test"""
+    if benchmark.disabled:
+        pytest.skip("Benchmarks are disabled")
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--help"],
+        ["config", "show"],
+        ["key", "--help"],
+        ["batch", "--help"],
+    ]
+)
+def test_cold_start(benchmark, tmp_path: Path, args: List[str]) -> None:
+    config_path = tmp_path / ".askai" / "config.yml"
+    config_path.parent.mkdir()
+    ConfigHelper.reset(config_path=config_path)
+
+    def run() -> None:
+        subprocess.run(
+            [sys.executable, "-c", RUN_ASKAI, *args],
+            env={"HOME": str(tmp_path), "PYTHONPATH": str(Path(__file__).parents[1])},
+            stdout=subprocess.DEVNULL,
+            check=True
+        )
+
+    benchmark.pedantic(run, rounds=ROUNDS, warmup_rounds=1)
+    _assert_mean_below(benchmark, seconds=0.5)
+
+
+@pytest.mark.parametrize("snapshot", [True, False])
+def test_config_from_file(benchmark, tmp_path: Path, snapshot: bool) -> None:
+    config_path = tmp_path / "config.yml"
+    ConfigHelper.reset(config_path=config_path)
+
+    def setup() -> None:
+        if not snapshot:
+            _snapshot_path(config_path=config_path).unlink(missing_ok=True)
+
+    benchmark.pedantic(ConfigHelper.from_file, kwargs={"config_path": config_path}, setup=setup, rounds=50)
+    _assert_mean_below(benchmark, seconds=0.005)
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_ask_overhead(benchmark,
+                      fake_openai_server: FakeOpenAIServer,
+                      askai_paths: dict,
+                      capsys: CaptureFixture,
+                      stream: bool) -> None:
+    """Time for a single question when the server answers immediately"""
+    def run() -> None:
+        _ask(prompt="question", overrides={"max_tokens": 50}, stream=stream, use_cache=False, **askai_paths)
+        capsys.readouterr()
+
+    benchmark.pedantic(run, rounds=20, warmup_rounds=1)
+    benchmark.extra_info["server_seconds_per_request"] = fake_openai_server.server_time / len(fake_openai_server.requests)
+    _assert_mean_below(benchmark, seconds=0.2)
+
+
+@pytest.mark.parametrize("num_answers", [16, 128])
+def test_print_response(benchmark, capsys: CaptureFixture, num_answers: int) -> None:
+    response = {"choices": [{"index": idx, "text": f"\n\n{TOKEN * 300}"} for idx in range(num_answers)]}
+
+    def run() -> None:
+        PrintHelper.print_response(response=response)
+        capsys.readouterr()
+
+    benchmark.pedantic(run, rounds=20)
+    _assert_mean_below(benchmark, seconds=0.005)
+
+
+@pytest.mark.parametrize(
+    "concurrency, budget",
+    [
+        pytest.param(1, 10.0, marks=pytest.mark.slow),
+        (8, 2.0),
+    ]
+)
+def test_batch_throughput(benchmark,
+                          fake_openai_server: FakeOpenAIServer,
+                          askai_paths: dict,
+                          concurrency: int,
+                          budget: float) -> None:
+    """100 single-prompt requests with 10 ms server latency"""
+    fake_openai_server.latency = 0.01
+
+    def run() -> None:
+        _batch(
+            input_file=io.StringIO("".join(f"prompt {idx}\n" for idx in range(100))),
+            output=io.StringIO(),
+            batch_size=1,
+            concurrency=concurrency,
+            overrides={"max_tokens": 5},
+            api_key_path=askai_paths["api_key_path"],
+            config_path=askai_paths["config_path"]
+        )
+
+    benchmark.pedantic(run, rounds=3)
+    _assert_mean_below(benchmark, seconds=budget)
+
+
+@pytest.mark.slow
+def test_similar_lookup(benchmark, tmp_path: Path) -> None:
+    """Finding a similar prompt among 100k cached ones"""
+    import random
+    from askai import simhash
+    from askai.cache import ResponseCache
+
+    _skip_if_disabled(benchmark)
+    config_helper = ConfigHelper()
+    cache = ResponseCache(cache_path=tmp_path / "cache.db")
+    connection = cache._connect()
+    fingerprints = [random.Random(idx).getrandbits(simhash.BITS) for idx in range(100_000)]
+    with connection:
+        connection.executemany(
+            f"INSERT INTO fingerprints VALUES (?, ?, ?, {', '.join('?' * simhash.BANDS)})",
+            ((str(idx), cache.config_key(config=config_helper), simhash.to_signed(fingerprint), *simhash.bands(fingerprint))
+             for idx, fingerprint in enumerate(fingerprints))
+        )
+    cache.set(key="key", response={"choices": []}, prompt="question", config=config_helper)
+
+    result = benchmark.pedantic(cache.get_similar, kwargs={"prompt": "Question?", "config": config_helper}, rounds=200)
+    assert result == {"choices": []}
+    _assert_mean_below(benchmark, seconds=0.001)
+
+
+@pytest.mark.slow
+def test_resume_scan(benchmark, tmp_path: Path) -> None:
+    """Resuming a batch of 1M prompts that are all answered but the last one"""
+    from askai.journal import Journal
+
+    _skip_if_disabled(benchmark)
+    input_path = tmp_path / "prompts.jsonl"
+    input_path.write_text("".join(f'{{"prompt": "Is this spam? Message {idx}", "max_tokens": 1}}\n'
+                                  for idx in range(1_000_000)))
+    journal_path = tmp_path / "prompts.journal"
+    with open(input_path, encoding="utf8") as f, Journal(path=journal_path) as journal:
+        for index, _, _ in journal.unanswered(f):
+            journal.record({"index": index, **({"error": "Timed out"} if index == 999_999 else {})})
+
+    def run() -> list:
+        with open(input_path, encoding="utf8") as f, Journal(path=journal_path, resume=True) as journal:
+            return list(journal.unanswered(f))
+
+    assert len(benchmark.pedantic(run, rounds=3)) == 1
+    _assert_mean_below(benchmark, seconds=1.0)
@@ -0,0 +1,48 @@
+import pytest
+
+from askai.chat import Conversation, count_tokens, prompt_budget
+from askai.constants import CHAT_PREAMBLE
+
+
+def test_prompt_contains_history() -> None:
+    conversation = Conversation(budget=1000)
+    conversation.add(question="What is ls?", answer="\n\nIt lists files.")
+
+    prompt = conversation.prompt(question="And ls -a?")
+    assert prompt == (CHAT_PREAMBLE +
+                      "\nUser: What is ls?\nAssistant: It lists files.\n"
+                      "\nUser: And ls -a?\nAssistant:")
+
+
+def test_oldest_turns_are_dropped_to_fit_budget() -> None:
+    budget = count_tokens(CHAT_PREAMBLE) + 60
+    conversation = Conversation(budget=budget)
+    for idx in range(10):
+        conversation.add(question=f"question {idx}", answer="answer " * 5)
+
+    prompt = conversation.prompt(question="last question")
+    assert count_tokens(prompt) <= budget
+    assert "question 9" in prompt
+    assert "question 0" not in prompt
+    assert 0 < len(conversation) < 10
+
+
+def test_question_too_long() -> None:
+    conversation = Conversation(budget=count_tokens(CHAT_PREAMBLE) + 10)
+    conversation.add(question="question", answer="answer")
+    with pytest.raises(ValueError):
+        conversation.prompt(question="word " * 100)
+    assert len(conversation) == 1
+
+
+def test_clear() -> None:
+    conversation = Conversation(budget=1000)
+    conversation.add(question="question", answer="answer")
+    conversation.clear()
+    assert len(conversation) == 0
+    assert conversation.prompt(question="q") == CHAT_PREAMBLE + "\nUser: q\nAssistant:"
+
+
+def test_prompt_budget() -> None:
+    assert prompt_budget(model="text-davinci-003", max_tokens=1000) == 3000
+    assert prompt_budget(model="text-ada-001", max_tokens=2048) == 0
@@ -0,0 +1,30 @@
+import pytest_mock.plugin
+from openai.error import Timeout
+
+from askai.client import Client
+from askai.utils import ConfigHelper
+
+
+class CountingRateLimiter:
+    def __init__(self):
+        self.tokens = []
+
+    def acquire(self, tokens: int) -> float:
+        self.tokens.append(tokens)
+        return 0.0
+
+
+def test_create(mocker: pytest_mock.plugin.MockerFixture) -> None:
+    create = mocker.patch("openai.Completion.create", return_value="response")
+    config = ConfigHelper(max_tokens=10, num_answers=2)
+
+    assert Client(config=config, rate_limiter=CountingRateLimiter()).create(prompt="question") == "response"
+    assert create.call_args.kwargs == {"prompt": "question", "stream": False, **config.completion_kwargs()}
+
+
+def test_create_waits_for_rate_limiter_on_every_attempt(mocker: pytest_mock.plugin.MockerFixture) -> None:
+    mocker.patch("openai.Completion.create", side_effect=[Timeout(headers={"Retry-After": "0"}), "response"])
+    rate_limiter = CountingRateLimiter()
+
+    Client(config=ConfigHelper(max_tokens=10, num_answers=2), rate_limiter=rate_limiter).create(prompt="12345678")
+    assert rate_limiter.tokens == [2 + 20, 2 + 20]
@@ -2,11 +2,13 @@ from pathlib import Path
 from typing import Callable
 
 import pytest
+import pytest_mock.plugin
 from pytest import MonkeyPatch
 import yaml
 
 from askai.constants import DEFAULT_MODEL, DEFAULT_TEMPERATURE, DEFAULT_NUM_ANSWERS, DEFAULT_MAX_TOKENS, DEFAULT_TOP_P, \
-    DEFAULT_FREQUENCY_PENALTY, DEFAULT_PRESENCE_PENALTY
+    DEFAULT_FREQUENCY_PENALTY, DEFAULT_PRESENCE_PENALTY, DEFAULT_MAX_RETRIES, DEFAULT_RETRY_TIMEOUT, \
+    DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
 from askai.utils import ConfigHelper, AvailableModels
 
 DUMMY_CONFIG_CONTENT = {
@@ -16,7 +18,12 @@ DUMMY_CONFIG_CONTENT = {
     "temperature": 0.1,
     "top_p": 0.1,
     "frequency_penalty": 0.1,
-    "presence_penalty": 0.1
+    "presence_penalty": 0.1,
+    "max_retries": 1,
+    "retry_timeout": 1.0,
+    "requests_per_minute": 1,
+    "tokens_per_minute": 1,
+    "routes": [{"model": "text-curie-001", "max_tokens": 10}]
 }
 
 
@@ -29,6 +36,10 @@ def test_default_init() -> None:
     assert config_helper.top_p == DEFAULT_TOP_P
     assert config_helper.frequency_penalty == DEFAULT_FREQUENCY_PENALTY
     assert config_helper.presence_penalty == DEFAULT_PRESENCE_PENALTY
+    assert config_helper.max_retries == DEFAULT_MAX_RETRIES
+    assert config_helper.retry_timeout == DEFAULT_RETRY_TIMEOUT
+    assert config_helper.requests_per_minute == DEFAULT_REQUESTS_PER_MINUTE
+    assert config_helper.tokens_per_minute == DEFAULT_TOKENS_PER_MINUTE
 
 
 def test_init_with_args_and_as_dict() -> None:
@@ -44,11 +55,53 @@ def test_from_file_config_exists(tmp_path: Path) -> None:
     assert DUMMY_CONFIG_CONTENT == config_helper.as_dict()
 
 
-def _write_config_file(content: dict, path: Path) -> None:
+def _write_config_file(content, path: Path) -> None:
     with open(path, "w") as f:
         yaml.dump(content, f)
 
 
+def test_from_file_uses_snapshot(mocker: pytest_mock.plugin.MockerFixture, tmp_path: Path) -> None:
+    config_path = tmp_path / "dummy_config.yml"
+    _write_config_file(content=DUMMY_CONFIG_CONTENT, path=config_path)
+    from_yaml = mocker.spy(ConfigHelper, "_from_yaml")
+
+    assert ConfigHelper.from_file(config_path=config_path).as_dict() == DUMMY_CONFIG_CONTENT
+    assert ConfigHelper.from_file(config_path=config_path).as_dict() == DUMMY_CONFIG_CONTENT
+    assert from_yaml.call_count == 1
+
+
+def test_from_file_snapshot_outdated(tmp_path: Path) -> None:
+    config_path = tmp_path / "dummy_config.yml"
+    _write_config_file(content=DUMMY_CONFIG_CONTENT, path=config_path)
+    _ = ConfigHelper.from_file(config_path=config_path)
+
+    updated_content = {**DUMMY_CONFIG_CONTENT, "max_tokens": 1234}
+    _write_config_file(content=updated_content, path=config_path)
+    assert ConfigHelper.from_file(config_path=config_path).as_dict() == updated_content
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        {**DUMMY_CONFIG_CONTENT, "temperature": 5.0},
+        {**DUMMY_CONFIG_CONTENT, "num_answers": 0},
+        {**DUMMY_CONFIG_CONTENT, "max_tokens": "many"},
+        {**DUMMY_CONFIG_CONTENT, "unknown": 1},
+        {**DUMMY_CONFIG_CONTENT, "routes": {"model": "text-ada-001"}},
+        {**DUMMY_CONFIG_CONTENT, "routes": [{"model": "gpt-99"}]},
+        {**DUMMY_CONFIG_CONTENT, "routes": [{"model": "text-ada-001", "pattern": "("}]},
+        {**DUMMY_CONFIG_CONTENT, "routes": [{"model": "text-ada-001", "max_tokens": -1}]},
+        {**DUMMY_CONFIG_CONTENT, "routes": [{"model": "text-ada-001", "unknown": 1}]},
+        ["not", "a", "mapping"],
+    ]
+)
+def test_from_file_config_not_valid(tmp_path: Path, content) -> None:
+    config_path = tmp_path / "dummy_config.yml"
+    _write_config_file(content=content, path=config_path)
+    with pytest.raises(SystemExit):
+        _ = ConfigHelper.from_file(config_path=config_path)
+
+
 def test_from_file_config_does_not_exist(tmp_path: Path) -> None:
     config_path = tmp_path / "dummy_config.yml"
     with pytest.raises(SystemExit):
@@ -142,6 +195,43 @@ def test_input_frequency_penalty_ok(monkeypatch: MonkeyPatch) -> None:
     assert float(user_input) == config_helper.frequency_penalty
 
 
+def test_input_max_retries_ok(monkeypatch: MonkeyPatch) -> None:
+    user_input = "0"
+    mock_input_value(value=user_input, monkeypatch=monkeypatch)
+
+    config_helper = ConfigHelper()
+    assert int(user_input) != config_helper.max_retries
+    config_helper.input_max_retries(max_input_tries=1)
+    assert int(user_input) == config_helper.max_retries
+
+
+def test_input_retry_timeout_ok(monkeypatch: MonkeyPatch) -> None:
+    user_input = "0.5"
+    mock_input_value(value=user_input, monkeypatch=monkeypatch)
+
+    config_helper = ConfigHelper()
+    assert float(user_input) != config_helper.retry_timeout
+    config_helper.input_retry_timeout(max_input_tries=1)
+    assert float(user_input) == config_helper.retry_timeout
+
+
+@pytest.mark.parametrize(
+    "input_func_name, instance_variable_name",
+    [
+        ("input_requests_per_minute", "requests_per_minute"),
+        ("input_tokens_per_minute", "tokens_per_minute"),
+    ]
+)
+def test_input_per_minute_limit_ok(monkeypatch: MonkeyPatch, input_func_name: str, instance_variable_name: str) -> None:
+    user_input = "3000"
+    mock_input_value(value=user_input, monkeypatch=monkeypatch)
+
+    config_helper = ConfigHelper()
+    assert int(user_input) != getattr(config_helper, instance_variable_name)
+    getattr(config_helper, input_func_name)(max_input_tries=1)
+    assert int(user_input) == getattr(config_helper, instance_variable_name)
+
+
 def test_input_presence_penalty_ok(monkeypatch: MonkeyPatch) -> None:
     user_input = "1.5"
     min_value = float(user_input) - 1.0
@@ -235,7 +325,12 @@ def test_as_dict() -> None:
         'temperature': config_helper.temperature,
         'top_p': config_helper.top_p,
         'frequency_penalty': config_helper.frequency_penalty,
-        'presence_penalty': config_helper.presence_penalty
+        'presence_penalty': config_helper.presence_penalty,
+        'max_retries': config_helper.max_retries,
+        'retry_timeout': config_helper.retry_timeout,
+        'requests_per_minute': config_helper.requests_per_minute,
+        'tokens_per_minute': config_helper.tokens_per_minute,
+        'routes': config_helper.routes
     }
     assert config_helper.as_dict() == expected
 
@@ -268,3 +363,22 @@ def test_reset(tmp_path: Path) -> None:
 
     assert config_before_reset != config_after_reset
     assert config_after_reset == ConfigHelper().as_dict()
+
+
+def test_with_overrides() -> None:
+    config_helper = ConfigHelper(**DUMMY_CONFIG_CONTENT)
+    overridden = config_helper.with_overrides(model="text-curie-001", temperature=0.0, top_p=None)
+
+    assert overridden.model == "text-curie-001"
+    assert overridden.temperature == 0.0
+    assert overridden.top_p == DUMMY_CONFIG_CONTENT["top_p"]
+    assert config_helper.as_dict() == DUMMY_CONFIG_CONTENT
+
+
+def test_completion_kwargs() -> None:
+    kwargs = ConfigHelper(**DUMMY_CONFIG_CONTENT).completion_kwargs()
+    assert kwargs["n"] == DUMMY_CONFIG_CONTENT["num_answers"]
+    assert "num_answers" not in kwargs
+    assert "max_retries" not in kwargs
+    assert "retry_timeout" not in kwargs
+    assert len(kwargs) == 7
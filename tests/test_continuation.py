@@ -0,0 +1,117 @@
+from typing import Iterator, List, Tuple
+
+from openai.error import RateLimitError
+
+from askai.continuation import continue_response, continue_stream
+
+MODEL = "text-davinci-003"
+
+
+class _Create:
+    """Answers continuation requests with the given pieces, each cut off by length except the last one"""
+
+    def __init__(self, pieces: List[str], stream: bool = False, fail: bool = False):
+        self.pieces = pieces
+        self.fail = fail
+        self.calls: List[Tuple[str, int, bool]] = []
+
+    def __call__(self, prompt: str, max_tokens: int, stream: bool):
+        self.calls.append((prompt, max_tokens, stream))
+        if self.fail:
+            raise RateLimitError("Rate limit reached")
+        piece = self.pieces[len(self.calls) - 1]
+        finish_reason = "length" if len(self.calls) < len(self.pieces) else "stop"
+        if stream:
+            return self._stream(piece=piece, finish_reason=finish_reason)
+        return {"choices": [{"index": 0, "text": piece, "finish_reason": finish_reason}]}
+
+    @staticmethod
+    def _stream(piece: str, finish_reason: str) -> Iterator[dict]:
+        for word in piece.split(" "):
+            yield {"choices": [{"index": 0, "text": word + " ", "finish_reason": None}]}
+        yield {"choices": [{"index": 0, "text": "", "finish_reason": finish_reason}]}
+
+
+def _response(texts: List[str], finish_reasons: List[str]) -> dict:
+    return {"choices": [{"index": idx, "text": text, "finish_reason": finish_reason}
+                        for idx, (text, finish_reason) in enumerate(zip(texts, finish_reasons))]}
+
+
+def test_continue_response() -> None:
+    create = _Create(pieces=[" two", " three"])
+    response = _response(texts=["one", "done"], finish_reasons=["length", "stop"])
+
+    continued = continue_response(response=response, prompt="Count:", model=MODEL, max_tokens=10, budget=100,
+                                  create=create)
+
+    assert [choice["text"] for choice in continued["choices"]] == ["one two three", "done"]
+    assert continued["choices"][0]["finish_reason"] == "stop"
+    assert create.calls == [("Count:one", 10, False), ("Count:one two", 10, False)]
+
+
+def test_continue_response_stops_at_budget() -> None:
+    create = _Create(pieces=[" two", " three", " four"])
+    response = _response(texts=["one"], finish_reasons=["length"])
+
+    continued = continue_response(response=response, prompt="Count:", model=MODEL, max_tokens=10, budget=25,
+                                  create=create)
+
+    assert continued["choices"][0]["text"] == "one two three"
+    assert continued["choices"][0]["finish_reason"] == "length"
+    assert [max_tokens for _, max_tokens, _ in create.calls] == [10, 5]
+
+
+def test_continue_response_keeps_answer_when_request_fails() -> None:
+    create = _Create(pieces=[], fail=True)
+    response = _response(texts=["one"], finish_reasons=["length"])
+
+    continued = continue_response(response=response, prompt="Count:", model=MODEL, max_tokens=10, budget=100,
+                                  create=create)
+
+    assert continued["choices"][0] == {"index": 0, "text": "one", "finish_reason": "length"}
+
+
+def test_continue_stream_holds_back_length_finish() -> None:
+    create = _Create(pieces=["two three", "four"])
+    response = iter([
+        {"choices": [{"index": 0, "text": "one ", "finish_reason": None},
+                     {"index": 1, "text": "yes", "finish_reason": None}]},
+        {"choices": [{"index": 0, "text": "", "finish_reason": "length"},
+                     {"index": 1, "text": "", "finish_reason": "stop"}]},
+    ])
+
+    chunks = list(continue_stream(response=response, prompt="Count:", model=MODEL, max_tokens=10, budget=100,
+                                  create=create))
+
+    answers = {0: "", 1: ""}
+    finishes = {0: [], 1: []}
+    for chunk in chunks:
+        for choice in chunk["choices"]:
+            answers[choice["index"]] += choice["text"]
+            if choice["finish_reason"] is not None:
+                finishes[choice["index"]].append(choice["finish_reason"])
+    assert answers == {0: "one two three four ", 1: "yes"}
+    assert finishes == {0: ["stop"], 1: ["stop"]}
+    assert [prompt for prompt, _, stream in create.calls] == ["Count:one ", "Count:one two three "]
+    assert all(stream for _, _, stream in create.calls)
+
+
+def test_continue_stream_sends_finish_when_request_fails() -> None:
+    create = _Create(pieces=[], fail=True)
+    response = iter([{"choices": [{"index": 0, "text": "one", "finish_reason": "length"}]}])
+
+    chunks = list(continue_stream(response=response, prompt="Count:", model=MODEL, max_tokens=10, budget=100,
+                                  create=create))
+
+    assert [choice["finish_reason"] for chunk in chunks for choice in chunk["choices"]] == [None, "length"]
+
+
+def test_continue_stream_without_budget_passes_through() -> None:
+    create = _Create(pieces=[])
+    chunk = {"choices": [{"index": 0, "text": "one", "finish_reason": "length"}]}
+
+    chunks = list(continue_stream(response=iter([chunk]), prompt="Count:", model=MODEL, max_tokens=10, budget=10,
+                                  create=create))
+
+    assert chunks == [chunk]
+    assert create.calls == []
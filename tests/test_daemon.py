@@ -0,0 +1,154 @@
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Iterator, List
+
+import click
+import pytest
+from pytest import CaptureFixture
+
+from askai.daemon import Daemon
+from askai.daemon_client import _absolute_paths, forward, is_forwardable
+from askai.utils import ConfigHelper
+from tests.fake_openai_server import FakeOpenAIServer, TOKEN
+
+RUN_CLIENT = "from askai.daemon_client import main; main()"
+RUN_ASKAI = "import sys; from askai.entrypoint_askai import askai; askai(sys.argv[1:])"
+
+
+def _fake_run(args: List[str]) -> int:
+    print(f"answer to {args[0]}")
+    click.echo("warning", err=True)
+    return 3
+
+
+@pytest.fixture
+def daemon(tmp_path: Path) -> Iterator[Daemon]:
+    daemon = Daemon(socket_path=tmp_path / "askai.sock", workers=2, run=_fake_run)
+    with daemon.redirected_output():
+        thread = threading.Thread(target=daemon.serve_forever, kwargs={"poll_interval": 0.01})
+        thread.start()
+        yield daemon
+        daemon.shutdown()
+        thread.join()
+    daemon.server_close()
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        (["how do I list files?"], True),
+        (["how do I list files?", "-n", "2", "--stream"], True),
+        ([], False),
+        (["--help"], False),
+        (["question", "--help"], False),
+        (["config", "show"], False),
+        (["batch", "prompts.txt"], False),
+        (["serve"], False),
+        (["summarize", "-f", "notes.txt"], True),
+        (["summarize", "-f", "-"], False),
+        (["summarize", "--file=-"], False),
+        (["summarize", "-f-"], False),
+    ]
+)
+def test_is_forwardable(args: List[str], expected: bool) -> None:
+    assert is_forwardable(args=args) is expected
+
+
+def test_absolute_paths(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    assert _absolute_paths(["q", "--timings-json", "t.jsonl"]) == ["q", "--timings-json", str(tmp_path / "t.jsonl")]
+    assert _absolute_paths(["q", "--timings-json=t.jsonl"]) == ["q", f"--timings-json={tmp_path / 't.jsonl'}"]
+    assert _absolute_paths(["q", "-f", "notes.txt", "-n", "2"]) == ["q", "-f", str(tmp_path / "notes.txt"), "-n", "2"]
+    assert _absolute_paths(["q", "--file", "notes.txt"]) == ["q", "--file", str(tmp_path / "notes.txt")]
+    assert _absolute_paths(["q", "--file=notes.txt"]) == ["q", f"--file={tmp_path / 'notes.txt'}"]
+    assert _absolute_paths(["q", "-fnotes.txt"]) == ["q", f"--file={tmp_path / 'notes.txt'}"]
+
+
+def test_forward_without_daemon(tmp_path: Path) -> None:
+    assert forward(args=["question"], socket_path=tmp_path / "askai.sock") is None
+
+
+def test_forward(daemon: Daemon, capsys: CaptureFixture) -> None:
+    exit_code = forward(args=["question"], socket_path=Path(daemon.server_address))
+    captured = capsys.readouterr()
+
+    assert exit_code == 3
+    assert captured.out == "answer to question\n"
+    assert captured.err == "warning\n"
+
+
+def test_forward_concurrently(daemon: Daemon) -> None:
+    exit_codes = []
+    threads = [
+        threading.Thread(target=lambda: exit_codes.append(forward(args=["q"], socket_path=Path(daemon.server_address))))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert exit_codes == [3] * 5
+
+
+def test_daemon_refuses_local_commands(daemon: Daemon, capsys: CaptureFixture) -> None:
+    assert forward(args=["config", "reset"], socket_path=Path(daemon.server_address)) == 2
+    assert "only answers questions" in capsys.readouterr().err
+
+
+def _wait_for(path: Path, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not path.exists():
+        assert time.monotonic() < deadline, f"{path} was not created"
+        time.sleep(0.02)
+
+
+def test_serve_end_to_end(tmp_path: Path) -> None:
+    askai_path = tmp_path / ".askai"
+    askai_path.mkdir()
+    (askai_path / "key").write_text("sk-" + "a" * 48)
+    config_path = askai_path / "config.yml"
+    ConfigHelper.reset(config_path=config_path)
+
+    with FakeOpenAIServer() as server:
+        env = {
+            "HOME": str(tmp_path),
+            "PYTHONPATH": str(Path(__file__).parents[1]),
+            "OPENAI_API_BASE": server.url,
+            "NO_PROXY": "127.0.0.1",
+        }
+        daemon = subprocess.Popen([sys.executable, "-c", RUN_ASKAI, "serve", "--workers", "1"], env=env, stdout=subprocess.DEVNULL)
+        try:
+            _wait_for(askai_path / "askai.sock")
+
+            def ask(*args: str) -> subprocess.CompletedProcess:
+                return subprocess.run(
+                    [sys.executable, "-X", "importtime", "-c", RUN_CLIENT, *args],
+                    env=env,
+                    capture_output=True,
+                    text=True
+                )
+
+            result = ask("question", "--max-tokens", "3", "--no-stream", "--no-cache")
+            assert result.returncode == 0
+            assert result.stdout.strip() == (TOKEN * 3).strip()
+            imported = {line.split("|")[-1].strip() for line in result.stderr.splitlines() if "|" in line}
+            assert "askai.daemon_client" in imported
+            assert not {"click", "openai", "yaml"} & imported
+
+            # The config is reloaded when it changes
+            replace(ConfigHelper.from_file(config_path=config_path), max_tokens=5).update(config_path=config_path)
+            result = ask("question", "--no-stream", "--no-cache")
+            assert result.stdout.strip() == (TOKEN * 5).strip()
+
+            assert len(server.requests) == 2
+            assert len(server.connections) == 1  # Kept alive between questions
+        finally:
+            daemon.terminate()
+            daemon.wait(timeout=10)
+
+    assert daemon.returncode == 0
+    assert not (askai_path / "askai.sock").exists()
@@ -0,0 +1,87 @@
+import io
+import json
+from pathlib import Path
+
+import pytest
+from pytest import CaptureFixture
+
+from askai.entrypoint_askai import _ask
+from askai.entrypoint_batch import _batch
+from tests.fake_openai_server import FakeOpenAIServer, TOKEN, fake_openai_server  # noqa: F401
+from tests.test_entrypoint_askai import askai_paths  # noqa: F401
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_ask(fake_openai_server: FakeOpenAIServer, askai_paths: dict, capsys: CaptureFixture, stream: bool) -> None:
+    _ask(prompt="question", overrides={"max_tokens": 5, "num_answers": 2}, stream=stream, use_cache=False, **askai_paths)
+
+    assert capsys.readouterr().out == f"### ANSWER 1 ###\n{TOKEN * 5}\n\n\n### ANSWER 2 ###\n{TOKEN * 5}\n\n\n"
+    assert fake_openai_server.requests[0]["prompt"] == "question"
+    assert fake_openai_server.requests[0]["stream"] == stream
+
+
+def test_ask_retries_rate_limit(fake_openai_server: FakeOpenAIServer, askai_paths: dict, capsys: CaptureFixture) -> None:
+    fake_openai_server.retry_after = 0
+    fake_openai_server.fail_next(status=429)
+    fake_openai_server.fail_next(status=500)
+
+    _ask(prompt="question", overrides={"max_tokens": 1}, stream=False, use_cache=False, **askai_paths)
+
+    assert capsys.readouterr().out == f"{TOKEN}\n"
+    assert len(fake_openai_server.requests) == 3
+
+
+def test_batch(fake_openai_server: FakeOpenAIServer, askai_paths: dict) -> None:
+    output = io.StringIO()
+    _batch(
+        input_file=io.StringIO("".join(f"prompt {idx}\n" for idx in range(45))),
+        output=output,
+        concurrency=4,
+        ordered=True,
+        overrides={"max_tokens": 2},
+        api_key_path=askai_paths["api_key_path"],
+        config_path=askai_paths["config_path"]
+    )
+
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [r["index"] for r in results] == list(range(45))
+    assert all(r["answers"] == [TOKEN * 2] for r in results)
+    assert len(fake_openai_server.requests) == 3  # 20 + 20 + 5 prompts
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_ask_timings(fake_openai_server: FakeOpenAIServer,
+                     askai_paths: dict,
+                     capsys: CaptureFixture,
+                     tmp_path: Path,
+                     stream: bool) -> None:
+    fake_openai_server.latency = 0.05
+    timings_json = tmp_path / "timings.jsonl"
+    _ask(prompt="question", overrides={"max_tokens": 3}, stream=stream, show_timings=True, timings_json=timings_json,
+         **askai_paths)
+    captured = capsys.readouterr()
+
+    assert captured.out.strip() == (TOKEN * 3).strip()
+    assert "Timings:" in captured.err and "first byte" in captured.err
+    record = json.loads(timings_json.read_text())
+    assert record["status"] == "ok" and record["stream"] is stream
+    assert {"import openai", "config", "cache", "key", "connect", "first byte", "download", "render"} <= set(record["phases"])
+    assert record["phases"]["first byte"] >= 0.05
+    assert record["total"] >= sum(record["phases"].values()) - 1e-6
+
+
+def test_ask_file_map_reduce(fake_openai_server: FakeOpenAIServer, askai_paths: dict, capsys: CaptureFixture) -> None:
+    text = "\n".join(f"line {idx}: something happened" for idx in range(2000))  # ~16k tokens
+    _ask(prompt="What happened?", overrides={"model": "text-ada-001", "max_tokens": 400}, stream=True,
+         input_file=io.StringIO(text), concurrency=4, **askai_paths)
+
+    assert capsys.readouterr().out.strip() == (TOKEN * 400).strip()
+    prompts = [prompt for request in fake_openai_server.requests
+               for prompt in (request["prompt"] if isinstance(request["prompt"], list) else [request["prompt"]])]
+    maps = [prompt for prompt in prompts if "line 0:" in prompt or "line 1999:" in prompt]
+    assert len(maps) == 2  # The first and the last part
+    reduces = [prompt for prompt in prompts if prompt.startswith("Answers to a question")]
+    assert len(reduces) >= 2  # The answers to the ~10 parts don't fit into a single prompt
+    assert prompts[-1] == reduces[-1]
+    assert all(request["n"] == 1 for request in fake_openai_server.requests)
+    assert fake_openai_server.requests[-1]["stream"] is True
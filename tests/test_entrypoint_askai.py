@@ -0,0 +1,247 @@
+import json
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import pytest_mock.plugin
+from openai.error import AuthenticationError
+from pytest import CaptureFixture
+
+from askai.entrypoint_askai import _ask
+from askai.utils import ConfigHelper, KeyHelper
+
+DUMMY_KEY = "DUMMY_KEY"
+
+
+@pytest.fixture
+def askai_paths(tmp_path: Path) -> dict:
+    api_key_path = tmp_path / "key"
+    config_path = tmp_path / "config.yml"
+    api_key_path.write_text(DUMMY_KEY)
+    ConfigHelper.reset(config_path=config_path)
+    return {"api_key_path": api_key_path, "config_path": config_path, "cache_path": tmp_path / "cache.db",
+            "inflight_path": tmp_path / "inflight", "latency_path": tmp_path / "latency.json",
+            "routing_path": tmp_path / "routing.json"}
+
+
+def _mock_completion(mocker: pytest_mock.plugin.MockerFixture, text: str = "Answer"):
+    return mocker.patch(
+        "openai.Completion.create",
+        return_value={"choices": [{"index": 0, "text": text, "finish_reason": "stop"}]}
+    )
+
+
+def test_ask_cache_hit(mocker: pytest_mock.plugin.MockerFixture, capsys: CaptureFixture, askai_paths: dict) -> None:
+    create = _mock_completion(mocker)
+    _ask(prompt="question", overrides={}, stream=False, **askai_paths)
+    capsys.readouterr()
+
+    _ask(prompt="question", overrides={}, stream=False, **askai_paths)
+    captured = capsys.readouterr()
+
+    assert create.call_count == 1
+    assert captured.out == "Answer\n"
+    assert "cached" in captured.err
+
+
+def test_ask_no_cache(mocker: pytest_mock.plugin.MockerFixture, askai_paths: dict) -> None:
+    create = _mock_completion(mocker)
+    _ask(prompt="question", overrides={}, stream=False, use_cache=False, **askai_paths)
+    _ask(prompt="question", overrides={}, stream=False, use_cache=False, **askai_paths)
+
+    assert create.call_count == 2
+    assert not askai_paths["cache_path"].exists()
+
+
+def test_ask_refresh(mocker: pytest_mock.plugin.MockerFixture, capsys: CaptureFixture, askai_paths: dict) -> None:
+    _mock_completion(mocker, text="Old answer")
+    _ask(prompt="question", overrides={}, stream=False, **askai_paths)
+    _mock_completion(mocker, text="New answer")
+    _ask(prompt="question", overrides={}, stream=False, refresh=True, **askai_paths)
+    capsys.readouterr()
+
+    _ask(prompt="question", overrides={}, stream=False, **askai_paths)
+    assert capsys.readouterr().out == "New answer\n"
+
+
+def test_ask_similar(mocker: pytest_mock.plugin.MockerFixture, capsys: CaptureFixture, askai_paths: dict) -> None:
+    create = _mock_completion(mocker)
+    _ask(prompt="How do I list all files in a directory?", overrides={}, stream=False, **askai_paths)
+    capsys.readouterr()
+
+    _ask(prompt="how do i list all files in a directory", overrides={}, stream=False, similarity=0.92, **askai_paths)
+    captured = capsys.readouterr()
+    assert create.call_count == 1
+    assert captured.out == "Answer\n"
+    assert "similar" in captured.err
+
+    # Only with --similar, and only for the same config
+    _ask(prompt="how do i list all files in a directory", overrides={}, stream=False, **askai_paths)
+    _ask(prompt="How do I list all files in a directory", overrides={"max_tokens": 10}, stream=False, similarity=0.92,
+         **askai_paths)
+    assert create.call_count == 3
+
+
+@pytest.mark.parametrize("temperature,coalesce,expected_calls", [(0.0, None, 1), (0.5, None, 3), (0.5, True, 1), (0.0, False, 3)])
+def test_ask_coalesces_identical_questions(mocker: pytest_mock.plugin.MockerFixture,
+                                           askai_paths: dict,
+                                           temperature: float,
+                                           coalesce: bool,
+                                           expected_calls: int) -> None:
+    def slow_create(**kwargs) -> dict:
+        time.sleep(0.2)
+        return {"choices": [{"index": 0, "text": "Answer", "finish_reason": "stop"}]}
+
+    create = mocker.patch("openai.Completion.create", side_effect=slow_create)
+    threads = [
+        threading.Thread(target=_ask, kwargs=dict(prompt="question", overrides={"temperature": temperature},
+                                                  stream=False, coalesce=coalesce, **askai_paths))
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert create.call_count == expected_calls
+    assert list(askai_paths["inflight_path"].glob("*")) == []
+
+
+def test_ask_hedge(mocker: pytest_mock.plugin.MockerFixture, capsys: CaptureFixture, askai_paths: dict) -> None:
+    askai_paths["latency_path"].write_text(json.dumps({"text-davinci-003:300": [[0.05, False]] * 100}))
+    calls = []
+
+    def create(**kwargs) -> dict:
+        calls.append(None)
+        if len(calls) == 1:
+            time.sleep(0.5)
+        return {"choices": [{"index": 0, "text": f"Answer {len(calls)}", "finish_reason": "stop"}]}
+
+    mocker.patch("openai.Completion.create", side_effect=create)
+    capsys.readouterr()
+    _ask(prompt="question", overrides={}, stream=False, use_cache=False, hedge=True, show_timings=True, **askai_paths)
+
+    captured = capsys.readouterr()
+    assert captured.out == "Answer 2\n"
+    assert "hedged: yes, hedge won" in captured.err
+    assert json.loads(askai_paths["latency_path"].read_text())["text-davinci-003:300"][-1][1] is True
+
+
+def test_ask_auto_model(mocker: pytest_mock.plugin.MockerFixture, capsys: CaptureFixture, askai_paths: dict) -> None:
+    create = _mock_completion(mocker)
+    _ask(prompt="Capital of France?", overrides={"model": "auto", "max_tokens": 20}, stream=False, **askai_paths)
+
+    assert create.call_args.kwargs["model"] == "text-ada-001"
+    assert "(model: text-ada-001, short prompt)" in capsys.readouterr().err
+    history = json.loads(askai_paths["routing_path"].read_text())
+    assert history["short"]["text-ada-001"]["answers"] == 1
+
+    # Empty answers count against the model, until it is skipped
+    create = _mock_completion(mocker, text=" ")
+    for idx in range(5):
+        _ask(prompt=f"Capital of France? {idx}", overrides={"model": "auto", "max_tokens": 20}, stream=False,
+             **askai_paths)
+    _ask(prompt="Capital of Spain?", overrides={"model": "auto", "max_tokens": 20}, stream=False, **askai_paths)
+    assert create.call_args.kwargs["model"] == "text-babbage-001"
+
+
+def test_ask_stop_closes_stream(mocker: pytest_mock.plugin.MockerFixture, capsys: CaptureFixture, askai_paths: dict) -> None:
+    sent = []
+
+    def create(**kwargs):
+        for text in ["\n\n```bash\n", "ls -la\n", "```", "\n\nThis lists", " all files."]:
+            sent.append(text)
+            yield {"choices": [{"index": 0, "text": text, "finish_reason": None}]}
+
+    mocker.patch("openai.Completion.create", side_effect=create)
+    capsys.readouterr()
+    _ask(prompt="question", overrides={}, stream=True, until_code_block_closes=True, **askai_paths)
+
+    assert capsys.readouterr().out == "```bash\nls -la\n```\n"
+    assert len(sent) == 3
+
+    # The answer that was cut off is only reused for the same conditions
+    _ask(prompt="question", overrides={}, stream=True, until_code_block_closes=True, **askai_paths)
+    assert len(sent) == 3
+    _ask(prompt="question", overrides={}, stream=True, **askai_paths)
+    assert len(sent) == 8
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_ask_continues_cut_off_answer(mocker: pytest_mock.plugin.MockerFixture,
+                                      capsys: CaptureFixture,
+                                      askai_paths: dict,
+                                      stream: bool) -> None:
+    def create(prompt: str, stream: bool, **kwargs):
+        text, finish_reason = ("\n\nThe first half", "length") if prompt == "question" else (" and the rest.", "stop")
+        choices = [{"index": 0, "text": text, "finish_reason": finish_reason}]
+        return iter([{"choices": choices}]) if stream else {"choices": choices}
+
+    completion = mocker.patch("openai.Completion.create", side_effect=create)
+    capsys.readouterr()
+    _ask(prompt="question", overrides={"max_tokens": 50}, stream=stream, max_total_tokens=80, **askai_paths)
+
+    assert capsys.readouterr().out == "The first half and the rest.\n"
+    assert completion.call_args.kwargs["prompt"] == "question\n\nThe first half"
+    assert completion.call_args.kwargs["max_tokens"] == 30
+    assert completion.call_args.kwargs["n"] == 1
+
+
+def test_ask_overrides_change_cache_key(mocker: pytest_mock.plugin.MockerFixture, askai_paths: dict) -> None:
+    create = _mock_completion(mocker)
+    _ask(prompt="question", overrides={"temperature": None}, stream=False, **askai_paths)
+    _ask(prompt="question", overrides={"temperature": 0.0}, stream=False, **askai_paths)
+
+    assert create.call_count == 2
+    assert create.call_args.kwargs["temperature"] == 0.0
+
+
+def test_ask_rejected_key_is_recorded(mocker: pytest_mock.plugin.MockerFixture, askai_paths: dict) -> None:
+    create = mocker.patch("openai.Completion.create", side_effect=AuthenticationError("Incorrect API key"))
+    with pytest.raises(SystemExit):
+        _ask(prompt="question", overrides={}, stream=False, **askai_paths)
+    assert KeyHelper.verification(key=DUMMY_KEY, api_key_path=askai_paths["api_key_path"]) is False
+
+    with pytest.raises(SystemExit):
+        _ask(prompt="other question", overrides={}, stream=False, **askai_paths)
+    assert create.call_count == 1  # Failed without asking the API again
+
+
+def test_ask_accepted_key_is_recorded(mocker: pytest_mock.plugin.MockerFixture, askai_paths: dict) -> None:
+    _mock_completion(mocker)
+    _ask(prompt="question", overrides={}, stream=False, **askai_paths)
+    assert KeyHelper.verification(key=DUMMY_KEY, api_key_path=askai_paths["api_key_path"]) is True
+
+
+def test_ask_prompt_too_long(mocker: pytest_mock.plugin.MockerFixture, askai_paths: dict) -> None:
+    create = _mock_completion(mocker)
+    with pytest.raises(SystemExit):
+        _ask(prompt=" word" * 5000, overrides={}, stream=False, **askai_paths)
+    assert create.call_count == 0
+
+
+def test_ask_clamps_max_tokens(mocker: pytest_mock.plugin.MockerFixture, askai_paths: dict) -> None:
+    create = _mock_completion(mocker)
+    _ask(prompt=" word" * 3900, overrides={"model": "text-davinci-003", "max_tokens": 300}, stream=False, **askai_paths)
+    assert create.call_args.kwargs["max_tokens"] == 100
+
+
+def test_ask_truncate(mocker: pytest_mock.plugin.MockerFixture, askai_paths: dict) -> None:
+    create = _mock_completion(mocker)
+    _ask(prompt=" word" * 5000, overrides={"model": "text-davinci-003", "max_tokens": 300}, stream=False, truncate=True,
+         **askai_paths)
+    assert create.call_args.kwargs["prompt"] == " word" * 3700
+    assert create.call_args.kwargs["max_tokens"] == 300
+
+
+def test_ask_truncated_prompt_is_cached_apart(mocker: pytest_mock.plugin.MockerFixture, askai_paths: dict) -> None:
+    create = _mock_completion(mocker)
+    overrides = {"model": "text-davinci-003", "max_tokens": 300}
+    for truncate in (False, True, False, True):
+        _ask(prompt=" word" * 3900, overrides=overrides, stream=False, truncate=truncate, **askai_paths)
+
+    # The answer to the whole prompt with fewer tokens isn't the answer to the truncated one, and vice versa
+    assert create.call_count == 2
+    assert [(call.kwargs["prompt"], call.kwargs["max_tokens"]) for call in create.call_args_list] == \
+        [(" word" * 3900, 100), (" word" * 3700, 300)]
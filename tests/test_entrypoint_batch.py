@@ -0,0 +1,152 @@
+import io
+import json
+from pathlib import Path
+
+import pytest_mock.plugin
+from openai.error import AuthenticationError
+
+from askai.entrypoint_batch import _batch
+from askai.utils import ConfigHelper
+
+
+def _fake_create(prompt: list, n: int, **kwargs) -> dict:
+    return {"choices": [
+        {"index": idx * n + answer, "text": f"{p.upper()} {answer}"} for idx, p in enumerate(prompt) for answer in range(n)
+    ]}
+
+
+def test_batch(mocker: pytest_mock.plugin.MockerFixture, tmp_path: Path) -> None:
+    api_key_path = tmp_path / "key"
+    config_path = tmp_path / "config.yml"
+    api_key_path.write_text("DUMMY_KEY")
+    ConfigHelper.reset(config_path=config_path)
+    create = mocker.patch("openai.Completion.create", side_effect=_fake_create)
+
+    input_file = io.StringIO("".join(
+        json.dumps({"prompt": f"p{idx}", "max_tokens": 1 + idx % 2}) + "\n" for idx in range(7)
+    ))
+    output = io.StringIO()
+    _batch(input_file=input_file, output=output, jsonl=True, batch_size=2, ordered=True, api_key_path=api_key_path,
+           config_path=config_path)
+
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [r["index"] for r in results] == list(range(7))
+    assert [r["answers"] for r in results] == [[f"P{idx} 0"] for idx in range(7)]
+    assert create.call_count == 4  # Max tokens 1: 4 prompts -> 2 requests, max tokens 2: 3 prompts -> 2 requests
+
+
+def test_batch_failed_request(mocker: pytest_mock.plugin.MockerFixture, tmp_path: Path) -> None:
+    api_key_path = tmp_path / "key"
+    config_path = tmp_path / "config.yml"
+    api_key_path.write_text("DUMMY_KEY")
+    ConfigHelper.reset(config_path=config_path)
+    mocker.patch("openai.Completion.create", side_effect=AuthenticationError("Incorrect API key"))
+
+    output = io.StringIO()
+    _batch(input_file=io.StringIO("p0\np1\n"), output=output, ordered=True, api_key_path=api_key_path,
+           config_path=config_path)
+
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [r["index"] for r in results] == [0, 1]
+    assert all("Incorrect API key" in r["error"] for r in results)
+
+
+def test_batch_prompt_too_long(mocker: pytest_mock.plugin.MockerFixture, tmp_path: Path) -> None:
+    api_key_path = tmp_path / "key"
+    config_path = tmp_path / "config.yml"
+    api_key_path.write_text("DUMMY_KEY")
+    ConfigHelper.reset(config_path=config_path)
+    create = mocker.patch("openai.Completion.create", side_effect=_fake_create)
+
+    output = io.StringIO()
+    _batch(input_file=io.StringIO("p0\n" + " word" * 4100 + "\np2\n"), output=output, ordered=True,
+           api_key_path=api_key_path, config_path=config_path)
+
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [r["index"] for r in results] == [0, 1, 2]
+    assert "error" not in results[0] and "error" not in results[2]
+    assert "4100 tokens" in results[1]["error"]
+    assert create.call_args.kwargs["prompt"] == ["p0", "p2"]
+
+
+def test_batch_long_prompt_gets_own_request(mocker: pytest_mock.plugin.MockerFixture, tmp_path: Path) -> None:
+    api_key_path = tmp_path / "key"
+    config_path = tmp_path / "config.yml"
+    api_key_path.write_text("DUMMY_KEY")
+    ConfigHelper.reset(config_path=config_path)
+    create = mocker.patch("openai.Completion.create", side_effect=_fake_create)
+
+    output = io.StringIO()
+    long_prompt = " word" * 3900  # Leaves fewer than the default max tokens for the answer
+    _batch(input_file=io.StringIO(f"p0\n{long_prompt}\np2\n"), output=output, ordered=True,
+           api_key_path=api_key_path, config_path=config_path)
+
+    assert [json.loads(line)["index"] for line in output.getvalue().splitlines()] == [0, 1, 2]
+    requests = sorted((call.kwargs["prompt"], call.kwargs["max_tokens"]) for call in create.call_args_list)
+    assert requests == [([long_prompt], 100), (["p0", "p2"], ConfigHelper().max_tokens)]
+
+
+def test_batch_auto_model_records_answers(mocker: pytest_mock.plugin.MockerFixture, tmp_path: Path) -> None:
+    api_key_path = tmp_path / "key"
+    config_path = tmp_path / "config.yml"
+    routing_path = tmp_path / "routing.json"
+    api_key_path.write_text("DUMMY_KEY")
+    ConfigHelper.reset(config_path=config_path)
+    mocker.patch("openai.Completion.create", side_effect=_fake_create)
+
+    input_lines = "".join(json.dumps({"prompt": f"p{idx}", "model": "auto", "max_tokens": 20}) + "\n" for idx in range(3))
+    _batch(input_file=io.StringIO(input_lines), output=io.StringIO(), jsonl=True, routing_path=routing_path,
+           api_key_path=api_key_path, config_path=config_path)
+    stats = json.loads(routing_path.read_text())["short"]["text-ada-001"]
+    assert stats["answers"] == 3 and stats["quality"] == 1.0 and stats["seconds"] is not None
+
+    # Empty answers count against the model, until it is skipped
+    mocker.patch("openai.Completion.create", side_effect=lambda prompt, n, **kwargs: {
+        "choices": [{"index": idx, "text": " "} for idx in range(len(prompt) * n)]
+    })
+    _batch(input_file=io.StringIO(input_lines), output=io.StringIO(), jsonl=True, routing_path=routing_path,
+           api_key_path=api_key_path, config_path=config_path)
+    assert json.loads(routing_path.read_text())["short"]["text-ada-001"]["answers"] == 6
+
+    # And so do failed requests, whose time isn't recorded
+    create = mocker.patch("openai.Completion.create", side_effect=AuthenticationError("Incorrect API key"))
+    _batch(input_file=io.StringIO(input_lines), output=io.StringIO(), jsonl=True, routing_path=routing_path,
+           api_key_path=api_key_path, config_path=config_path)
+    assert create.call_args.kwargs["model"] == "text-babbage-001"
+    stats = json.loads(routing_path.read_text())["short"]["text-babbage-001"]
+    assert stats["answers"] == 3 and stats["quality"] < 1.0 and stats["seconds"] is None
+
+
+def test_batch_resume(mocker: pytest_mock.plugin.MockerFixture, tmp_path: Path) -> None:
+    api_key_path = tmp_path / "key"
+    config_path = tmp_path / "config.yml"
+    journal_path = tmp_path / "answers.jsonl.journal"
+    api_key_path.write_text("DUMMY_KEY")
+    ConfigHelper.reset(config_path=config_path)
+    input_lines = "".join(f"p{idx}\n" for idx in range(6))
+
+    def flaky_create(prompt: list, n: int, **kwargs) -> dict:
+        if "p3" in prompt:
+            raise AuthenticationError("Incorrect API key")
+        return _fake_create(prompt=prompt, n=n)
+
+    mocker.patch("openai.Completion.create", side_effect=flaky_create)
+    output = io.StringIO()
+    _batch(input_file=io.StringIO(input_lines), output=output, batch_size=2, ordered=True, journal_path=journal_path,
+           api_key_path=api_key_path, config_path=config_path)
+    assert ["error" in json.loads(line) for line in output.getvalue().splitlines()] == [False] * 2 + [True] * 2 + [False] * 2
+
+    # Only the prompts of the failed request are asked again, and keep their index
+    create = mocker.patch("openai.Completion.create", side_effect=_fake_create)
+    output = io.StringIO()
+    _batch(input_file=io.StringIO(input_lines), output=output, ordered=True, journal_path=journal_path, resume=True,
+           api_key_path=api_key_path, config_path=config_path)
+    assert create.call_args.kwargs["prompt"] == ["p2", "p3"]
+    assert [json.loads(line) for line in output.getvalue().splitlines()] == [
+        {"index": 2, "prompt": "p2", "answers": ["P2 0"]},
+        {"index": 3, "prompt": "p3", "answers": ["P3 0"]}
+    ]
+
+    _batch(input_file=io.StringIO(input_lines), output=output, journal_path=journal_path, resume=True,
+           api_key_path=api_key_path, config_path=config_path)
+    assert create.call_count == 1
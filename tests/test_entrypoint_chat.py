@@ -0,0 +1,98 @@
+import json
+from typing import Iterator, List
+
+import pytest
+import pytest_mock.plugin
+from openai.error import APIConnectionError
+from pytest import CaptureFixture, MonkeyPatch
+
+from askai.entrypoint_chat import _chat
+from tests.test_entrypoint_askai import askai_paths  # noqa: F401
+
+
+def _mock_input(monkeypatch: MonkeyPatch, lines: List[str]) -> None:
+    inputs: Iterator[str] = iter(lines)
+
+    def fake_input(_: str) -> str:
+        try:
+            return next(inputs)
+        except StopIteration:
+            raise EOFError
+
+    monkeypatch.setattr("builtins.input", fake_input)
+
+
+def _answer(text: str) -> dict:
+    return {"choices": [{"index": 0, "text": text, "finish_reason": "stop"}]}
+
+
+def test_chat_remembers_history(mocker: pytest_mock.plugin.MockerFixture,
+                                monkeypatch: MonkeyPatch,
+                                capsys: CaptureFixture,
+                                askai_paths: dict) -> None:
+    create = mocker.patch("openai.Completion.create", side_effect=[_answer(" Paris"), _answer(" About 2 million")])
+    _mock_input(monkeypatch, ["Capital of France?", "", "How many people live there?"])
+
+    _chat(overrides={}, stream=False, api_key_path=askai_paths["api_key_path"], config_path=askai_paths["config_path"])
+
+    assert create.call_count == 2
+    second = create.call_args_list[1].kwargs
+    assert "User: Capital of France?\nAssistant: Paris\n" in second["prompt"]
+    assert second["prompt"].endswith("User: How many people live there?\nAssistant:")
+    assert second["stop"] == ["\nUser:"]
+    assert second["n"] == 1
+    assert "About 2 million" in capsys.readouterr().out
+
+
+def test_chat_streamed(mocker: pytest_mock.plugin.MockerFixture, monkeypatch: MonkeyPatch, askai_paths: dict) -> None:
+    chunks = [_answer(" Par"), _answer("is")]
+    create = mocker.patch("openai.Completion.create", side_effect=[iter(chunks), iter([_answer(" Yes")])])
+    _mock_input(monkeypatch, ["Capital of France?", "Sure?"])
+
+    _chat(overrides={}, stream=True, api_key_path=askai_paths["api_key_path"], config_path=askai_paths["config_path"])
+
+    assert "Assistant: Paris\n" in create.call_args_list[1].kwargs["prompt"]
+
+
+def test_chat_reset_and_failed_requests(mocker: pytest_mock.plugin.MockerFixture,
+                                        monkeypatch: MonkeyPatch,
+                                        capsys: CaptureFixture,
+                                        askai_paths: dict) -> None:
+    create = mocker.patch(
+        "openai.Completion.create",
+        side_effect=[_answer(" Paris"), APIConnectionError("No network"), _answer(" Hi")]
+    )
+    _mock_input(monkeypatch, ["Capital of France?", "Population?", "/reset", "Hello", "/exit", "Never asked"])
+
+    _chat(overrides={"max_retries": 0}, stream=False,
+          api_key_path=askai_paths["api_key_path"], config_path=askai_paths["config_path"])
+
+    assert create.call_count == 3
+    assert "France" not in create.call_args.kwargs["prompt"]
+    assert "The request failed" in capsys.readouterr().err
+
+
+def test_chat_max_tokens_too_large(askai_paths: dict) -> None:
+    with pytest.raises(SystemExit):
+        _chat(overrides={"model": "text-ada-001", "max_tokens": 4000}, stream=False,
+              api_key_path=askai_paths["api_key_path"], config_path=askai_paths["config_path"])
+
+
+def test_chat_auto_model(mocker: pytest_mock.plugin.MockerFixture,
+                         monkeypatch: MonkeyPatch,
+                         capsys: CaptureFixture,
+                         askai_paths: dict) -> None:
+    create = mocker.patch("openai.Completion.create", side_effect=[_answer(" Paris"), _answer("")])
+    _mock_input(monkeypatch, ["Capital of France?", "And of Italy?"])
+
+    _chat(overrides={"model": "auto"}, stream=False, api_key_path=askai_paths["api_key_path"],
+          config_path=askai_paths["config_path"], routing_path=askai_paths["routing_path"])
+
+    # The history grows to fill the context, so the conversation gets the model with the longest one
+    assert [call.kwargs["model"] for call in create.call_args_list] == ["text-davinci-003"] * 2
+    assert "(model: text-davinci-003, conversation)" in capsys.readouterr().err
+    history = json.loads(askai_paths["routing_path"].read_text())
+    # Each answer is recorded by the size of its prompt, which grows with the history
+    assert history["short"]["text-davinci-003"] == {"answers": 1, "seconds": pytest.approx(0, abs=1), "quality": 1.0}
+    assert history["medium"]["text-davinci-003"]["answers"] == 1
+    assert history["medium"]["text-davinci-003"]["quality"] < 1.0
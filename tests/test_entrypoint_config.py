@@ -6,7 +6,7 @@ import yaml
 from pytest import MonkeyPatch
 
 from askai.entrypoint_config import _reset, _update_all, _model, _num_answers, _max_tokens, _temperature, _top_p, \
-    _frequency_penalty, _presence_penalty
+    _frequency_penalty, _presence_penalty, _max_retries, _retry_timeout, _requests_per_minute, _tokens_per_minute
 from askai.utils import ConfigHelper, AvailableModels
 from tests.test_config_helper import mock_input_value
 
@@ -54,6 +54,10 @@ def test_reset_verified_user_input(monkeypatch: MonkeyPatch, tmp_path: Path, use
         ["1", "1", "15", "0.0", "bad", "bad", "bad"],  # input_top_p
         ["1", "1", "15", "0.0", "0.0", "bad", "bad", "bad"],  # input_frequency_penalty
         ["1", "1", "15", "0.0", "0.0", "0.0", "bad", "bad", "bad"],  # input_presence_penalty
+        ["1", "1", "15", "0.0", "0.0", "0.0", "0.0", "bad", "bad", "bad"],  # input_max_retries
+        ["1", "1", "15", "0.0", "0.0", "0.0", "0.0", "0", "bad", "bad", "bad"],  # input_retry_timeout
+        ["1", "1", "15", "0.0", "0.0", "0.0", "0.0", "0", "0", "bad", "bad", "bad"],  # input_requests_per_minute
+        ["1", "1", "15", "0.0", "0.0", "0.0", "0.0", "0", "0", "0", "bad", "bad", "bad"],  # input_tokens_per_minute
     ]
 )
 def test_update_all_bad_user_input(monkeypatch: MonkeyPatch, bad_user_inputs: List[str]) -> None:
@@ -73,15 +77,32 @@ def test_update_all_good_user_input(monkeypatch: MonkeyPatch, tmp_path: Path) ->
         "temperature": 0.42,
         "top_p": 0.42,
         "frequency_penalty": 0.42,
-        "presence_penalty": 0.42
+        "presence_penalty": 0.42,
+        "max_retries": 42,
+        "retry_timeout": 0.42,
+        "requests_per_minute": 42,
+        "tokens_per_minute": 42,
+        "routes": []
     }
 
-    good_user_inputs = iter(["1", "42", "42", "0.42", "0.42", "0.42", "0.42"])
+    good_user_inputs = iter(["1", "42", "42", "0.42", "0.42", "0.42", "0.42", "42", "0.42", "42", "42"])
     monkeypatch.setattr('builtins.input', lambda _: next(good_user_inputs))
 
     _assert_config_update(config_path=config_path, config_update_func=_update_all, expected_config=expected_config)
 
 
+def test_update_all_keeps_routes(monkeypatch: MonkeyPatch, tmp_path: Path) -> None:
+    config_path = tmp_path / CONFIG_FILE_NAME
+    routes = [{"model": "text-curie-001", "max_tokens": 10}]
+    ConfigHelper(routes=routes).update(config_path=config_path)
+
+    good_user_inputs = iter(["1", "42", "42", "0.42", "0.42", "0.42", "0.42", "42", "0.42", "42", "42"])
+    monkeypatch.setattr('builtins.input', lambda _: next(good_user_inputs))
+    _update_all(config_path=config_path)
+
+    assert ConfigHelper.from_file(config_path=config_path).routes == routes
+
+
 @pytest.mark.parametrize(
     "config_update_func",
     [
@@ -91,7 +112,11 @@ def test_update_all_good_user_input(monkeypatch: MonkeyPatch, tmp_path: Path) ->
         _temperature,
         _top_p,
         _frequency_penalty,
-        _presence_penalty
+        _presence_penalty,
+        _max_retries,
+        _retry_timeout,
+        _requests_per_minute,
+        _tokens_per_minute
     ]
 )
 def test_update_individual_bad_user_input(monkeypatch: MonkeyPatch, config_update_func: Callable[[Path], None]) -> None:
@@ -120,7 +145,8 @@ def test_update_model_good_user_input(monkeypatch: MonkeyPatch, tmp_path: Path)
         (_temperature, "temperature"),
         (_top_p, "top_p"),
         (_frequency_penalty, "frequency_penalty"),
-        (_presence_penalty, "presence_penalty")
+        (_presence_penalty, "presence_penalty"),
+        (_retry_timeout, "retry_timeout")
     ]
 )
 def test_update_float_good_user_input(monkeypatch: MonkeyPatch, tmp_path: Path, config_update_func: Callable[[Path], None], instance_variable_name: str) -> None:
@@ -139,7 +165,10 @@ def test_update_float_good_user_input(monkeypatch: MonkeyPatch, tmp_path: Path,
     "config_update_func, instance_variable_name",
     [
         (_num_answers, "num_answers"),
-        (_max_tokens, "max_tokens")
+        (_max_tokens, "max_tokens"),
+        (_max_retries, "max_retries"),
+        (_requests_per_minute, "requests_per_minute"),
+        (_tokens_per_minute, "tokens_per_minute")
     ]
 )
 def test_update_int_good_user_input(monkeypatch: MonkeyPatch, tmp_path: Path, config_update_func: Callable[[Path], None], instance_variable_name: str) -> None:
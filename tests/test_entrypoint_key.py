@@ -1,10 +1,11 @@
+import json
 from pathlib import Path
 
 import pytest
 import pytest_mock
-from pytest import MonkeyPatch
+from pytest import CaptureFixture, MonkeyPatch
 
-from askai.entrypoint_key import _add, _remove
+from askai.entrypoint_key import _add, _list_keys, _remove
 from tests.test_config_helper import mock_input_value
 
 DUMMY_KEY = "DUMMY_KEY"
@@ -59,3 +60,23 @@ def test_remove_verified_user_input(monkeypatch: MonkeyPatch, tmp_path: Path, us
     assert api_key_path.is_file()
     _remove(api_key_path=api_key_path)
     assert not api_key_path.is_file()
+
+
+def test_add_named_key(mocker: pytest_mock.plugin.MockerFixture, tmp_path: Path, capsys: CaptureFixture) -> None:
+    api_key_path = tmp_path / "key"
+    keys_path = tmp_path / "keys.json"
+    mocker.patch("askai.utils.KeyHelper._is_valid_api_key", lambda _, __: True)
+    mocker.patch('askai.utils.getpass', lambda _: "sk-team-b-key")
+    api_key_path.write_text("sk-default-key")
+
+    _add(api_key_path=api_key_path, name="team-b", organization="org-b", requests_per_minute=60, keys_path=keys_path)
+    assert api_key_path.read_text() == "sk-default-key"
+    assert oct(keys_path.stat().st_mode & 0o777) == "0o600"
+
+    capsys.readouterr()
+    _list_keys(api_key_path=api_key_path, keys_path=keys_path, health_path=tmp_path / "health.json")
+    assert capsys.readouterr().out == "default: sk-...-key, no limits\n" \
+                                      "team-b: sk-...-key, organization org-b, 60 requests/min\n"
+
+    _remove(name="team-b", keys_path=keys_path)
+    assert json.loads(keys_path.read_text()) == {}
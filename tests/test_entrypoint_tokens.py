@@ -0,0 +1,18 @@
+from pathlib import Path
+
+from pytest import CaptureFixture
+
+from askai.entrypoint_tokens import _tokens
+from askai.utils import ConfigHelper
+
+
+def test_tokens(capsys: CaptureFixture, tmp_path: Path) -> None:
+    config_path = tmp_path / "config.yml"
+    ConfigHelper.reset(config_path=config_path)
+    capsys.readouterr()
+
+    _tokens(prompt="Hello world", config_path=config_path)
+    assert capsys.readouterr().out == "2 tokens. text-davinci-003 has room for 3998 more tokens in the answer.\n"
+
+    _tokens(prompt="Hello world", model="text-ada-001", config_path=config_path)
+    assert capsys.readouterr().out.startswith("2 tokens. text-ada-001 has room for 2046")
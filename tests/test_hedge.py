@@ -0,0 +1,125 @@
+import json
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from askai.hedge import Hedger, LatencyHistory
+
+
+def _history(tmp_path: Path, latencies: List[float], hedged: int = 0) -> LatencyHistory:
+    path = tmp_path / "latency.json"
+    path.write_text(json.dumps({"model": [[latency, idx < hedged] for idx, latency in enumerate(latencies)]}))
+    return LatencyHistory(key="model", path=path)
+
+
+class _Response:
+    def __init__(self, name: str):
+        self.name = name
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_delay_is_percentile(tmp_path: Path) -> None:
+    history = _history(tmp_path, latencies=[idx / 100 for idx in range(1, 101)])
+
+    assert history.delay(percentile=95) == 0.95
+    assert history.delay(percentile=50) == 0.5
+    assert history.delay(percentile=0) == 0.01
+
+
+def test_no_delay_without_enough_samples(tmp_path: Path) -> None:
+    assert _history(tmp_path, latencies=[1.0] * 19).delay(percentile=95) is None
+    assert LatencyHistory(key="model", path=tmp_path / "missing.json").delay(percentile=95) is None
+
+
+def test_budget(tmp_path: Path) -> None:
+    assert _history(tmp_path, latencies=[1.0] * 100, hedged=4).can_hedge(budget=0.05)
+    assert not _history(tmp_path, latencies=[1.0] * 100, hedged=5).can_hedge(budget=0.05)
+    assert not _history(tmp_path, latencies=[1.0] * 100).can_hedge(budget=0.0)
+    # Few samples don't allow a larger share of hedges
+    assert not _history(tmp_path, latencies=[1.0] * 20, hedged=5).can_hedge(budget=0.05)
+
+
+def test_record_keeps_last_samples(tmp_path: Path) -> None:
+    path = tmp_path / "latency.json"
+    history = LatencyHistory(key="model", path=path, size=3)
+    for latency in [1.0, 2.0, 3.0, 4.0]:
+        history.record(latency=latency, hedged=latency == 4.0)
+    LatencyHistory(key="other", path=path).record(latency=5.0, hedged=False)
+
+    assert json.loads(path.read_text()) == {"model": [[2.0, False], [3.0, False], [4.0, True]], "other": [[5.0, False]]}
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_fast_call_is_not_hedged(tmp_path: Path) -> None:
+    hedger = Hedger(history=_history(tmp_path, latencies=[1.0] * 100))
+    calls = []
+
+    def func() -> str:
+        calls.append(threading.current_thread())
+        return "answer"
+
+    assert hedger.call(func) == "answer"
+    assert len(calls) == 1
+    assert hedger.stats["hedged"] is False
+
+
+def test_without_history_call_is_made_on_this_thread(tmp_path: Path) -> None:
+    hedger = Hedger(history=LatencyHistory(key="model", path=tmp_path / "latency.json"))
+    assert hedger.call(threading.current_thread) is threading.current_thread()
+    assert hedger.stats == {"hedged": False, "winner": "primary", "hedge_delay": None}
+    assert len(json.loads((tmp_path / "latency.json").read_text())["model"]) == 1
+
+
+def test_slow_call_is_hedged(tmp_path: Path) -> None:
+    hedger = Hedger(history=_history(tmp_path, latencies=[0.05] * 100))
+    responses = []
+    primary_done = threading.Event()
+
+    def func() -> _Response:
+        response = _Response(name="primary" if not responses else "hedge")
+        responses.append(response)
+        if response.name == "primary":
+            time.sleep(0.3)
+            primary_done.set()
+        return response
+
+    result = hedger.call(func)
+    assert result.name == "hedge"
+    assert hedger.stats == {"hedged": True, "winner": "hedge", "hedge_delay": 0.05}
+
+    # The loser is closed when it arrives
+    primary_done.wait(timeout=5)
+    time.sleep(0.05)
+    assert responses[0].closed
+    assert not result.closed
+
+
+def test_hedge_covers_failed_call(tmp_path: Path) -> None:
+    hedger = Hedger(history=_history(tmp_path, latencies=[0.05] * 100))
+    calls = []
+
+    def func() -> str:
+        calls.append(None)
+        if len(calls) == 1:
+            time.sleep(0.2)
+            raise ConnectionError("primary failed")
+        return "hedge"
+
+    assert hedger.call(func) == "hedge"
+
+
+def test_both_calls_fail(tmp_path: Path) -> None:
+    hedger = Hedger(history=_history(tmp_path, latencies=[0.05] * 100))
+
+    def func() -> str:
+        time.sleep(0.1)
+        raise ConnectionError("failed")
+
+    with pytest.raises(ConnectionError):
+        hedger.call(func)
@@ -0,0 +1,91 @@
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+from askai.utils import ConfigHelper
+
+# Budgets for the time spent importing modules after askai starts loading, in microseconds. askai itself
+# needs ~35 ms (mostly click), while importing openai alone adds ~250 ms. The budgets leave room for slow
+# machines, but not for a heavy dependency sneaking back into the startup path.
+IMPORT_TIME_BUDGET_US = 120_000
+
+RUN_ASKAI = "import sys; from askai.entrypoint_askai import askai; askai(sys.argv[1:])"
+
+
+def _import_times(args: List[str], home: Path) -> Dict[str, int]:
+    """
+    Run askai with `-X importtime` and return the cumulative import time of every module imported after askai
+    started loading. Modules are keyed by their indented name, so top-level imports are the keys without indent.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", RUN_ASKAI, *args],
+        env={"HOME": str(home), "PYTHONPATH": str(Path(__file__).parents[1])},
+        capture_output=True,
+        text=True
+    )
+    assert result.returncode == 0, result.stderr
+
+    import_times = {}
+    started = False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        started = started or name.strip().startswith("askai")
+        if started:
+            import_times[name.rstrip()[1:]] = int(cumulative)
+    return import_times
+
+
+@pytest.mark.parametrize(
+    "args, forbidden_modules",
+    [
+        (["--help"], ["openai", "yaml", "sqlite3"]),
+        (["config", "--help"], ["openai", "yaml", "sqlite3"]),
+        (["config", "show"], ["openai", "sqlite3"]),
+        (["key", "--help"], ["openai", "yaml", "sqlite3"]),
+        (["init", "--help"], ["openai", "yaml", "sqlite3"]),
+    ]
+)
+def test_cold_start(tmp_path: Path, args: List[str], forbidden_modules: List[str]) -> None:
+    config_path = tmp_path / ".askai" / "config.yml"
+    config_path.parent.mkdir()
+    ConfigHelper.reset(config_path=config_path)
+
+    import_times = _import_times(args=args, home=tmp_path)
+
+    imported_modules = {name.strip() for name in import_times}
+    assert "askai.entrypoint_askai" in imported_modules
+    for module in forbidden_modules:
+        assert module not in imported_modules, f"'{module}' is imported by 'askai {' '.join(args)}'"
+
+    top_level_import_time = sum(time for name, time in import_times.items() if not name.startswith(" "))
+    assert top_level_import_time < IMPORT_TIME_BUDGET_US
+
+
+def test_cold_start_config_show_with_snapshot(tmp_path: Path) -> None:
+    config_path = tmp_path / ".askai" / "config.yml"
+    config_path.parent.mkdir()
+    ConfigHelper.reset(config_path=config_path)
+
+    assert "yaml" in {name.strip() for name in _import_times(args=["config", "show"], home=tmp_path)}
+    assert "yaml" not in {name.strip() for name in _import_times(args=["config", "show"], home=tmp_path)}
+
+
+def test_cold_start_cached_answer(tmp_path: Path) -> None:
+    from askai.cache import ResponseCache
+
+    config_path = tmp_path / ".askai" / "config.yml"
+    config_path.parent.mkdir()
+    ConfigHelper.reset(config_path=config_path)
+    key = ResponseCache.key(prompt="Capital of France?", config=ConfigHelper.from_file(config_path=config_path))
+    ResponseCache(cache_path=tmp_path / ".askai" / "cache.db").set(key=key, response={"choices": [{"text": "Paris"}]})
+
+    import_times = _import_times(args=["Capital of France?"], home=tmp_path)
+
+    imported_modules = {name.strip() for name in import_times}
+    assert "askai.cache" in imported_modules
+    assert "openai" not in imported_modules, "'openai' is imported by a cached answer"
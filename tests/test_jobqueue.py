@@ -0,0 +1,157 @@
+import io
+import json
+import time
+from pathlib import Path
+
+import pytest
+import pytest_mock.plugin
+from pytest import CaptureFixture
+
+from askai.entrypoint_jobs import _results, _status, _submit, _worker
+from askai.jobqueue import JobQueue
+from askai.utils import ConfigHelper
+from tests.test_entrypoint_batch import _fake_create
+from tests.test_ratelimit import FakeClock
+
+
+def _queue(tmp_path: Path, clock: FakeClock, **kwargs) -> JobQueue:
+    return JobQueue(path=tmp_path / "jobs.db", visibility_timeout=60.0, retry_delay=10.0, max_attempts=2,
+                    clock=clock, **kwargs)
+
+
+def test_jobs_are_leased_once(tmp_path: Path) -> None:
+    clock = FakeClock()
+    queue = _queue(tmp_path, clock=clock)
+    assert queue.submit(records=[(f"p{idx}", {"max_tokens": idx}) for idx in range(5)]) == 5
+
+    first = queue.lease(worker="a", limit=3)
+    second = _queue(tmp_path, clock=clock).lease(worker="b", limit=3)
+    assert [job.prompt for job in first] == ["p0", "p1", "p2"]
+    assert [job.prompt for job in second] == ["p3", "p4"]
+    assert second[1].overrides == {"max_tokens": 4}
+    assert queue.lease(worker="a", limit=3) == []
+
+
+def test_expired_lease_goes_to_next_worker(tmp_path: Path) -> None:
+    clock = FakeClock()
+    queue = _queue(tmp_path, clock=clock)
+    queue.submit(records=[("p0", {})])
+    [lost] = queue.lease(worker="a", limit=1)
+
+    clock.now += 61
+    [job] = queue.lease(worker="b", limit=1)
+    assert job.id == lost.id and job.attempt == 2
+
+    # The first worker's late result is dropped, the current lease holder's is stored
+    assert queue.finish(outcomes=[(lost, {"answers": ["late"]})]) == 0
+    assert queue.finish(outcomes=[(job, {"answers": ["on time"]})]) == 1
+    assert list(queue.results()) == [{"id": job.id, "prompt": "p0", "answers": ["on time"]}]
+
+
+def test_failed_jobs_are_retried(tmp_path: Path) -> None:
+    clock = FakeClock()
+    queue = _queue(tmp_path, clock=clock)
+    queue.submit(records=[("p0", {})])
+
+    [job] = queue.lease(worker="a", limit=1)
+    queue.finish(outcomes=[(job, {"error": "Timed out"})])
+    assert queue.lease(worker="a", limit=1) == []  # Waits for the retry delay
+
+    clock.now += 10
+    [job] = queue.lease(worker="a", limit=1)
+    queue.finish(outcomes=[(job, {"error": "Timed out again"})])
+    clock.now += 100
+    assert queue.lease(worker="a", limit=1) == []
+    assert not queue.has_unfinished()
+    assert list(queue.results()) == [{"id": job.id, "prompt": "p0", "error": "Timed out again"}]
+
+    assert queue.retry_failed() == 1
+    assert queue.lease(worker="a", limit=1)[0].attempt == 1
+
+
+def test_expired_last_attempt_fails(tmp_path: Path) -> None:
+    clock = FakeClock()
+    queue = _queue(tmp_path, clock=clock)
+    queue.submit(records=[("p0", {})])
+    for _ in range(2):
+        queue.lease(worker="a", limit=1)
+        clock.now += 61
+
+    assert queue.lease(worker="a", limit=1) == []
+    assert queue.status()["failed"] == 1
+
+
+def test_status(tmp_path: Path) -> None:
+    clock = FakeClock()
+    queue = _queue(tmp_path, clock=clock)
+    queue.submit(records=[(f"p{idx}", {}) for idx in range(10)])
+    assert queue.status() == {"pending": 10, "leased": 0, "done": 0, "failed": 0, "throughput": None, "eta": None}
+
+    for _ in range(4):
+        [job] = queue.lease(worker="a", limit=1)
+        clock.now += 15
+        queue.finish(outcomes=[(job, {"answers": ["answer"]})])
+    queue.lease(worker="a", limit=1)
+
+    # 4 jobs finished in 45 seconds since the first one: 5.33 jobs per minute, and 6 to go
+    status = queue.status()
+    assert (status["pending"], status["leased"], status["done"]) == (5, 1, 4)
+    assert status["throughput"] == pytest.approx(4 / 45 * 60)
+    assert status["eta"] == pytest.approx(6 / (4 / 45))
+
+
+def test_submit_and_work(mocker: pytest_mock.plugin.MockerFixture, capsys: CaptureFixture, tmp_path: Path) -> None:
+    paths = {"jobs_path": tmp_path / "jobs.db", "config_path": tmp_path / "config.yml"}
+    (tmp_path / "key").write_text("DUMMY_KEY")
+    ConfigHelper.reset(config_path=paths["config_path"])
+    create = mocker.patch("openai.Completion.create", side_effect=_fake_create)
+
+    input_file = io.StringIO("".join(json.dumps({"prompt": f"p{idx}", "max_tokens": 1 + idx % 2}) + "\n"
+                                     for idx in range(7)))
+    _submit(input_file=input_file, jsonl=True, **paths)
+    _worker(batch_size=2, concurrency=2, api_key_path=tmp_path / "key", keys_path=tmp_path / "keys.json",
+            sleep=lambda seconds: None, **paths)
+
+    assert create.call_count == 4
+    output = io.StringIO()
+    _results(output=output, jobs_path=paths["jobs_path"])
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [r["answers"] for r in results] == [[f"P{idx} 0"] for idx in range(7)]
+
+    capsys.readouterr()
+    _status(jobs_path=paths["jobs_path"])
+    assert "0 pending, 0 leased, 7 done, 0 failed" in capsys.readouterr().out
+
+
+def test_worker_sends_rare_config_before_lease_expires(mocker: pytest_mock.plugin.MockerFixture,
+                                                        tmp_path: Path) -> None:
+    paths = {"jobs_path": tmp_path / "jobs.db", "config_path": tmp_path / "config.yml"}
+    (tmp_path / "key").write_text("DUMMY_KEY")
+    ConfigHelper.reset(config_path=paths["config_path"])
+    sent = []
+
+    def create(prompt: list, **kwargs) -> dict:
+        sent.extend(prompt)
+        time.sleep(0.05)
+        return _fake_create(prompt=prompt, **kwargs)
+
+    mocker.patch("openai.Completion.create", side_effect=create)
+
+    # The common jobs take longer than the visibility timeout, so the rare one can't wait for them
+    records = [{"prompt": "rare", "max_tokens": 1}] + [{"prompt": f"p{idx}"} for idx in range(40)]
+    _submit(input_file=io.StringIO("".join(json.dumps(record) + "\n" for record in records)), jsonl=True, **paths)
+    _worker(batch_size=2, visibility_timeout=0.2, api_key_path=tmp_path / "key", keys_path=tmp_path / "keys.json",
+            sleep=lambda seconds: None, **paths)
+
+    assert sent.count("rare") == 1
+    assert JobQueue(path=paths["jobs_path"]).status()["done"] == 41
+
+
+def test_submit_invalid_overrides(tmp_path: Path) -> None:
+    config_path = tmp_path / "config.yml"
+    ConfigHelper.reset(config_path=config_path)
+
+    with pytest.raises(SystemExit):
+        _submit(input_file=io.StringIO('{"prompt": "p0"}\n{"prompt": "p1", "max_tokens": 0}\n'), jsonl=True,
+                jobs_path=tmp_path / "jobs.db", config_path=config_path)
+    assert JobQueue(path=tmp_path / "jobs.db").status()["pending"] == 0
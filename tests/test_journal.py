@@ -0,0 +1,117 @@
+from pathlib import Path
+from typing import List
+
+import pytest_mock.plugin
+
+from askai.batch import number_lines
+from askai.journal import Journal, _key
+
+
+def _answer(journal: Journal, lines: List[str], failed: tuple = ()) -> List[int]:
+    """Answer every line the journal gives out, except the `failed` indices. Returns the indices given out"""
+    indices = []
+    for index, _, _ in journal.unanswered(lines):
+        journal.record({"index": index, **({"error": "Timed out"} if index in failed else {"answers": ["answer"]})})
+        indices.append(index)
+    return indices
+
+
+def test_resume_gives_out_unanswered_lines(tmp_path: Path) -> None:
+    lines = [f"p{idx}\n" for idx in range(25)]
+    with Journal(path=tmp_path / "journal") as journal:
+        assert _answer(journal, lines[:20], failed=(3, 17)) == list(range(20))
+
+    with Journal(path=tmp_path / "journal", resume=True) as journal:
+        assert list(journal.unanswered(lines)) == \
+            [(3, 4, "p3"), (17, 18, "p17")] + [(idx, idx + 1, f"p{idx}") for idx in range(20, 25)]
+        assert journal.skipped == 18
+
+
+def test_empty_lines_keep_numbering(tmp_path: Path) -> None:
+    lines = ["p0\n", "\n", "  \n", "p1\n", "p2"]
+    with Journal(path=tmp_path / "journal") as journal:
+        assert list(journal.unanswered(lines)) == list(number_lines(lines))
+        journal.record({"index": 0, "answers": ["answer"]})
+
+    with Journal(path=tmp_path / "journal", resume=True) as journal:
+        assert list(journal.unanswered(lines)) == [(1, 4, "p1"), (2, 5, "p2")]
+
+
+def test_repeated_lines_are_counted(tmp_path: Path) -> None:
+    lines = ["same\n", "other\n", "same\n", "same\n"]
+    with Journal(path=tmp_path / "journal") as journal:
+        _answer(journal, lines, failed=(3,))
+
+    with Journal(path=tmp_path / "journal", resume=True) as journal:
+        assert list(journal.unanswered(lines)) == [(3, 4, "same")]
+
+
+def test_journal_is_synced_in_batches(tmp_path: Path) -> None:
+    path = tmp_path / "journal"
+    journal = Journal(path=path, sync_entries=3, sync_interval=60.0)
+    _answer(journal, [f"p{idx}\n" for idx in range(5)])
+    assert path.stat().st_size == 3 * 8
+    journal.close()
+    assert path.stat().st_size == (2 + 3 + 5) * 8  # Rewritten as a header and one chunk with 5 keys
+
+
+def test_key_cut_off_by_crash_is_ignored(tmp_path: Path) -> None:
+    path = tmp_path / "journal"
+    lines = ["p0\n", "p1\n"]
+    with Journal(path=path) as journal:
+        _answer(journal, lines[:1])
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    with Journal(path=path, resume=True) as journal:
+        _answer(journal, lines)
+    with Journal(path=path, resume=True) as journal:
+        assert list(journal.unanswered(lines)) == []
+
+
+def test_keys_of_crashed_run_are_taken(tmp_path: Path) -> None:
+    path = tmp_path / "journal"
+    lines = [f"p{idx}\n" for idx in range(5)]
+    with Journal(path=path, chunk_lines=2) as journal:
+        _answer(journal, lines, failed=(1, 4))
+
+    # A resumed run that answers the failed lines and crashes only appended their keys
+    journal = Journal(path=path, resume=True, chunk_lines=2)
+    assert _answer(journal, lines) == [1, 4]
+    journal.sync()
+    journal._file.close()
+
+    with Journal(path=path, resume=True, chunk_lines=2) as journal:
+        assert list(journal.unanswered(lines)) == []
+        assert journal.skipped == 5
+
+
+def test_unchanged_chunks_are_skipped_whole(mocker: pytest_mock.plugin.MockerFixture, tmp_path: Path) -> None:
+    lines = [f"p{idx}\n" for idx in range(10)]
+    with Journal(path=tmp_path / "journal", chunk_lines=4) as journal:
+        _answer(journal, lines, failed=(5,))
+
+    hashed = mocker.patch("askai.journal._key", side_effect=_key)
+    with Journal(path=tmp_path / "journal", resume=True, chunk_lines=4) as journal:
+        assert list(journal.unanswered(lines)) == [(5, 6, "p5")]
+        assert journal.skipped == 9
+    assert hashed.call_count == 3 + 1  # Every chunk, and the line without an answer
+
+
+def test_lines_are_found_after_the_chunks_changed(tmp_path: Path) -> None:
+    lines = ["a\n", "b\n", "a\n", "c\n"]
+    with Journal(path=tmp_path / "journal", chunk_lines=2) as journal:
+        _answer(journal, lines, failed=(2,))
+
+    # A line inserted at the start moves every line to another chunk. Only one "a" was answered
+    with Journal(path=tmp_path / "journal", resume=True, chunk_lines=2) as journal:
+        assert list(journal.unanswered(["x\n", *lines])) == [(0, 1, "x"), (3, 4, "a")]
+        assert journal.skipped == 3
+
+
+def test_new_run_starts_over(tmp_path: Path) -> None:
+    lines = ["p0\n", "p1\n"]
+    with Journal(path=tmp_path / "journal") as journal:
+        _answer(journal, lines)
+    with Journal(path=tmp_path / "journal") as journal:
+        assert len(list(journal.unanswered(lines))) == 2
@@ -2,6 +2,7 @@ from pathlib import Path
 
 import pytest
 import pytest_mock.plugin
+from openai.error import AuthenticationError, APIConnectionError, InvalidRequestError, Timeout
 
 from askai.utils import KeyHelper
 
@@ -71,3 +72,70 @@ def test_from_file_does_exist(tmp_path: Path) -> None:
     actual_key = KeyHelper().from_file(api_key_path=api_key_path)
 
     assert DUMMY_KEY == actual_key
+
+
+VALID_FORMAT_KEY = "sk-" + "a1B2" * 12
+
+
+@pytest.mark.parametrize(
+    "key, valid_format",
+    [
+        (VALID_FORMAT_KEY, True),
+        ("sk-short", False),
+        ("pk-" + "a1B2" * 12, False),
+        (VALID_FORMAT_KEY + " ", False),
+        ("", False),
+    ]
+)
+def test_is_valid_api_key_format_offline(mocker: pytest_mock.plugin.MockerFixture, key: str, valid_format: bool) -> None:
+    create = mocker.patch("openai.Completion.create")
+    assert KeyHelper(verify=False)._is_valid_api_key(key) == valid_format
+    create.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "error, is_valid, verified",
+    [
+        (None, True, True),
+        (AuthenticationError("Incorrect API key"), False, False),
+        (InvalidRequestError("No prompt", param="prompt"), True, True),
+        (APIConnectionError("Offline"), True, None),
+        (Timeout("Slow proxy"), True, None),
+    ]
+)
+def test_is_valid_api_key_verified(mocker: pytest_mock.plugin.MockerFixture, error, is_valid: bool, verified) -> None:
+    mocker.patch("openai.Completion.create", side_effect=error)
+    key_helper = KeyHelper()
+
+    assert key_helper._is_valid_api_key(VALID_FORMAT_KEY) == is_valid
+    assert key_helper._verified == verified
+
+
+def test_is_valid_api_key_bad_format_not_sent(mocker: pytest_mock.plugin.MockerFixture) -> None:
+    create = mocker.patch("openai.Completion.create")
+    assert not KeyHelper()._is_valid_api_key("sk-short")
+    create.assert_not_called()
+
+
+def test_save_records_verification(tmp_path: Path) -> None:
+    api_key_path = tmp_path / "key"
+
+    key_helper = KeyHelper()
+    key_helper._api_key = VALID_FORMAT_KEY
+    key_helper._verified = True
+    key_helper.save(api_key_path=api_key_path)
+
+    assert KeyHelper.verification(key=VALID_FORMAT_KEY, api_key_path=api_key_path) is True
+    assert KeyHelper.verification(key=DUMMY_KEY, api_key_path=api_key_path) is None
+    assert VALID_FORMAT_KEY not in (tmp_path / "key_verification.json").read_text()
+
+
+def test_record_verification(tmp_path: Path) -> None:
+    api_key_path = tmp_path / "key"
+    assert KeyHelper.verification(key=DUMMY_KEY, api_key_path=api_key_path) is None
+
+    KeyHelper.record_verification(key=DUMMY_KEY, valid=True, api_key_path=api_key_path)
+    KeyHelper.record_verification(key=VALID_FORMAT_KEY, valid=False, api_key_path=api_key_path)
+
+    assert KeyHelper.verification(key=DUMMY_KEY, api_key_path=api_key_path) is True
+    assert KeyHelper.verification(key=VALID_FORMAT_KEY, api_key_path=api_key_path) is False
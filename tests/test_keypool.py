@@ -0,0 +1,124 @@
+import json
+from pathlib import Path
+from typing import List
+
+import pytest
+import pytest_mock.plugin
+from openai.error import AuthenticationError, RateLimitError, Timeout
+
+from askai.client import Client
+from askai.keypool import KeyHealth, KeyPool, PooledKey, load_keys
+from askai.utils import ConfigHelper
+from tests.test_ratelimit import FakeClock
+
+
+def _keys(count: int, **limits) -> List[PooledKey]:
+    return [PooledKey(name=f"key{idx}", key=f"sk-{idx}", **limits) for idx in range(count)]
+
+
+def _pool(tmp_path: Path, keys: List[PooledKey], clock: FakeClock) -> KeyPool:
+    return KeyPool(keys=keys, health=KeyHealth(path=tmp_path / "health.json", clock=clock),
+                   rate_limit_path=tmp_path / "rate_limit", clock=clock, sleep=clock.sleep)
+
+
+def test_keys_take_turns(tmp_path: Path) -> None:
+    pool = _pool(tmp_path, keys=_keys(3), clock=FakeClock())
+
+    assert [pool.acquire(tokens=10).name for _ in range(6)] == ["key0", "key1", "key2", "key0", "key1", "key2"]
+
+
+def test_key_with_room_in_its_limits_is_preferred(tmp_path: Path) -> None:
+    clock = FakeClock()
+    pool = _pool(tmp_path, keys=_keys(2, requests_per_minute=1), clock=clock)
+
+    assert [pool.acquire(tokens=10).name for _ in range(2)] == ["key0", "key1"]
+    assert clock.sleeps == []
+
+    # Both keys used their request for this minute, so the third request waits for one of them
+    pool.acquire(tokens=10)
+    assert clock.sleeps == [60.0]
+
+
+def test_rate_limited_key_is_quarantined(tmp_path: Path) -> None:
+    clock = FakeClock()
+    keys = _keys(2)
+    pool = _pool(tmp_path, keys=keys, clock=clock)
+
+    assert pool.report(key=keys[0], error=RateLimitError("Rate limit reached", headers={"Retry-After": "20"}))
+    assert [pool.acquire(tokens=10).name for _ in range(3)] == ["key1"] * 3
+    assert pool.available() == 1
+
+    clock.now += 21
+    assert {pool.acquire(tokens=10).name for _ in range(2)} == {"key0", "key1"}
+
+
+def test_quarantined_keys_are_shared_between_pools(tmp_path: Path) -> None:
+    clock = FakeClock()
+    keys = _keys(2)
+    _pool(tmp_path, keys=keys, clock=clock).report(key=keys[1], error=AuthenticationError("Incorrect API key"))
+
+    health = KeyHealth(path=tmp_path / "health.json", clock=clock)
+    assert health.reason(keys[1]) == "rejected"
+    assert health.quarantined_until(keys[0]) is None
+    assert "sk-1" not in (tmp_path / "health.json").read_text()
+
+
+def test_all_keys_quarantined_uses_first_released(tmp_path: Path) -> None:
+    keys = _keys(2)
+    pool = _pool(tmp_path, keys=keys, clock=FakeClock())
+    pool.report(key=keys[0], error=AuthenticationError("Incorrect API key"))
+    pool.report(key=keys[1], error=RateLimitError("Rate limit reached"))
+
+    assert pool.available() == 0
+    assert pool.acquire(tokens=10).name == "key1"
+
+
+def test_other_errors_are_not_the_keys_fault(tmp_path: Path) -> None:
+    keys = _keys(2)
+    pool = _pool(tmp_path, keys=keys, clock=FakeClock())
+
+    assert not pool.report(key=keys[0], error=Timeout("Request timed out"))
+    assert pool.available() == 2
+
+
+def test_load_keys(tmp_path: Path) -> None:
+    api_key_path = tmp_path / "key"
+    keys_path = tmp_path / "keys.json"
+    assert KeyPool.load(api_key_path=api_key_path, keys_path=keys_path) is None
+
+    api_key_path.write_text("sk-default\n")
+    assert KeyPool.load(api_key_path=api_key_path, keys_path=keys_path) is None
+
+    keys_path.write_text(json.dumps({"team-b": {"key": "sk-b", "organization": "org-b", "requests_per_minute": 60}}))
+    assert load_keys(api_key_path=api_key_path, keys_path=keys_path) == [
+        PooledKey(name="default", key="sk-default"),
+        PooledKey(name="team-b", key="sk-b", organization="org-b", requests_per_minute=60)
+    ]
+    assert len(KeyPool.load(api_key_path=api_key_path, keys_path=keys_path, rate_limit_path=tmp_path / "r")) == 2
+
+
+def test_key_name_is_not_a_file_name(tmp_path: Path) -> None:
+    keys = [PooledKey(name="team/b", key="sk-b", requests_per_minute=60), PooledKey(name="..", key="sk-c")]
+    pool = _pool(tmp_path, keys=keys, clock=FakeClock())
+
+    assert pool.acquire(tokens=1) in keys
+    assert all(path.parent == tmp_path for path in tmp_path.rglob("*"))
+
+
+def test_client_switches_key_when_rejected(mocker: pytest_mock.plugin.MockerFixture, tmp_path: Path) -> None:
+    create = mocker.patch("openai.Completion.create", side_effect=[AuthenticationError("Incorrect API key"), "response"])
+    keys = [PooledKey(name="a", key="sk-a", organization="org-a"), PooledKey(name="b", key="sk-b")]
+    pool = _pool(tmp_path, keys=keys, clock=FakeClock())
+
+    assert Client(config=ConfigHelper(), key_pool=pool).create(prompt="question") == "response"
+    assert [(call.kwargs["api_key"], call.kwargs["organization"]) for call in create.call_args_list] == \
+        [("sk-a", "org-a"), ("sk-b", None)]
+
+
+def test_client_raises_when_every_key_failed(mocker: pytest_mock.plugin.MockerFixture, tmp_path: Path) -> None:
+    create = mocker.patch("openai.Completion.create", side_effect=AuthenticationError("Incorrect API key"))
+    pool = _pool(tmp_path, keys=_keys(2), clock=FakeClock())
+
+    with pytest.raises(AuthenticationError):
+        Client(config=ConfigHelper(), key_pool=pool).create(prompt="question")
+    assert create.call_count == 2
@@ -0,0 +1,75 @@
+import io
+from typing import List
+
+import pytest
+
+from askai.mapreduce import Reducer, chunk, read_pieces
+from askai.tokenizer import get_tokenizer
+
+
+def test_read_pieces_splits_at_whitespace() -> None:
+    text = "alpha beta gamma\ndelta epsilon"
+    pieces = list(read_pieces(io.StringIO(text), size=8))
+    assert "".join(pieces) == text
+    assert all(word in text.split() for piece in pieces for word in piece.split())  # No word is split
+
+
+def test_read_pieces_without_whitespace() -> None:
+    text = "x" * 100
+    pieces = list(read_pieces(io.StringIO(text), size=30))
+    assert "".join(pieces) == text
+    assert max(len(piece) for piece in pieces) == 30
+
+
+@pytest.mark.parametrize("overlap", [0, 5])
+def test_chunk_overlap(overlap: int) -> None:
+    tokenizer = get_tokenizer()
+    text = " ".join(f"word{idx}" for idx in range(200))
+    chunks = list(chunk(pieces=read_pieces(io.StringIO(text), size=50), tokenizer=tokenizer, chunk_tokens=40, overlap=overlap))
+
+    tokens = [tokenizer.encode(c) for c in chunks]
+    assert all(len(t) == 40 for t in tokens[:-1])
+    assert all(previous[len(previous) - overlap:] == current[:overlap] for previous, current in zip(tokens, tokens[1:]))
+    rebuilt = tokens[0] + [token for t in tokens[1:] for token in t[overlap:]]
+    assert tokenizer.decode(rebuilt) == text
+
+
+@pytest.mark.parametrize("overlap", [0, 5])
+def test_chunk_keeps_characters_whole(overlap: int) -> None:
+    tokenizer = get_tokenizer()
+    text = " ".join("\U0001F642\u00fc\u4e2d" * (idx % 3 + 1) for idx in range(100))  # Characters of several tokens
+    chunks = list(chunk(pieces=read_pieces(io.StringIO(text), size=50), tokenizer=tokenizer, chunk_tokens=40, overlap=overlap))
+
+    assert len(chunks) > 2
+    assert all("\ufffd" not in c and len(tokenizer.encode(c)) <= 40 for c in chunks)
+    assert chunks[0].startswith("\U0001F642") and chunks[-1].endswith("\u4e2d")
+
+
+def test_chunk_short_text() -> None:
+    assert list(chunk(pieces=["short text"], tokenizer=get_tokenizer(), chunk_tokens=40, overlap=5)) == ["short text"]
+
+
+def test_reducer_reduces_hierarchically() -> None:
+    reduced: List[List[str]] = []
+
+    def reduce(answers: List[str]) -> str:
+        reduced.append(answers)
+        return "(" + "+".join(answers) + ")"
+
+    reducer = Reducer(reduce=reduce, count=lambda answer: 1, budget=3)
+    for idx in range(10):
+        reducer.add(str(idx))
+
+    assert reduced[:2] == [["0", "1", "2"], ["3", "4", "5"]]
+    answers = reducer.finish()
+    assert len(answers) <= 3
+    assert "".join(answers).replace("(", "").replace(")", "").replace("+", "") == "0123456789"  # Order is kept
+
+
+def test_reducer_stops_when_answers_cant_be_combined() -> None:
+    # Every answer, also a combined one, takes more than half the budget
+    reducer = Reducer(reduce=lambda answers: "combined", count=lambda answer: 3, budget=5)
+    for idx in range(9):
+        reducer.add(str(idx))
+
+    assert reducer.finish()[-1] == "8"  # Returns instead of reducing forever
@@ -0,0 +1,93 @@
+import random
+import threading
+import time
+from typing import Iterator, List
+
+from askai.aimd import AIMDController
+from askai.batch import BatchPrompt
+from askai.pipeline import Pipeline
+from askai.utils import ConfigHelper
+
+NUM_PROMPTS = 50
+
+
+def _prompts(consumed: List[int] = None) -> Iterator[BatchPrompt]:
+    config = ConfigHelper()
+    for idx in range(NUM_PROMPTS):
+        if consumed is not None:
+            consumed[0] += 1
+        yield BatchPrompt(index=idx, prompt=str(idx), config=config)
+
+
+def _complete(group: List[BatchPrompt]) -> List[dict]:
+    time.sleep(random.random() / 100)
+    return [{"index": p.index, "answers": [p.prompt]} for p in group]
+
+
+def test_unordered_emits_all_results_with_bounded_concurrency() -> None:
+    lock = threading.Lock()
+    in_flight, max_in_flight = [0], [0]
+
+    def complete(group: List[BatchPrompt]) -> List[dict]:
+        with lock:
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+        results = _complete(group)
+        with lock:
+            in_flight[0] -= 1
+        return results
+
+    emitted = []
+    Pipeline(complete=complete, emit=emitted.append, concurrency=4, batch_size=3).run(prompts=_prompts())
+
+    assert sorted(result["index"] for result in emitted) == list(range(NUM_PROMPTS))
+    assert 1 < max_in_flight[0] <= 4
+
+
+def test_ordered() -> None:
+    emitted = []
+    Pipeline(complete=_complete, emit=emitted.append, concurrency=8, batch_size=2, ordered=True).run(prompts=_prompts())
+
+    assert [result["index"] for result in emitted] == list(range(NUM_PROMPTS))
+
+
+def test_ordered_window_bounds_buffered_results() -> None:
+    consumed = [0]
+    consumed_while_first_is_slow = []
+
+    def complete(group: List[BatchPrompt]) -> List[dict]:
+        if group[0].index == 0:
+            time.sleep(0.2)
+            consumed_while_first_is_slow.append(consumed[0])
+        return _complete(group)
+
+    emitted = []
+    pipeline = Pipeline(complete=complete, emit=emitted.append, concurrency=2, batch_size=1, ordered=True, window=4)
+    pipeline.run(prompts=_prompts(consumed=consumed))
+
+    assert consumed_while_first_is_slow[0] <= 5
+    assert [result["index"] for result in emitted] == list(range(NUM_PROMPTS))
+
+
+def test_controller_limits_requests_in_flight() -> None:
+    lock = threading.Lock()
+    in_flight, max_in_flight = [0], [0]
+    controller = AIMDController(maximum=8, initial=2)
+    controller.record(rate_limited=True)  # Stays at 1 in flight, then grows by one per window
+
+    def complete(group: List[BatchPrompt]) -> List[dict]:
+        with lock:
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+        results = _complete(group)
+        with lock:
+            in_flight[0] -= 1
+        return results
+
+    emitted = []
+    Pipeline(complete=complete, emit=emitted.append, concurrency=8, batch_size=1, controller=controller).run(
+        prompts=_prompts()
+    )
+
+    assert sorted(result["index"] for result in emitted) == list(range(NUM_PROMPTS))
+    assert max_in_flight[0] == 1
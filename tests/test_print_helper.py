@@ -0,0 +1,50 @@
+from typing import List, Optional
+
+import pytest
+from pytest import CaptureFixture
+
+from askai.utils import PrintHelper
+
+
+def _chunk(index: int, text: str, finish_reason: Optional[str] = None) -> dict:
+    return {"choices": [{"index": index, "text": text, "finish_reason": finish_reason}]}
+
+
+def _response(texts: List[str]) -> dict:
+    return {"choices": [{"index": idx, "text": text, "finish_reason": "stop"} for idx, text in enumerate(texts)]}
+
+
+def test_print_stream_single_answer_same_as_print_response(capsys: CaptureFixture) -> None:
+    PrintHelper.print_response(response=_response(["\n\nHello world"]))
+    expected = capsys.readouterr().out
+
+    chunks = [_chunk(0, "\n"), _chunk(0, "\nHello"), _chunk(0, " world"), _chunk(0, "", "stop")]
+    PrintHelper.print_stream(response=iter(chunks), num_answers=1)
+    assert capsys.readouterr().out == expected
+
+
+@pytest.mark.parametrize("with_finish_reason", [True, False])
+def test_print_stream_multiple_answers_interleaved(capsys: CaptureFixture, with_finish_reason: bool) -> None:
+    PrintHelper.print_response(response=_response(["\nFirst answer", "Second answer", "Third"]))
+    expected = capsys.readouterr().out
+
+    finish_reason = "stop" if with_finish_reason else None
+    chunks = [
+        _chunk(1, "Second"),
+        _chunk(0, "\nFirst"),
+        _chunk(2, "Third", finish_reason),
+        _chunk(1, " answer", finish_reason),
+        _chunk(0, " answer", finish_reason),
+    ]
+    PrintHelper.print_stream(response=iter(chunks), num_answers=3)
+    assert capsys.readouterr().out == expected
+
+
+def test_print_stream_prints_before_stream_is_done(capsys: CaptureFixture) -> None:
+    def response():
+        yield _chunk(0, "Hello")
+        assert capsys.readouterr().out == "Hello"
+        yield _chunk(0, "", "stop")
+
+    PrintHelper.print_stream(response=response(), num_answers=1)
+    assert capsys.readouterr().out == "\n"
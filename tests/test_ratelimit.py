@@ -0,0 +1,102 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+import pytest
+from pytest import MonkeyPatch
+
+from askai.ratelimit import RateLimiter, estimate_tokens
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps: List[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+
+
+def _rate_limiter(state_path: Path, clock: FakeClock, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+    return RateLimiter(
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+        state_path=state_path,
+        clock=clock,
+        sleep=clock.sleep
+    )
+
+
+def test_estimate_tokens() -> None:
+    assert estimate_tokens(prompt="12345678", max_tokens=10, num_answers=2) == 2 + 20
+    assert estimate_tokens(prompt=["1234", "12345"], max_tokens=10, num_answers=1) == 1 + 2 + 20
+
+
+def test_disabled(tmp_path: Path) -> None:
+    clock = FakeClock()
+    rate_limiter = _rate_limiter(state_path=tmp_path / "rate_limit", clock=clock)
+
+    for _ in range(100):
+        assert rate_limiter.acquire(tokens=1000) == 0.0
+    assert not (tmp_path / "rate_limit").exists()
+
+
+def test_requests_per_minute(tmp_path: Path) -> None:
+    clock = FakeClock()
+    rate_limiter = _rate_limiter(state_path=tmp_path / "rate_limit", clock=clock, requests_per_minute=60)
+
+    waits = [rate_limiter.acquire(tokens=1) for _ in range(62)]
+    assert waits[:60] == [0.0] * 60
+    assert waits[60:] == pytest.approx([1.0, 2.0])  # Queued behind each other, one request per second
+
+    clock.now += 10
+    assert rate_limiter.acquire(tokens=1) == 0.0
+
+
+def test_tokens_per_minute(tmp_path: Path) -> None:
+    clock = FakeClock()
+    rate_limiter = _rate_limiter(state_path=tmp_path / "rate_limit", clock=clock, tokens_per_minute=600)
+
+    assert rate_limiter.acquire(tokens=500) == 0.0
+    assert rate_limiter.acquire(tokens=200) == pytest.approx(10.0)  # 100 tokens missing, 10 tokens per second
+    assert rate_limiter.acquire(tokens=10_000) == pytest.approx(70.0)  # Larger than the bucket: waits for a full one
+
+
+def test_shared_between_instances(tmp_path: Path) -> None:
+    clock = FakeClock()
+    state_path = tmp_path / "rate_limit"
+    first = _rate_limiter(state_path=state_path, clock=clock, requests_per_minute=2)
+    second = _rate_limiter(state_path=state_path, clock=clock, requests_per_minute=2)
+
+    assert first.acquire(tokens=1) == 0.0
+    assert second.acquire(tokens=1) == 0.0
+    assert first.acquire(tokens=1) == pytest.approx(30.0)
+    assert second.acquire(tokens=1) == pytest.approx(60.0)
+
+
+def test_shared_between_threads_without_fcntl(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr("askai.ratelimit.fcntl", None)
+    read = os.read
+
+    def slow_read(fd: int, size: int) -> bytes:
+        data = read(fd, size)
+        time.sleep(0.001)  # Leaves time for another thread to read the same state
+        return data
+
+    monkeypatch.setattr(os, "read", slow_read)
+    clock = FakeClock()
+    state_path = tmp_path / "rate_limit"
+
+    def acquire(_: int) -> float:
+        return _rate_limiter(state_path=state_path, clock=clock, requests_per_minute=60).acquire(tokens=1)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        waits = sorted(executor.map(acquire, range(64)))
+
+    # Every request reserved its own place in the queue, none was lost to another thread's update
+    assert waits == pytest.approx([0.0] * 60 + [1.0, 2.0, 3.0, 4.0])
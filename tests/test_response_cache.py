@@ -0,0 +1,140 @@
+import json
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+
+import pytest_mock.plugin
+
+from askai.cache import ResponseCache
+from askai.utils import ConfigHelper
+
+DUMMY_RESPONSE = {"choices": [{"index": 0, "text": "\n\nAnswer", "finish_reason": "stop"}]}
+
+
+def test_key_depends_on_prompt_and_sampling_fields() -> None:
+    config_helper = ConfigHelper()
+    key = ResponseCache.key(prompt="question", config=config_helper)
+
+    assert key == ResponseCache.key(prompt="question", config=ConfigHelper())
+    assert key != ResponseCache.key(prompt="other question", config=config_helper)
+    for field, value in [("model", "text-ada-001"), ("num_answers", 2), ("max_tokens", 1), ("temperature", 0.0),
+                         ("top_p", 0.5), ("frequency_penalty", 1.0), ("presence_penalty", 1.0)]:
+        assert key != ResponseCache.key(prompt="question", config=config_helper.with_overrides(**{field: value}))
+
+
+def test_get_missing(tmp_path: Path) -> None:
+    assert ResponseCache(cache_path=tmp_path / "cache.db").get("missing") is None
+
+
+def test_set_and_get(tmp_path: Path) -> None:
+    cache_path = tmp_path / "cache.db"
+    ResponseCache(cache_path=cache_path).set(key="key", response=DUMMY_RESPONSE)
+
+    assert ResponseCache(cache_path=cache_path).get("key") == DUMMY_RESPONSE
+
+
+def test_ttl(mocker: pytest_mock.plugin.MockerFixture, tmp_path: Path) -> None:
+    cache = ResponseCache(cache_path=tmp_path / "cache.db", ttl_seconds=10)
+    cache.set(key="expiring", response=DUMMY_RESPONSE)
+    cache.set(key="deterministic", response=DUMMY_RESPONSE, deterministic=True)
+
+    later = time.time() + 3600
+    mocker.patch("askai.cache.time.time", lambda: later)
+    assert cache.get("expiring") is None
+    assert cache.get("deterministic") == DUMMY_RESPONSE
+
+
+def test_lru_eviction(mocker: pytest_mock.plugin.MockerFixture, tmp_path: Path) -> None:
+    now = [1000.0]
+    mocker.patch("askai.cache.time.time", lambda: now[0])
+    cache = ResponseCache(cache_path=tmp_path / "cache.db", max_bytes=10_000)
+
+    response = {"choices": [{"index": 0, "text": "x" * 3000, "finish_reason": "stop"}]}
+    entry_size = len(zlib.compress(json.dumps(response).encode("utf8")))
+    num_entries = 10_000 // entry_size + 2
+    for idx in range(num_entries):
+        now[0] += 1
+        cache.set(key=str(idx), response={**response, "id": idx})
+        if idx == 0:
+            continue
+        now[0] += 1
+        assert cache.get("0") is not None  # Keep the first entry recently used
+
+    assert cache.get("0") is not None
+    assert cache.get("1") is None
+    assert cache.get(str(num_entries - 1)) is not None
+
+
+def test_record_stream(tmp_path: Path) -> None:
+    cache = ResponseCache(cache_path=tmp_path / "cache.db")
+    chunks = [
+        {"choices": [{"index": 1, "text": "B", "finish_reason": None}]},
+        {"choices": [{"index": 0, "text": "A", "finish_reason": "stop"}]},
+        {"choices": [{"index": 1, "text": "B", "finish_reason": "length"}]},
+    ]
+
+    assert list(cache.record_stream(key="key", response=iter(chunks))) == chunks
+    assert cache.get("key") == {"choices": [
+        {"index": 0, "text": "A", "finish_reason": "stop"},
+        {"index": 1, "text": "BB", "finish_reason": "length"},
+    ]}
+
+
+def test_record_stream_not_stored_if_interrupted(tmp_path: Path) -> None:
+    cache = ResponseCache(cache_path=tmp_path / "cache.db")
+    stream = cache.record_stream(key="key", response=iter([{"choices": [{"index": 0, "text": "A"}]}] * 2))
+    next(stream)
+    stream.close()
+
+    assert cache.get("key") is None
+
+
+def test_get_similar(tmp_path: Path) -> None:
+    config_helper = ConfigHelper()
+    cache = ResponseCache(cache_path=tmp_path / "cache.db")
+    prompt = "What is the difference between a list and a tuple in Python?"
+    cache.set(key="key", response=DUMMY_RESPONSE, prompt=prompt, config=config_helper)
+    cache.set(key="unrelated", response={"choices": []}, prompt="What is the capital of France?", config=config_helper)
+
+    assert cache.get_similar(prompt="what's the difference between a list and a tuple in python", config=config_helper) \
+        == DUMMY_RESPONSE
+    assert cache.get_similar(prompt="Explain how DNS works", config=config_helper) is None
+    assert cache.get_similar(prompt=prompt, config=config_helper.with_overrides(temperature=0.0)) is None
+
+
+def test_get_similar_without_prompt(tmp_path: Path) -> None:
+    cache = ResponseCache(cache_path=tmp_path / "cache.db")
+    cache.set(key="key", response=DUMMY_RESPONSE)
+
+    assert cache.get_similar(prompt="question", config=ConfigHelper(), threshold=0.0) is None
+
+
+def test_get_similar_follows_eviction(mocker: pytest_mock.plugin.MockerFixture, tmp_path: Path) -> None:
+    cache = ResponseCache(cache_path=tmp_path / "cache.db", ttl_seconds=10)
+    cache.set(key="key", response=DUMMY_RESPONSE, prompt="question", config=ConfigHelper())
+
+    later = time.time() + 3600
+    mocker.patch("askai.cache.time.time", lambda: later)
+    cache.set(key="other", response=DUMMY_RESPONSE)  # Evicts the expired entry
+    assert cache.get_similar(prompt="question", config=ConfigHelper()) is None
+    assert cache._connect().execute("SELECT COUNT(*) FROM fingerprints").fetchone() == (0,)
+
+
+def test_fingerprints_banded_another_way_are_dropped(tmp_path: Path) -> None:
+    cache_path = tmp_path / "cache.db"
+    with sqlite3.connect(cache_path) as connection:
+        connection.execute("CREATE TABLE fingerprints (key TEXT PRIMARY KEY, config TEXT NOT NULL, simhash INTEGER NOT NULL, "
+                           + ", ".join(f"band{idx} INTEGER NOT NULL" for idx in range(6)) + ")")
+    cache = ResponseCache(cache_path=cache_path)
+    cache.set(key="key", response=DUMMY_RESPONSE, prompt="question", config=ConfigHelper())
+
+    assert cache.get_similar(prompt="Question?", config=ConfigHelper()) == DUMMY_RESPONSE
+
+
+def test_record_stream_stores_fingerprint(tmp_path: Path) -> None:
+    cache = ResponseCache(cache_path=tmp_path / "cache.db")
+    chunks = [{"choices": [{"index": 0, "text": "A", "finish_reason": "stop"}]}]
+    list(cache.record_stream(key="key", response=iter(chunks), prompt="Question?", config=ConfigHelper()))
+
+    assert cache.get_similar(prompt="question", config=ConfigHelper()) is not None
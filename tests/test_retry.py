@@ -0,0 +1,126 @@
+from typing import List
+
+import pytest
+from openai.error import APIConnectionError, APIError, AuthenticationError, InvalidRequestError, RateLimitError, \
+    ServiceUnavailableError, Timeout
+
+from askai.retry import CircuitBreaker, CircuitOpenError, Retrier, is_retryable, retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps: List[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _failing(errors: List[Exception], result: str = "result"):
+    errors = list(errors)
+
+    def func() -> str:
+        if errors:
+            raise errors.pop(0)
+        return result
+    return func
+
+
+@pytest.mark.parametrize(
+    "error, retryable",
+    [
+        (RateLimitError("Slow down"), True),
+        (RateLimitError("No quota", code="insufficient_quota"), False),
+        (APIConnectionError("Connection reset"), True),
+        (Timeout("Timed out"), True),
+        (ServiceUnavailableError("Overloaded"), True),
+        (APIError("Bad gateway", http_status=502), True),
+        (APIError("Not found", http_status=404), False),
+        (AuthenticationError("Bad key"), False),
+        (InvalidRequestError("Bad request", param="prompt"), False),
+        (ValueError("Not from openai"), False),
+    ]
+)
+def test_is_retryable(error: Exception, retryable: bool) -> None:
+    assert is_retryable(error) == retryable
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({}, None),
+        ({"Retry-After": "7"}, 7.0),
+        ({"retry-after-ms": "1500"}, 1.5),
+        ({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}, 0.0),  # In the past
+        ({"Retry-After": "soon"}, None),
+    ]
+)
+def test_retry_after(headers: dict, expected: float) -> None:
+    assert retry_after(RateLimitError("Slow down", headers=headers)) == expected
+
+
+def test_retries_until_success() -> None:
+    clock = FakeClock()
+    retrier = Retrier(max_retries=3, timeout=100, base_delay=1, max_delay=10, sleep=clock.sleep, clock=clock)
+
+    assert retrier.call(_failing([Timeout(), APIConnectionError("Reset")])) == "result"
+    assert len(clock.sleeps) == 2
+    assert 0 <= clock.sleeps[0] <= 1 and 0 <= clock.sleeps[1] <= 2  # Full jitter
+
+
+def test_honours_retry_after() -> None:
+    clock = FakeClock()
+    retrier = Retrier(max_retries=3, timeout=100, sleep=clock.sleep, clock=clock)
+
+    retrier.call(_failing([RateLimitError("Slow down", headers={"Retry-After": "20"})]))
+    assert clock.sleeps == [20.0]
+
+
+def test_fatal_error_is_not_retried() -> None:
+    clock = FakeClock()
+    retrier = Retrier(max_retries=3, timeout=100, sleep=clock.sleep, clock=clock)
+
+    with pytest.raises(AuthenticationError):
+        retrier.call(_failing([AuthenticationError("Bad key")]))
+    assert clock.sleeps == []
+
+
+def test_gives_up_after_max_retries() -> None:
+    clock = FakeClock()
+    retrier = Retrier(max_retries=2, timeout=100, sleep=clock.sleep, clock=clock)
+
+    with pytest.raises(Timeout):
+        retrier.call(_failing([Timeout()] * 3))
+    assert len(clock.sleeps) == 2
+
+
+def test_gives_up_at_deadline() -> None:
+    clock = FakeClock()
+    retrier = Retrier(max_retries=10, timeout=30, sleep=clock.sleep, clock=clock)
+
+    with pytest.raises(RateLimitError):
+        retrier.call(_failing([RateLimitError("Slow down", headers={"Retry-After": "20"})] * 2))
+    assert clock.sleeps == [20.0]  # A second wait of 20 s would end after the 30 s deadline
+
+
+def test_circuit_breaker_fails_fast_and_recovers() -> None:
+    clock = FakeClock()
+    circuit_breaker = CircuitBreaker(threshold=2, cooldown=10, clock=clock)
+    retrier = Retrier(max_retries=0, timeout=100, circuit_breaker=circuit_breaker, sleep=clock.sleep, clock=clock)
+
+    for _ in range(2):
+        with pytest.raises(Timeout):
+            retrier.call(_failing([Timeout()]))
+
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        retrier.call(lambda: calls.append(1))
+    assert calls == []
+
+    clock.now += 10
+    assert retrier.call(_failing([])) == "result"  # Probe succeeds and closes the breaker
+    assert retrier.call(_failing([])) == "result"
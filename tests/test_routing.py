@@ -0,0 +1,121 @@
+import json
+from pathlib import Path
+
+from askai.batch import BatchPrompt, route_prompts
+from askai.routing import Choice, ModelRouter, RoutingHistory, Route, is_good, record_stream, route, size
+from askai.utils import ConfigHelper
+
+
+def _history(tmp_path: Path, stats: dict) -> RoutingHistory:
+    path = tmp_path / "routing.json"
+    path.write_text(json.dumps(stats))
+    return RoutingHistory(path=path)
+
+
+def _stats(answers: int = 10, seconds: float = 1.0, quality: float = 1.0) -> dict:
+    return {"answers": answers, "seconds": seconds, "quality": quality}
+
+
+def test_size() -> None:
+    assert size(prompt_tokens=10, max_tokens=300) == "short"
+    assert size(prompt_tokens=10, max_tokens=301) == "medium"
+    assert size(prompt_tokens=33, max_tokens=10) == "medium"
+    assert size(prompt_tokens=800, max_tokens=300) == "long"
+
+
+def test_route_matches() -> None:
+    assert Route(model="text-ada-001").matches(prompt="anything", prompt_tokens=1000, max_tokens=1000)
+    assert Route(model="text-ada-001", pattern="(?i)^explain").matches(prompt="Explain X", prompt_tokens=2, max_tokens=1)
+    assert not Route(model="text-ada-001", pattern="^explain").matches(prompt="Explain X", prompt_tokens=2, max_tokens=1)
+    route_ = Route(model="text-ada-001", max_prompt_tokens=10, max_tokens=50)
+    assert route_.matches(prompt="", prompt_tokens=10, max_tokens=50)
+    assert not route_.matches(prompt="", prompt_tokens=11, max_tokens=50)
+    assert not route_.matches(prompt="", prompt_tokens=10, max_tokens=51)
+
+
+def test_choose_by_size(tmp_path: Path) -> None:
+    router = ModelRouter(routes=[], history=RoutingHistory(path=tmp_path / "routing.json"))
+
+    assert router.choose(prompt="Capital of France?", max_tokens=20) == \
+        Choice(model="text-ada-001", reason="short prompt", size="short")
+    assert router.choose(prompt="Capital of France?", max_tokens=500).model == "text-curie-001"
+    assert router.choose(prompt="word " * 1000, max_tokens=300).model == "text-davinci-003"
+    # Only davinci's context fits
+    assert router.choose(prompt="word " * 2000, max_tokens=300).model == "text-davinci-003"
+
+
+def test_choose_by_routes(tmp_path: Path) -> None:
+    routes = [{"model": "text-davinci-003", "pattern": "(?i)explain"}, {"model": "text-babbage-001", "max_tokens": 50}]
+    router = ModelRouter(routes=routes, history=RoutingHistory(path=tmp_path / "routing.json"))
+
+    assert router.choose(prompt="Explain it", max_tokens=20) == Choice(model="text-davinci-003", reason="route 1")
+    assert router.choose(prompt="Capital of France?", max_tokens=20) == Choice(model="text-babbage-001", reason="route 2")
+    assert router.choose(prompt="Capital of France?", max_tokens=100).model == "text-ada-001"
+
+
+def test_choose_skips_bad_models(tmp_path: Path) -> None:
+    history = _history(tmp_path, {"short": {"text-ada-001": _stats(quality=0.5), "text-babbage-001": _stats(quality=0.7)}})
+    choice = ModelRouter(routes=[], history=history).choose(prompt="Capital of France?", max_tokens=20)
+
+    assert choice == Choice(model="text-curie-001", reason="short prompt, text-ada-001 answered badly", size="short")
+
+
+def test_choose_needs_enough_samples(tmp_path: Path) -> None:
+    history = _history(tmp_path, {"short": {"text-ada-001": _stats(answers=4, quality=0.0)}})
+    assert ModelRouter(routes=[], history=history).choose(prompt="Capital of France?", max_tokens=20).model == "text-ada-001"
+
+
+def test_choose_faster_model(tmp_path: Path) -> None:
+    history = _history(tmp_path, {"short": {"text-ada-001": _stats(seconds=2.0), "text-curie-001": _stats(seconds=0.5),
+                                            "text-davinci-003": _stats(seconds=1.0, quality=0.1)}})
+    choice = ModelRouter(routes=[], history=history).choose(prompt="Capital of France?", max_tokens=20)
+
+    assert choice == Choice(model="text-curie-001", reason="short prompt, faster", size="short")
+
+
+def test_choose_when_no_model_answered_well(tmp_path: Path) -> None:
+    history = _history(tmp_path, {"long": {"text-davinci-003": _stats(quality=0.0)}})
+    assert ModelRouter(routes=[], history=history).choose(prompt="word " * 1000, max_tokens=300) == \
+        Choice(model="text-davinci-003", reason="long prompt, no model answered well", size="long")
+
+
+def test_record(tmp_path: Path) -> None:
+    path = tmp_path / "routing.json"
+    history = RoutingHistory(path=path)
+    choice = Choice(model="text-ada-001", reason="short prompt", size="short")
+    history.record(choice=choice, seconds=1.0, good=True)
+    history.record(choice=choice, seconds=2.0, good=False)
+    history.record(choice=choice, seconds=None, good=False)
+    history.record(choice=Choice(model="text-ada-001", reason="route 1"), seconds=1.0, good=True)
+
+    stats = RoutingHistory(path=path).stats(size="short", model="text-ada-001")
+    assert stats["answers"] == 3
+    assert stats["seconds"] == 1.2
+    assert round(stats["quality"], 2) == 0.64
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_is_good() -> None:
+    assert is_good(["answer", "another"])
+    assert not is_good(["answer", "\n "])
+
+
+def test_record_stream(tmp_path: Path) -> None:
+    history = RoutingHistory(path=tmp_path / "routing.json")
+    choice = Choice(model="text-ada-001", reason="short prompt", size="short")
+    chunks = [{"choices": [{"index": 0, "text": "\n"}]}, {"choices": [{"index": 0, "text": "Paris"}]}]
+
+    assert list(record_stream(history=history, choice=choice, response=iter(chunks), started=0.0)) == chunks
+    assert RoutingHistory(path=tmp_path / "routing.json").stats(size="short", model="text-ada-001")["quality"] == 1.0
+
+
+def test_route_and_route_prompts(tmp_path: Path) -> None:
+    history = RoutingHistory(path=tmp_path / "routing.json")
+    config_helper = ConfigHelper(model="auto", max_tokens=20)
+
+    routed, choice = route(config=config_helper, prompt="Capital of France?", history=history)
+    assert routed.model == choice.model == "text-ada-001"
+
+    prompts = [BatchPrompt(index=0, prompt="Capital of France?", config=config_helper),
+               BatchPrompt(index=1, prompt="Capital of France?", config=ConfigHelper(model="text-curie-001"))]
+    assert [p.config.model for p in route_prompts(prompts=prompts, history=history)] == ["text-ada-001", "text-curie-001"]
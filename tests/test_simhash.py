@@ -0,0 +1,54 @@
+from askai.simhash import bands, distance, max_distance, normalize, probes, similarity, simhash, to_signed, BANDS, BITS
+
+
+def test_normalize() -> None:
+    assert normalize("  What's   the\tANSWER?! ") == "what s the answer"
+    assert normalize("ｆｕｌｌ width") == "full width"
+
+
+def test_simhash_is_stable() -> None:
+    assert simhash("How do I list all files?") == simhash("how do i list all files")
+    assert 0 <= simhash("question") < 2 ** BITS
+    assert simhash("") == simhash("?!")
+
+
+def test_similarity() -> None:
+    assert similarity(0, 0) == 1.0
+    assert similarity(0, 2 ** BITS - 1) == 0.0
+    assert similarity(0b1011, 0b0011) == 1 - 1 / BITS
+    first = simhash("What is the difference between a list and a tuple in Python?")
+    assert similarity(first, simhash("What is the difference between a list and a tuple in python")) == 1.0
+    assert similarity(first, simhash("What is the capital of France?")) < 0.7
+
+
+def test_bands_cover_every_bit() -> None:
+    assert len(bands(2 ** BITS - 1)) == BANDS
+    assert sum(band.bit_length() for band in bands(2 ** BITS - 1)) == BITS
+    assert bands(0) == [0] * BANDS
+
+
+
+def test_probes_find_close_fingerprints() -> None:
+    # Fingerprints that differ in fewer than twice as many bits as there are bands are at most one bit off in a band
+    fingerprint = simhash("question")
+    two_per_band = [bit for band in range(BANDS) for bit in (band * (BITS // BANDS), band * (BITS // BANDS) + 1)]
+    flipped = fingerprint ^ sum(1 << bit for bit in two_per_band[1:])
+    assert distance(fingerprint, flipped) == 2 * BANDS - 1
+    assert any(band in values for band, values in zip(bands(flipped), probes(fingerprint)))
+
+    far = fingerprint ^ sum(1 << bit for bit in two_per_band)
+    assert not any(band in values for band, values in zip(bands(far), probes(fingerprint)))
+
+
+def test_max_distance() -> None:
+    assert max_distance(threshold=1.0) == 0
+    assert max_distance(threshold=0.92) == 2 * BANDS - 1
+    assert max_distance(threshold=1 - 3 / BITS) == 3
+    assert max_distance(threshold=0.0) == BITS
+
+
+def test_distance_of_signed_fingerprints() -> None:
+    for fingerprint in [0, 1, 2 ** 63 - 1, 2 ** 63, 2 ** 64 - 1]:
+        assert -2 ** 63 <= to_signed(fingerprint) < 2 ** 63
+        assert distance(to_signed(fingerprint), fingerprint) == 0
+    assert distance(to_signed(2 ** 64 - 1), 0) == BITS
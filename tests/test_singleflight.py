@@ -0,0 +1,59 @@
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from askai.singleflight import InflightLock
+
+
+def test_acquire_and_release(tmp_path: Path) -> None:
+    lock = InflightLock(key="key", inflight_path=tmp_path)
+    assert lock.acquire()
+    assert lock.locked
+    assert (tmp_path / "key.lock").exists()
+
+    lock.release()
+    assert not lock.locked
+    assert not (tmp_path / "key.lock").exists()
+
+
+def test_times_out_while_held(tmp_path: Path) -> None:
+    with InflightLock(key="key", inflight_path=tmp_path):
+        assert not InflightLock(key="key", inflight_path=tmp_path, timeout=0.05).acquire()
+        assert InflightLock(key="other key", inflight_path=tmp_path, timeout=0.05).acquire()
+
+
+def test_waits_for_holder(tmp_path: Path) -> None:
+    holder = InflightLock(key="key", inflight_path=tmp_path)
+    holder.acquire()
+    order = []
+
+    def wait() -> None:
+        with InflightLock(key="key", inflight_path=tmp_path) as lock:
+            order.append(("waiter", lock.locked))
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    time.sleep(0.1)
+    order.append(("holder", True))
+    holder.release()
+    thread.join()
+
+    # The waiter had locked the file the holder removed, and locked a new one instead
+    assert order == [("holder", True), ("waiter", True)]
+    assert not (tmp_path / "key.lock").exists()
+
+
+def test_lock_of_crashed_process_is_recovered(tmp_path: Path) -> None:
+    crash = (
+        "import os, sys\n"
+        "from pathlib import Path\n"
+        "from askai.singleflight import InflightLock\n"
+        f"assert InflightLock(key='key', inflight_path=Path({str(tmp_path)!r})).acquire()\n"
+        "os._exit(1)\n"
+    )
+    subprocess.run([sys.executable, "-c", crash], cwd=Path(__file__).parents[1], check=False)
+
+    assert (tmp_path / "key.lock").exists()  # Left behind, but no longer locked
+    assert InflightLock(key="key", inflight_path=tmp_path, timeout=0.05).acquire()
@@ -0,0 +1,125 @@
+from typing import Iterator, List
+
+from askai.stopping import StopConditions, stop_response, stop_stream
+
+
+class _Stream:
+    """A streamed response, which remembers how far it was read and whether it was closed"""
+
+    def __init__(self, pieces: List[str], num_answers: int = 1):
+        self.pieces = pieces
+        self.num_answers = num_answers
+        self.sent = 0
+        self.closed = False
+
+    def __iter__(self) -> Iterator[dict]:
+        return self
+
+    def __next__(self) -> dict:
+        if self.closed or self.sent == len(self.pieces):
+            raise StopIteration
+        piece = self.pieces[self.sent]
+        self.sent += 1
+        finish_reason = "length" if self.sent == len(self.pieces) else None
+        return {"choices": [{"index": idx, "text": piece, "finish_reason": finish_reason}
+                            for idx in range(self.num_answers)]}
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def _texts(chunks: List[dict], num_answers: int = 1) -> List[str]:
+    texts = [""] * num_answers
+    for chunk in chunks:
+        for choice in chunk["choices"]:
+            texts[choice["index"]] += choice["text"]
+    return texts
+
+
+def test_stream_stops_at_regex_and_closes() -> None:
+    stream = _Stream(["\n\nThe answer", " is 42.", " DONE and", " more", " text"])
+
+    chunks = list(stop_stream(response=stream, conditions=StopConditions(regex=r"DONE"), num_answers=1))
+
+    assert _texts(chunks) == ["\n\nThe answer is 42. DONE"]
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+    assert stream.sent == 3
+    assert stream.closed
+
+
+def test_regex_match_across_pieces() -> None:
+    stream = _Stream(["The end is ", "ne", "ar. Not", " this"])
+
+    chunks = list(stop_stream(response=stream, conditions=StopConditions(regex=r"near\."), num_answers=1))
+
+    assert _texts(chunks) == ["The end is near."]
+
+
+def test_max_lines_ignores_leading_blank_lines() -> None:
+    stream = _Stream(["\n\n1. Mittens\n2. Whiskers", "\n3. Tom\n", "4. Felix\n5. Garfield"])
+
+    chunks = list(stop_stream(response=stream, conditions=StopConditions(max_lines=2), num_answers=1))
+
+    assert _texts(chunks) == ["\n\n1. Mittens\n2. Whiskers"]
+    assert stream.sent == 2
+
+
+def test_code_block_closes() -> None:
+    stream = _Stream(["Here you go:\n``", "`bash\nls -la\n", "```", "\n\nThis lists", " all files."])
+
+    chunks = list(stop_stream(response=stream, conditions=StopConditions(code_block=True), num_answers=1))
+
+    assert _texts(chunks) == ["Here you go:\n```bash\nls -la\n```"]
+    assert stream.sent == 3
+
+
+def test_code_block_needs_opening_fence_first() -> None:
+    stream = _Stream(["Use ``` for code.\n", "```\ncode\n```\n", "rest"])
+
+    chunks = list(stop_stream(response=stream, conditions=StopConditions(code_block=True), num_answers=1))
+
+    assert _texts(chunks) == ["Use ``` for code.\n```\ncode\n```"]
+
+
+def test_earliest_condition_wins() -> None:
+    stream = _Stream(["one\ntwo\nthree STOP\nfour\n"])
+
+    chunks = list(stop_stream(response=stream, conditions=StopConditions(regex="STOP", max_lines=2), num_answers=1))
+
+    assert _texts(chunks) == ["one\ntwo"]
+
+
+def test_stream_waits_for_every_answer() -> None:
+    stream = _Stream(["a", "b", "STOP", "c"], num_answers=2)
+    watched = stop_stream(response=stream, conditions=StopConditions(regex="STOP"), num_answers=3)
+
+    chunks = list(watched)
+
+    # A third answer never stops, so the stream is read to the end
+    assert _texts(chunks, num_answers=2) == ["abSTOP", "abSTOP"]
+    assert stream.sent == 4
+
+
+def test_stream_without_match_passes_through() -> None:
+    stream = _Stream(["a", "b"])
+
+    chunks = list(stop_stream(response=stream, conditions=StopConditions(regex="STOP"), num_answers=1))
+
+    assert _texts(chunks) == ["ab"]
+    assert chunks[-1]["choices"][0]["finish_reason"] == "length"
+
+
+def test_stop_response() -> None:
+    response = {"choices": [{"index": 0, "text": "one\ntwo\nthree", "finish_reason": "length"},
+                            {"index": 1, "text": "one", "finish_reason": "stop"}]}
+
+    stopped = stop_response(response=response, conditions=StopConditions(max_lines=2))
+
+    assert [choice["text"] for choice in stopped["choices"]] == ["one\ntwo", "one"]
+    assert stopped["choices"][0]["finish_reason"] == "stop"
+
+
+def test_enabled() -> None:
+    assert not StopConditions().enabled
+    assert StopConditions(max_lines=1).enabled
+    assert StopConditions(code_block=True).as_dict() == {"regex": None, "max_lines": None, "code_block": True}
@@ -0,0 +1,98 @@
+import json
+import threading
+from pathlib import Path
+from typing import Iterator
+
+from askai.timings import Timings
+from tests.fake_openai_server import FakeOpenAIServer, fake_openai_server  # noqa: F401
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_phases_add_up_in_order() -> None:
+    clock = FakeClock()
+    timings = Timings(clock=clock)
+    with timings.phase("config"):
+        clock.now += 0.5
+    with timings.phase("key"):
+        clock.now += 0.25
+    with timings.phase("config"):
+        clock.now += 0.5
+
+    record = timings.as_dict()
+    assert list(record["phases"].items()) == [("config", 1.0), ("key", 0.25)]
+    assert record["total"] == 1.25
+
+
+def test_iterate_only_counts_waiting_for_items() -> None:
+    clock = FakeClock()
+    timings = Timings(clock=clock)
+
+    def slow_items() -> Iterator[int]:
+        for item in range(3):
+            clock.now += 1.0
+            yield item
+
+    items = []
+    for item in timings.iterate(slow_items(), name="download"):
+        clock.now += 10.0  # Spent by the consumer
+        items.append(item)
+
+    assert items == [0, 1, 2]
+    assert timings.get("download") == 3.0
+
+
+def test_disabled_measures_nothing() -> None:
+    timings = Timings(enabled=False)
+    timings.startup()
+    with timings.phase("config"):
+        pass
+    with timings.request():
+        pass
+    assert list(timings.iterate([1, 2], name="download")) == [1, 2]
+    assert timings.as_dict()["phases"] == {}
+
+
+def test_startup() -> None:
+    timings = Timings()
+    timings.startup()
+    assert timings.get("imports") > 0.0
+    assert timings.as_dict()["total"] >= timings.get("startup") + timings.get("imports")
+
+
+def test_append_json(tmp_path: Path) -> None:
+    path = tmp_path / "timings.jsonl"
+    for status in ["ok", "cached"]:
+        timings = Timings()
+        timings.info(status=status)
+        with timings.phase("config"):
+            pass
+        timings.append_json(path=path)
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record["status"] for record in records] == ["ok", "cached"]
+    assert all(set(record["phases"]) == {"config"} for record in records)
+
+
+def test_request_only_measures_own_thread(fake_openai_server: FakeOpenAIServer) -> None:
+    import urllib3
+
+    timings = Timings()
+    with timings.request():
+        # A request on another thread, e.g. of another `askai serve` client, while this one is measured
+        other = threading.Thread(target=lambda: urllib3.PoolManager().request("GET", f"{fake_openai_server.url}/models"))
+        other.start()
+        other.join()
+
+    assert timings.get("connect") == 0.0
+    assert timings.get("download") == 0.0
+
+    with timings.request():
+        urllib3.PoolManager().request("GET", f"{fake_openai_server.url}/models")
+    assert timings.get("connect") > 0.0
@@ -0,0 +1,57 @@
+import pytest
+
+from askai.tokenizer import PromptTooLongError, fit, fit_max_tokens, get_tokenizer
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        # Encoded with OpenAI's GPT-2/GPT-3 tokenizer
+        ("Hello world", [15496, 995]),
+        ("hello world", [31373, 995]),
+        ("", []),
+    ]
+)
+def test_encode(text: str, expected: list) -> None:
+    assert get_tokenizer().encode(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "How do I list all files in a directory, including hidden ones?",
+        "I'm sure they've said it's fine, we'll see.",
+        "héllo wörld ½ ² 日本語 🎉",
+        "def  f(x_y):\n\treturn   x_y  \n\n",
+    ]
+)
+def test_encode_decode_roundtrip(text: str) -> None:
+    tokenizer = get_tokenizer()
+    tokens = tokenizer.encode(text)
+    assert tokenizer.decode(tokens) == text
+    assert tokenizer.count(text) == len(tokens)
+    assert len(tokens) <= len(text.encode("utf8"))
+
+
+def test_truncate() -> None:
+    tokenizer = get_tokenizer()
+    assert tokenizer.truncate("Hello world, how are you?", max_tokens=2) == "Hello world"
+
+
+def test_fit_max_tokens() -> None:
+    assert fit_max_tokens(prompt_tokens=100, model="text-ada-001", max_tokens=300) == 300
+    assert fit_max_tokens(prompt_tokens=2000, model="text-ada-001", max_tokens=300) == 48
+    with pytest.raises(PromptTooLongError):
+        fit_max_tokens(prompt_tokens=2048, model="text-ada-001", max_tokens=300)
+
+
+def test_fit() -> None:
+    long_prompt = " word" * 3000  # 3000 tokens
+    assert fit(prompt="Hello world", model="text-ada-001", max_tokens=300) == ("Hello world", 300)
+    assert fit(prompt=long_prompt, model="text-davinci-003", max_tokens=2000) == (long_prompt, 1000)
+    with pytest.raises(PromptTooLongError):
+        fit(prompt=long_prompt, model="text-ada-001", max_tokens=300)
+
+    truncated, max_tokens = fit(prompt=long_prompt, model="text-ada-001", max_tokens=300, truncate=True)
+    assert get_tokenizer().count(truncated) == 2048 - 300
+    assert max_tokens == 300